@@ -1,6 +1,5 @@
 import random
 import logging
-from hashlib import sha256
 from collections import Counter
 
 import src.communication.messages_pb2 as msg
@@ -11,23 +10,11 @@ from src.communication.messages import NewMessage
 from src.agent.request_cache import RequestState
 from src.chain.block import Block, UNKNOWN_SEQ
 from src.chain.index import BlockIndex
+from src.chain.transfer_hash import blocks_to_hash
 from src.agent.exchange_storage import ExchangeStorage
 from src.agent.request_cache import RequestCache, RequestState
 
 
-def blocks_to_hash(blocks):
-    """Takes a list of blocks and creates a hash that includes the hashes of all blocks contained.
-
-    Arguments:
-        blocks {[Block]} -- List of blocks.
-    """
-
-    list_of_hashes = sorted([block.hash for block in blocks])
-    hash_string = ''.join(list_of_hashes)
-    if hash_string == '':
-        return ''
-    return sha256(hash_string).digest()
-
 def verify_chain_no_missing_blocks(chain, expected_length):
     """Verifies the correctness of a chain received by another agent. First check is only if the
     chain is complete. 
@@ -65,7 +52,7 @@ class ProtectAdvancedAgent(ProtectSimpleAgent):
     def replay_verification(self, original_chain, exchanges):
 
         subject = self.get_partner_by_public_key(PublicKey.from_bin(original_chain[0].public_key))
-        replacements = self.replace_rules.get(subject.public_key.as_readable(), [])
+        replacements = self.get_replacement_overlay(subject.public_key.as_readable())
         should_ignore = []
         current_chain = []
         partner_chains = {}
@@ -114,13 +101,89 @@ class ProtectAdvancedAgent(ProtectSimpleAgent):
                             exchange_blocks = self.database.index_with_replacements(exchange, replacements)
                             transfer_hash = partner_block.get_relevant_exchange()
 
-                            if not transfer_hash == blocks_to_hash(exchange_blocks).encode('hex'):
+                            version = partner_block.get_hash_version()
+                            if not transfer_hash == blocks_to_hash(exchange_blocks, version).encode('hex'):
                                 for block1, block2 in self.double_spends:
                                     if block1 in exchange_blocks or block2 in exchange_blocks:
                                         should_ignore.append(block1.public_key)
 
         return True
 
+    def protect_chain_blocks_verified(self, sender, chain, blocks, exchanges, valid):
+        """Continues the handling of a PROTECT_CHAIN_BLOCKS message once the signatures of the
+        received blocks and the hash links of the received chain are verified. Besides the checks
+        of the ProtectSimpleAgent the exchanges of the responder are replayed before the block
+        proposal is sent.
+
+        Arguments:
+            sender {Address} -- Address string of the agent.
+            chain {[Block]} -- Chain of the responder.
+            blocks {[Block]} -- Blocks sent by the responder.
+            exchanges {ExchangeStorage} -- Exchanges of the responder.
+            valid {bool} -- Outcome of the integrity verification.
+        """
+
+        if self.request_cache.get(sender) is None:
+            return
+
+        if not valid:
+            self.logger.warning("Blocks of %s have invalid signatures or hash links", sender)
+            self.cancel_interaction(sender)
+            return
+
+        self.request_cache.get(sender).chain = chain
+        self.request_cache.get(sender).blocks = blocks
+        self.request_cache.get(sender).exchanges = exchanges
+
+        for block_hash, index in exchanges.exchanges.iteritems():
+            self.exchange_storage.exchanges[block_hash] = index
+
+        error_chain = self.database.add_blocks(chain)
+        error_blocks = self.database.add_blocks(blocks)
+
+        if error_chain:
+            self.found_double_spend(error_chain[0][0], chain)
+        for existing, _ in error_chain + error_blocks:
+            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(existing.public_key).as_readable())
+
+        self.request_cache.get(sender).transfer_down = self.transfer_hash(blocks, sender)
+        self.request_cache.get(sender).chain_length_received = len(chain)
+
+        verification = self.verify_chain(chain, len(chain)) and self.verify_exchange(chain, exchanges)
+        transfer_down = BlockIndex.from_blocks(blocks)
+
+        if verification is True:
+            verification = self.replay_verification(chain,
+                                                    exchanges)
+
+            if verification:
+                partner = next((a for a in self.agents if a.address == sender), None)
+                payload = self.exchange_payload(sender, {
+                    'transfer_up': self.request_cache.get(sender).transfer_up.encode('hex'),
+                    'transfer_down': self.transfer_hash(blocks, sender).encode('hex'),
+                    'chain_up': self.request_cache.get(sender).chain_length_sent,
+                    'chain_down': self.request_cache.get(sender).chain_length_received})
+                new_block = self.block_factory.create_new(partner.public_key, payload=payload)
+                self.com.send(partner.address, NewMessage(msg.PROTECT_BLOCK_PROPOSAL,
+                                                          new_block.as_message()))
+                self.exchange_storage.add_exchange(new_block, transfer_down)
+                self.request_cache.get(sender).update_state(RequestState.PROTECT_BLOCK)
+            else:
+                self.logger.warning("Verification of %s's exchanges failed", sender)
+                self.request_cache.remove(sender)
+                self.ignore_list.append(sender)
+                self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
+        elif verification is False:
+            self.logger.warning("Verification of %s's exchanges failed", sender)
+            self.request_cache.remove(sender)
+            self.ignore_list.append(sender)
+            self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
+        elif type(verification) is str:
+            self.logger.warning("Verification of hash was not correct, finding double spend")
+            self.request_cache.get(sender).update_state(
+                RequestState.PROTECT_EXCHANGE_CLARIFICATION_INITIATOR)
+            self.request_exchange(sender, verification)
+
 
 def configure_advanced(agent):
 
@@ -147,11 +210,10 @@ def configure_advanced(agent):
 
         error_blocks = self.database.add_blocks(blocks)
 
-        if error_blocks:
-            self.database.add_blocks(blocks, False)
-            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(error_blocks.public_key).as_readable())
+        for existing, _ in error_blocks:
+            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(existing.public_key).as_readable())
         
-        self.request_cache.get(sender).transfer_up = blocks_to_hash(blocks)
+        self.request_cache.get(sender).transfer_up = self.transfer_hash(blocks, sender)
         self.request_cache.get(sender).transfer_up_index = BlockIndex.from_blocks(blocks)
 
         verification = self.verify_exchange(self.request_cache.get(sender).chain,
@@ -161,8 +223,8 @@ def configure_advanced(agent):
             verification = self.replay_verification(self.request_cache.get(sender).chain,
                                                 self.request_cache.get(sender).exchanges)
             if verification:
-                own_chain = self.database.get_chain(self.public_key)
-                own_index = BlockIndex.from_blocks(self.database.get_all_blocks())
+                own_chain = self.get_own_chain()
+                own_index = self.get_own_block_index()
                 partner_index = self.request_cache.get(sender).index
                 index = (own_index - partner_index)
                 index.remove(PublicKey.from_bin(self.request_cache.get(sender).chain[0].public_key))
@@ -173,13 +235,14 @@ def configure_advanced(agent):
                     self.request_cache.get(sender).transfer_up_index = BlockIndex()
                 else:
                     sub_database = self.database.index(index)
-                    self.request_cache.get(sender).transfer_down = blocks_to_hash(sub_database).encode('hex')
+                    self.request_cache.get(sender).transfer_down = self.transfer_hash(sub_database, sender).encode('hex')
                     self.request_cache.get(sender).transfer_down_index = index
                 self.request_cache.get(sender).chain_length_sent = len(own_chain)
 
                 db = msg.ChainAndBlocks(chain=[block.as_message() for block in own_chain],
                                         blocks=[block.as_message() for block in sub_database],
-                                        exchange=self.exchange_storage.as_message())
+                                        exchange=self.exchange_storage.as_message(
+                                            self.get_index_encoding(sender)))
                 self.com.send(sender, NewMessage(msg.PROTECT_CHAIN_BLOCKS, db))
                 self.request_cache.get(sender).update_state(RequestState.PROTECT_EXCHANGE)
 
@@ -198,87 +261,4 @@ def configure_advanced(agent):
             self.logger.warning("Verification of hash was not correct, finding double spend")
             self.request_cache.get(sender).update_state(
                 RequestState.PROTECT_EXCHANGE_CLARIFICATION_RESPONDER)
-            self.com.send(sender,
-                          NewMessage(msg.PROTECT_EXCHANGE_REQUEST,
-                                     msg.ExchangeRequest(exchange_hash=verification)))
-
-    @agent.add_handler(msg.PROTECT_CHAIN_BLOCKS)
-    def proect_chain_blocks(self, sender, body):
-        """Handles a received PROTECT_CHAIN_BLOCKS message. A PROTECT exchange is ongoing, the
-        initiator received chain, blocks and exchange data from the responder. The
-        initiator should check whether the responder is completely trustworthy and shares all his
-        data. The chain and exchange data is verified and only if the data checks out the next step
-        is done. That is the block proposal, all data is exchanged and both agents trust each other,
-        an exchange block can be created which includes the hashes of both sets of exchanged blocks.
-        If the verification fails the responder is added to the ignore list and a msg.PROTECT_REJECT
-        is sent.
-
-        Arguments:
-            sender {Address} -- Address string of the agent.
-            body {msg.ChainAndBlocks} -- Body of the incoming message.
-        """
-
-        if self.request_cache.get(sender) is None:
-            self.logger.error('No open reqest found for this agent')
-            return
-
-        chain = [Block.from_message(block) for block in body.chain]
-        blocks = [Block.from_message(block) for block in body.blocks]
-        exchanges = ExchangeStorage.from_message(body.exchange)
-        self.request_cache.get(sender).chain = chain
-        self.request_cache.get(sender).blocks = blocks
-        self.request_cache.get(sender).exchanges = exchanges
-
-        for block_hash, index in exchanges.exchanges.iteritems():
-            self.exchange_storage.exchanges[block_hash] = index
-
-        error_chain = self.database.add_blocks(chain)
-        error_blocks = self.database.add_blocks(blocks)
-
-        if error_chain or error_blocks:
-            self.database.add_blocks(chain, False)
-            self.database.add_blocks(blocks, False)
-            if error_chain:
-                self.found_double_spend(error_chain, chain)
-            elif error_blocks:
-                self.found_double_spend(error_chain, chain)
-            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(error_chain.public_key).as_readable())
-
-        self.request_cache.get(sender).transfer_down = blocks_to_hash(blocks)
-        self.request_cache.get(sender).chain_length_received = len(chain)
-
-        verification = self.verify_chain(chain, len(chain)) and self.verify_exchange(chain, exchanges)
-        transfer_down = BlockIndex.from_blocks(blocks)
-
-        if verification is True:
-            verification = self.replay_verification(chain,
-                                                    exchanges)
-
-            if verification:
-                partner = next((a for a in self.agents if a.address == sender), None)
-                payload = {'transfer_up': self.request_cache.get(sender).transfer_up.encode('hex'),
-                        'transfer_down': blocks_to_hash(blocks).encode('hex'),
-                        'chain_up': self.request_cache.get(sender).chain_length_sent,
-                        'chain_down': self.request_cache.get(sender).chain_length_received}
-                new_block = self.block_factory.create_new(partner.public_key, payload=payload)
-                self.com.send(partner.address, NewMessage(msg.PROTECT_BLOCK_PROPOSAL,
-                                                          new_block.as_message()))
-                self.exchange_storage.add_exchange(new_block, transfer_down)
-                self.request_cache.get(sender).update_state(RequestState.PROTECT_BLOCK)
-            else:
-                self.logger.warning("Verification of %s's exchanges failed", sender)
-                self.request_cache.remove(sender)
-                self.ignore_list.append(sender)
-                self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
-        elif verification is False:
-            self.logger.warning("Verification of %s's exchanges failed", sender)
-            self.request_cache.remove(sender)
-            self.ignore_list.append(sender)
-            self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
-        elif type(verification) is str:
-            self.logger.warning("Verification of hash was not correct, finding double spend")
-            self.request_cache.get(sender).update_state(
-                RequestState.PROTECT_EXCHANGE_CLARIFICATION_INITIATOR)
-            self.com.send(sender,
-                          NewMessage(msg.PROTECT_EXCHANGE_REQUEST,
-                                     msg.ExchangeRequest(exchange_hash=verification)))
\ No newline at end of file
+            self.request_exchange(sender, verification)
@@ -1,6 +1,5 @@
 import random
 import logging
-from hashlib import sha256
 
 import src.communication.messages_pb2 as msg
 
@@ -13,20 +12,6 @@ from src.agent.request_cache import RequestCache, RequestState
 from src.public_key import PublicKey
 
 
-def blocks_to_hash(blocks):
-    """Takes a list of blocks and creates a hash that includes the hashes of all blocks contained.
-
-    Arguments:
-        blocks {[Block]} -- List of blocks.
-    """
-
-    list_of_hashes = sorted([block.hash for block in blocks])
-    hash_string = ''.join(list_of_hashes)
-    if hash_string == '':
-        return ''
-    return sha256(hash_string).digest()
-
-
 class BadChainProtectAgent(ProtectSimpleAgent):
 
     _type = "Transaction hiding"
@@ -45,7 +30,7 @@ class BadChainProtectAgent(ProtectSimpleAgent):
         if partner.address in self.ignore_list:
             return
 
-        chain = self.database.get_chain(self.public_key)
+        chain = self.get_own_chain()
 
         # manipulate the chain by removing an item
         if len(chain) > 25:
@@ -85,11 +70,10 @@ def configure_badchain(agent):
 
         error_blocks = self.database.add_blocks(blocks)
 
-        if error_blocks:
-            self.database.add_blocks(blocks, False)
-            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(error_blocks.public_key).as_readable())
+        for existing, _ in error_blocks:
+            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(existing.public_key).as_readable())
         
-        self.request_cache.get(sender).transfer_up = blocks_to_hash(blocks)
+        self.request_cache.get(sender).transfer_up = self.transfer_hash(blocks, sender)
         self.request_cache.get(sender).transfer_up_index = BlockIndex.from_blocks(blocks)
 
         verification = self.verify_exchange(self.request_cache.get(sender).chain,
@@ -97,13 +81,13 @@ def configure_badchain(agent):
         self.logger.error("Verification returned %s", verification)
 
         if verification is True:
-            own_chain = self.database.get_chain(self.public_key)
+            own_chain = self.get_own_chain()
 
             # manipulate the chain by removing an item
             if len(own_chain) > 25:
                 own_chain.pop(4)
 
-            own_index = BlockIndex.from_blocks(self.database.get_all_blocks())
+            own_index = self.get_own_block_index()
             partner_index = self.request_cache.get(sender).index
             index = (own_index - partner_index)
             index.remove(PublicKey.from_bin(self.request_cache.get(sender).chain[0].public_key))
@@ -114,13 +98,14 @@ def configure_badchain(agent):
                 self.request_cache.get(sender).transfer_down_index = BlockIndex()
             else:
                 sub_database = self.database.index(index)
-                self.request_cache.get(sender).transfer_down = blocks_to_hash(sub_database).encode('hex')
+                self.request_cache.get(sender).transfer_down = self.transfer_hash(sub_database, sender).encode('hex')
                 self.request_cache.get(sender).transfer_down_index = index
             self.request_cache.get(sender).chain_length_sent = len(own_chain)
 
             db = msg.ChainAndBlocks(chain=[block.as_message() for block in own_chain],
                                     blocks=[block.as_message() for block in sub_database],
-                                    exchange=self.exchange_storage.as_message())
+                                    exchange=self.exchange_storage.as_message(
+                                        self.get_index_encoding(sender)))
             self.com.send(sender, NewMessage(msg.PROTECT_CHAIN_BLOCKS, db))
             self.request_cache.get(sender).update_state(RequestState.PROTECT_EXCHANGE)
 
@@ -135,6 +120,4 @@ def configure_badchain(agent):
             self.logger.warning("Verification of hash was not correct, finding double spend")
             self.request_cache.get(sender).update_state(
                 RequestState.PROTECT_EXCHANGE_CLARIFICATION_RESPONDER)
-            self.com.send(sender,
-                          NewMessage(msg.PROTECT_EXCHANGE_REQUEST,
-                                     msg.ExchangeRequest(exchange_hash=verification)))
\ No newline at end of file
+            self.request_exchange(sender, verification)
\ No newline at end of file
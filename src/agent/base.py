@@ -15,13 +15,25 @@ from src.pyipv8.ipv8.messaging.serialization import Serializer
 from src.pyipv8.ipv8.attestation.trustchain.block import TrustChainBlock
 from src.public_key import PublicKey
 from src.database import Database
+from src.log_database import LogDatabase
 from src.chain.block import Block
 from src.chain.block_factory import BlockFactory
-from src.chain.index import BlockIndex
+from src.chain.block_cache import DEFAULT_CACHE_SIZE
 from src.agent.info import AgentInfo
 from src.communication.interface import CommunicationInterface
 from src.communication.messages import Message, MessageTypes, NewMessage
 
+DATABASE_BACKENDS = {
+    'sqlite': Database,
+    'log': LogDatabase
+}
+
+EXCHANGE_HASHES = {
+    'sorted': msg.SORTED_HASH,
+    'multiset': msg.MULTISET_HASH,
+    'merkle': msg.MERKLE_HASH
+}
+
 
 class BaseAgent(object):
     """The BaseAgent class defines the default honest behavior for agents and includes all the
@@ -83,8 +95,19 @@ class BaseAgent(object):
         self.options['startup_time'] = options['startup_time']
         self.options['data'] = options['data_directory']
         self.options['discovery_server'] = 'tcp://localhost:' + str(options['discovery_port'])
+        self.options['exchange_sketch_cells'] = options.get('exchange_sketch_cells', 0)
+        self.options['verification_workers'] = options.get('verification_workers', 0)
+        self.options['exchange_hash'] = EXCHANGE_HASHES[options.get('exchange_hash', 'sorted')]
+
+        self.options['in_memory_database'] = options.get('in_memory_database', False)
 
-        self.database = Database('', 'db_' + str(port))
+        self.options['database_backend'] = options.get('database_backend', 'sqlite')
+        self.options['block_cache_size'] = options.get('block_cache_size', DEFAULT_CACHE_SIZE)
+
+        database_cls = DATABASE_BACKENDS[self.options['database_backend']]
+        self.database = database_cls(u':memory:' if self.options['in_memory_database'] else '',
+                                     'db_' + str(port),
+                                     self.options['block_cache_size'])
         self.block_factory = BlockFactory(self.database, self.public_key, self.private_key)
         self.block_factory.create_genesis()
         self.logger = logging.getLogger(name=str(port))
@@ -122,6 +145,19 @@ class BaseAgent(object):
         """
         return next((a for a in self.agents if a.address == address), None)
 
+    def get_index_encoding(self, address):
+        """Returns the BlockIndex encoding that the agent with the given address understands. Agents
+        that did not announce an encoding only understand plain sequence numbers.
+
+        Arguments:
+            address {string} -- Address string of the agent
+
+        Returns:
+            msg.IndexEncoding -- Encoding to use for indexes sent to that agent
+        """
+        partner = self.get_partner_by_address(address)
+        return partner.index_encoding if partner is not None else msg.SEQUENCE_NUMBERS
+
     def request_interaction(self, partner=None):
         """Sends a block proposal to another known agent.
 
@@ -173,10 +209,10 @@ class BaseAgent(object):
     def write_data(self):
         """Serializes the state(database) of the agent in order to be analyzed afterwards. The files
         are stored in the `data/` directory and are called after the human readable form of the
-        agents public key.
+        agents public key. An in-memory database is written to its sqlite file first.
         """
 
-        blocks = self.database._getall('', ())
+        self.database.snapshot()
         if hasattr(self, "ignore_list"):
             self.logger.info("Ignore list: [%s]", ",".join((a for a in set(self.ignore_list))))
             self.logger.info("Replace rules: %s", self.replace_rules)
@@ -188,10 +224,12 @@ class BaseAgent(object):
                 if exc.errno != errno.EEXIST:
                     raise
 
+        # Serialized repeated fields can be concatenated, so the msg.Database is written one block at
+        # a time instead of building the complete message in memory.
         with open(os.path.join(self.options['data'], self.public_key.as_readable() + '.dat'), 'wb') as f:
-            database = msg.Database(info=self.get_info().as_message(),
-                                    blocks=[block.as_message() for block in blocks])
-            f.write(database.SerializeToString())
+            f.write(msg.Database(info=self.get_info().as_message()).SerializeToString())
+            for block in self.database.iter_all_blocks():
+                f.write(msg.Database(blocks=[block.as_message()]).SerializePartialToString())
 
     def handle(self, message, msg_wrapper=None):
         """Selects a handler for the type of the received message. If no handler is
@@ -272,7 +310,7 @@ def configure_base(agent):
         self.com.send(sender, NewMessage(msg.BLOCK_AGREEMENT, new_block.as_message()))
 
         self.logger.debug("Block database: %s",
-                          BlockIndex.from_blocks(self.database.get_all_blocks()))
+                          self.database.get_block_index())
 
     @agent.add_handler(msg.BLOCK_AGREEMENT)
     def block_confirm(self, sender, body):
@@ -288,4 +326,4 @@ def configure_base(agent):
 
         self.database.add(block)
         self.logger.debug("Block database: %s",
-                          BlockIndex.from_blocks(self.database.get_all_blocks()))
+                          self.database.get_block_index())
@@ -29,7 +29,7 @@ class DoubleSpendAgent(ProtectSimpleAgent):
         if partner.address in self.ignore_list:
             return
 
-        chain = self.database.get_chain(self.public_key)
+        chain = self.get_own_chain()
 
         # manipulate the chain by removing an item
         if len(chain) > 3 and not self.has_doublespent:
@@ -40,7 +40,7 @@ class DoubleSpendAgent(ProtectSimpleAgent):
                 self.database.delete(self.public_key, block.sequence_number, 1)
                 self.has_doublespent = True
 
-        chain = self.database.get_chain(self.public_key)
+        chain = self.get_own_chain()
 
         db = msg.Database(info=self.get_info().as_message(),
                           blocks=[block.as_message() for block in chain])
@@ -0,0 +1,171 @@
+from hashlib import sha256
+from struct import unpack
+
+import src.communication.messages_pb2 as msg
+
+HASH_FUNCTIONS = 3
+
+
+def cell_positions(key, cells):
+    """Calculates the cells a key is stored in and the checksum used to recognize pure cells. The
+    table is divided into one part per hash function, so the positions of a key are always distinct.
+
+    Arguments:
+        key {string} -- Binary key, an exchange block hash
+        cells {int} -- Number of cells of the sketch
+    """
+
+    digest = unpack('>%dI' % (HASH_FUNCTIONS + 1), sha256(key).digest()[:4 * (HASH_FUNCTIONS + 1)])
+    part = cells // HASH_FUNCTIONS
+    positions = [i * part + digest[i] % part for i in range(HASH_FUNCTIONS)]
+
+    return positions, digest[HASH_FUNCTIONS]
+
+
+class ExchangeSketch(object):
+    """The ExchangeSketch is an invertible Bloom lookup table over the block hashes of an exchange
+    storage. Two agents can subtract their sketches and decode the hashes that only one of them
+    knows, with a sketch size that depends on the size of the difference instead of the number of
+    exchanges. Decoding fails if the difference is too large for the number of cells, in which case
+    the complete exchange storage has to be sent.
+    """
+
+    def __init__(self, cells, key_length=32):
+        """Creates an empty sketch.
+
+        Arguments:
+            cells {int} -- Number of cells, rounded down to a multiple of the number of hash functions
+
+        Keyword Arguments:
+            key_length {int} -- Length of the binary keys in bytes (default: {32})
+        """
+
+        self.cells = max(cells // HASH_FUNCTIONS, 1) * HASH_FUNCTIONS
+        self.key_length = key_length
+        self.counts = [0] * self.cells
+        self.key_sums = [0] * self.cells
+        self.hash_sums = [0] * self.cells
+
+    @classmethod
+    def from_keys(cls, keys, cells):
+        """Creates a sketch containing all given keys.
+
+        Arguments:
+            keys {[string]} -- Binary keys of equal length
+            cells {int} -- Number of cells of the sketch
+        """
+
+        sketch = cls(cells)
+        for key in keys:
+            sketch.insert(key)
+
+        return sketch
+
+    def _toggle(self, key, count):
+        positions, checksum = cell_positions(key, self.cells)
+        value = long(key.encode('hex'), 16)
+        for position in positions:
+            self.counts[position] += count
+            self.key_sums[position] ^= value
+            self.hash_sums[position] ^= checksum
+
+    def insert(self, key):
+        """Adds a key to the sketch.
+
+        Arguments:
+            key {string} -- Binary key
+        """
+        self._toggle(key, 1)
+
+    def delete(self, key):
+        """Removes a key from the sketch.
+
+        Arguments:
+            key {string} -- Binary key
+        """
+        self._toggle(key, -1)
+
+    def _key(self, position):
+        return ('%0*x' % (2 * self.key_length, self.key_sums[position])).decode('hex')
+
+    def __sub__(self, other):
+        """Returns the sketch of the symmetric difference, keys of self are counted positive and
+        keys of other negative.
+
+        Arguments:
+            other {ExchangeSketch} -- Sketch with the same number of cells
+        """
+
+        if self.cells != other.cells:
+            raise Exception("Sketches with a different number of cells cannot be subtracted")
+
+        difference = ExchangeSketch(self.cells, self.key_length)
+        difference.counts = [a - b for a, b in zip(self.counts, other.counts)]
+        difference.key_sums = [a ^ b for a, b in zip(self.key_sums, other.key_sums)]
+        difference.hash_sums = [a ^ b for a, b in zip(self.hash_sums, other.hash_sums)]
+
+        return difference
+
+    def decode(self):
+        """Peels the keys off a difference sketch. The sketch is emptied in the process.
+
+        Returns:
+            (bool, [string], [string]) -- Whether decoding succeeded, the keys only in the positive
+                sketch and the keys only in the negative sketch
+        """
+
+        own_keys = []
+        other_keys = []
+        pure = [i for i in range(self.cells) if self.counts[i] in (1, -1)]
+        while pure:
+            position = pure.pop()
+            if self.counts[position] not in (1, -1):
+                continue
+            if self.key_sums[position] >= 1 << (8 * self.key_length):
+                continue
+            key = self._key(position)
+            positions, checksum = cell_positions(key, self.cells)
+            if self.hash_sums[position] != checksum or position not in positions:
+                continue
+
+            if self.counts[position] == 1:
+                own_keys.append(key)
+                self._toggle(key, -1)
+            else:
+                other_keys.append(key)
+                self._toggle(key, 1)
+            pure.extend(i for i in positions if self.counts[i] in (1, -1))
+
+        decoded = not any(self.counts) and not any(self.key_sums) and not any(self.hash_sums)
+        return decoded, own_keys, other_keys
+
+    def as_message(self):
+        """Creates an ExchangeSketch message from the sketch.
+        """
+        return msg.ExchangeSketch(counts=self.counts,
+                                  key_sums=[self._key(i) for i in range(self.cells)],
+                                  hash_sums=self.hash_sums)
+
+    @classmethod
+    def from_message(cls, message):
+        """Creates a sketch from an ExchangeSketch message.
+
+        Arguments:
+            message {msg.ExchangeSketch} -- Message describing the sketch
+        """
+
+        sketch = cls(len(message.counts))
+        if sketch.cells != len(message.counts) or len(message.key_sums) != sketch.cells or \
+                len(message.hash_sums) != sketch.cells or \
+                any(len(key_sum) > sketch.key_length for key_sum in message.key_sums):
+            raise Exception("Malformed exchange sketch")
+
+        sketch.counts = list(message.counts)
+        sketch.key_sums = [long(key_sum.encode('hex'), 16) if key_sum else 0
+                           for key_sum in message.key_sums]
+        sketch.hash_sums = list(message.hash_sums)
+
+        return sketch
+
+    def __len__(self):
+        return self.cells
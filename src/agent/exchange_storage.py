@@ -32,11 +32,15 @@ class ExchangeStorage(object):
         for block_hash, index in storage.exchanges.iteritems():
             self.exchanges[block_hash] = index
 
-    def as_message(self):
+    def as_message(self, encoding=msg.SEQUENCE_NUMBERS):
         """Returns an exchange message.
+
+        Keyword Arguments:
+            encoding {msg.IndexEncoding} -- Encoding of the indexes understood by the receiving
+                agent (default: {msg.SEQUENCE_NUMBERS})
         """
         ex_entries = [msg.ExchangeIndexEntry(block_hash=key,
-                                             index=value.as_message())
+                                             index=value.as_message(encoding))
                       for key, value in self.exchanges.iteritems()]
         return msg.ExchangeIndex(entries=ex_entries)
 
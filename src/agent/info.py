@@ -7,17 +7,29 @@ class AgentInfo(object):
     agent it describes.
     """
 
-    def __init__(self, public_key, address, agent_type):
+    def __init__(self, public_key, address, agent_type, index_encoding=msg.RANGES,
+                 exchange_sketch=False, exchange_hash=msg.SORTED_HASH):
         """Creates a new AgentInfo object by passing the neccessary information.
 
         Arguments:
             public_key {PublicKey} -- Public key of the agent this object describes
             address {Address} -- Address of the receiving socket of the agent this object describes
+
+        Keyword Arguments:
+            index_encoding {msg.IndexEncoding} -- Most compact BlockIndex encoding the agent
+                understands (default: {msg.RANGES})
+            exchange_sketch {bool} -- Whether the agent can answer exchange sketch requests
+                (default: {False})
+            exchange_hash {msg.ExchangeHash} -- Version of the transfer hashes the agent prefers for
+                its exchanges (default: {msg.SORTED_HASH})
         """
 
         self.public_key = public_key
         self.address = address
         self.type = agent_type
+        self.index_encoding = index_encoding
+        self.exchange_sketch = exchange_sketch
+        self.exchange_hash = exchange_hash
 
     def as_message(self):
         """Creates a protobuf message representation of the given AddInfo instance.
@@ -30,12 +42,16 @@ class AgentInfo(object):
         message.public_key = self.public_key.as_hex()
         message.address = self.address
         message.type = self.type
+        message.index_encoding = self.index_encoding
+        message.exchange_sketch = self.exchange_sketch
+        message.exchange_hash = self.exchange_hash
 
         return message
 
     @classmethod
     def from_agent(cls, agent):
-        """Creates a new AgentInfo object which describes the passed agent.
+        """Creates a new AgentInfo object which describes the passed agent. The agent supports
+        exchange sketches if it handles PROTECT_SKETCH_REQUEST messages.
 
         Arguments:
             agent {BaseAgent} -- Agent which shall be described by the return AddInfo object.
@@ -44,7 +60,9 @@ class AgentInfo(object):
             AddInfo -- AddInfo object describing agent.
         """
 
-        return cls(agent.public_key, agent.com.address, agent._type)
+        return cls(agent.public_key, agent.com.address, agent._type,
+                   exchange_sketch=msg.PROTECT_SKETCH_REQUEST in agent._message_handlers,
+                   exchange_hash=agent.options.get('exchange_hash', msg.SORTED_HASH))
 
     @classmethod
     def from_message(cls, message):
@@ -56,7 +74,8 @@ class AgentInfo(object):
         Returns:
             AddInfo -- AddInfo object describing the same agent as the message.
         """
-        return cls(PublicKey.from_hex(message.public_key), message.address, message.type)
+        return cls(PublicKey.from_hex(message.public_key), message.address, message.type,
+                   message.index_encoding, message.exchange_sketch, message.exchange_hash)
 
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
@@ -1,7 +1,7 @@
 import src.communication.messages_pb2 as msg
 
 
-from src.agent.simple_protect import ProtectSimpleAgent, blocks_to_hash
+from src.agent.simple_protect import ProtectSimpleAgent
 from src.agent.base import configure_base
 from src.chain.block import Block
 from src.communication.messages import NewMessage
@@ -31,13 +31,14 @@ def configure_noverification(agent):
     def block_confirm(self, sender, body):
         block = Block.from_message(body)
         index = BlockIndex.from_blocks([block])
-        payload = {'transfer_down': blocks_to_hash([block]).encode('hex')}
+        payload = self.exchange_payload(
+            sender, {'transfer_down': self.transfer_hash([block], sender).encode('hex')})
         exchange_block = self.block_factory.create_new(self.get_info().public_key, payload)
         self.exchange_storage.add_exchange(exchange_block, index)
 
         self.database.add(block)
         self.logger.debug("Block database: %s",
-                          BlockIndex.from_blocks(self.database.get_all_blocks()))
+                          self.database.get_block_index())
 
         self.logger.info("Exchange and transaction with %s completed", sender)
 
@@ -47,7 +48,8 @@ def configure_noverification(agent):
     def block_proposal(self, sender, body):
         block = Block.from_message(body)
         index = BlockIndex.from_blocks([block])
-        payload = {'transfer_down': blocks_to_hash([block]).encode('hex')}
+        payload = self.exchange_payload(
+            sender, {'transfer_down': self.transfer_hash([block], sender).encode('hex')})
         exchange_block = self.block_factory.create_new(self.get_info().public_key, payload)
         self.exchange_storage.add_exchange(exchange_block, index)
 
@@ -57,6 +59,6 @@ def configure_noverification(agent):
         self.com.send(sender, NewMessage(msg.BLOCK_AGREEMENT, new_block.as_message()))
 
         self.logger.debug("Block database: %s",
-                          BlockIndex.from_blocks(self.database.get_all_blocks()))
+                          self.database.get_block_index())
 
         self.request_cache.remove(sender)
\ No newline at end of file
@@ -53,7 +53,7 @@ class ProtectAgent(BaseAgent):
         if verification:
             partner_index = BlockIndex.from_chain(chain)
             own_index = BlockIndex.from_chain(self.database.get_chain(self.public_key))
-            db = (partner_index - own_index).as_message()
+            db = (partner_index - own_index).as_message(self.get_index_encoding(sender))
             self.com.send(sender, NewMessage(msg.PROTECT_BLOCKS_REQUEST, db))
             self.open_requests[sender] = {'index': partner_index}
             self.logger.debug("[1] Requesting BLOCKS from %s", sender)
@@ -6,6 +6,7 @@ class Request(object):
 
         self.address = address
         self.state = initial_state
+        self.merkle_dispute = None
 
     def __repr__(self):
         return "Request with %s" % self.address
@@ -32,6 +33,7 @@ class ResponderRequest(Request):
         self.chain = chain
         self.index = None
         self.transfer_down = None
+        self.sketch_hashes = []
 
 
 class RequestState:
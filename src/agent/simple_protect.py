@@ -1,8 +1,6 @@
 import random
 import logging
 import copy
-from collections import Counter
-from hashlib import sha256
 
 from src.pyipv8.ipv8.attestation.trustchain.block import UNKNOWN_SEQ
 
@@ -14,24 +12,17 @@ from src.public_key import PublicKey
 from src.communication.messaging import MessageHandler, MessageHandlerType
 from src.communication.messages import NewMessage
 from src.chain.index import BlockIndex
+from src.chain.block_batch import BlockBatch, TRANSACTION, EXCHANGE
+from src.chain.verification import ChainVerifier
+from src.chain.replacement_overlay import ReplacementOverlay
+from src.chain.transfer_hash import MultisetHash, blocks_to_hash
+from src.chain.merkle_tree import MerkleTree, MerkleDispute
+from src.database import index_to_runs
 from src.agent.exchange_storage import ExchangeStorage
+from src.agent.exchange_sketch import ExchangeSketch
 from src.agent.request_cache import RequestCache, RequestState
 
 
-def blocks_to_hash(blocks):
-    """Takes a list of blocks and creates a hash that includes the hashes of all blocks contained.
-
-    Arguments:
-        blocks {[Block]} -- List of blocks.
-    """
-
-    list_of_hashes = sorted([block.hash for block in blocks])
-    hash_string = ''.join(list_of_hashes)
-    if hash_string == '':
-        return ''
-    return sha256(hash_string).digest()
-
-
 class ProtectSimpleAgent(BaseAgent):
     """The ProtectSimple agent only stores on the chain the hashes of the data that was exchanged
     instead of all blocks. This way an agent still cannot lie but the chains remain as small as
@@ -43,13 +34,25 @@ class ProtectSimpleAgent(BaseAgent):
 
     def __init__(self, *args, **kwargs):
         super(ProtectSimpleAgent, self).__init__(*args, **kwargs)
+        self.chain_verifier = ChainVerifier()
         self.ignore_list = []
         self.replace_rules = {}
+        self.replacement_overlays = {}
         self.knows_about_double_spender = {}
         self.double_spends = []
         self.request_cache = RequestCache()
+        self.own_chain = []
         self.exchange_storage = ExchangeStorage()
 
+    def setup(self, options, port):
+        """Loads the configuration of the agent and creates the verifier for received blocks, which
+        uses the configured number of worker threads and caches as many outcomes as the database
+        caches blocks.
+        """
+        super(ProtectSimpleAgent, self).setup(options, port)
+        self.chain_verifier = ChainVerifier(self.options['verification_workers'],
+                                            self.options['block_cache_size'])
+
     def request_protect(self, partner=None):
         """Requests a new PROTECT interaction with a partner. If no partner is passed as argument
         a random partner will be chosen from the known agents. The initiator sends his complete
@@ -70,7 +73,7 @@ class ProtectSimpleAgent(BaseAgent):
         if partner.address in self.ignore_list:
             return
 
-        chain = self.database.get_chain(self.public_key)
+        chain = self.get_own_chain()
 
         db = msg.Database(info=self.get_info().as_message(),
                           blocks=[block.as_message() for block in chain])
@@ -97,10 +100,10 @@ class ProtectSimpleAgent(BaseAgent):
             bool -- True of the chain is complete, False otherwise
         """
         # check missing blocks
-        seq = [block.sequence_number for block in chain]
-        if not Counter(seq[:expected_length]) == Counter(range(1, expected_length+1)):
+        batch = BlockBatch.of(chain)
+        if not batch.is_complete(expected_length):
             self.logger.error("Chain %s does not have the correct sequence, expected 1 to %d",
-                              seq, expected_length)
+                              list(batch.sequence_numbers), expected_length)
             return False
 
         return True
@@ -113,14 +116,45 @@ class ProtectSimpleAgent(BaseAgent):
             chain {[Block]} -- Chain to be verified
         """
 
-        max_seq = self.database.get_latest(chain[0].public_key)
-        if max_seq and chain[-1].sequence_number < max_seq.sequence_number:
+        head = self.database.get_chain_metadata(chain[0].public_key)
+        if head is not None and head.sequence_number > chain[-1].sequence_number:
             self.logger.error("Agent shared less blocks than we already know %s",
                               PublicKey.from_bin(chain[0].public_key).as_readable())
             return False
         
         return True
 
+    def find_unpaired_transaction(self, chain):
+        """Pairs each transaction on the chain with an earlier, unpaired exchange with the same
+        partner in a single pass in sequence order, counting the unpaired exchanges per partner.
+
+        Arguments:
+            chain {[Block]} -- Chain to be verified
+
+        Returns:
+            Block -- The first transaction without an earlier exchange, None if all are paired
+        """
+
+        batch = BlockBatch.of(chain)
+        positions = xrange(len(batch))
+        if any(batch.sequence_numbers[k] > batch.sequence_numbers[k + 1]
+               for k in xrange(len(batch) - 1)):
+            positions = sorted(positions, key=batch.sequence_numbers.__getitem__)
+
+        unpaired = {}
+        for i in positions:
+            kind = batch.kinds[i]
+            if kind & TRANSACTION:
+                partner = (batch.public_key_ids[i], batch.link_key_ids[i])
+                if not unpaired.get(partner):
+                    return batch[i]
+                unpaired[partner] -= 1
+            if kind & EXCHANGE:
+                partner = (batch.public_key_ids[i], batch.link_key_ids[i])
+                unpaired[partner] = unpaired.get(partner, 0) + 1
+
+        return None
+
     def verify_chain_tx_ex_pairs(self, chain):
         """Verifies that each transaction on the chain can be paired with a previous exchange. The
         current mechanism forces agents to have one exchange for each transaction. Not performing
@@ -130,21 +164,12 @@ class ProtectSimpleAgent(BaseAgent):
             chain {[Block]} -- Chain to be verified
         """
         # check for enough exchanges: with protect each transaction should have an exchange before
-        transactions = [block for block in chain if block.is_transaction()]
-        exchanges = [block for block in chain if block.is_exchange()]
-        for tx in transactions:
-            exchange = next((block for block in exchanges
-                            if block.public_key == tx.public_key and
-                            block.link_public_key == tx.link_public_key and
-                            block.sequence_number < tx.sequence_number), None)
-
-            if exchange is None:
-                self.logger.error("Not enough exchange blocks found")
-                self.logger.error("Tx block %s has no matching exchange", tx)
-                self.logger.error("Chain [%s]", ",".join(("%s" % block for block in chain)))
-                return False
-
-            exchanges.remove(exchange)
+        transaction = self.find_unpaired_transaction(chain)
+        if transaction is not None:
+            self.logger.error("Not enough exchange blocks found")
+            self.logger.error("Tx block %s has no matching exchange", transaction)
+            self.logger.error("Chain [%s]", ",".join(("%s" % block for block in chain)))
+            return False
 
         return True
 
@@ -155,21 +180,21 @@ class ProtectSimpleAgent(BaseAgent):
         Arguments:
             chain {[Block]} -- Chain to be verified
         """
-        for block in chain:
-            own_block = self.database.get(block.public_key, block.sequence_number)
-            if own_block and own_block.hash != block.hash:
-                self.found_double_spend(own_block, chain)
-                return False
-            
+        own_blocks = self.database.get_conflicting_blocks(
+            [(block.public_key, block.sequence_number, block.hash) for block in chain])
+        if own_blocks:
+            self.found_double_spend(own_blocks[0], chain)
+            return False
+
         return True
 
     def verify_blocks_for_double_spend(self, blocks):
 
-        for block in blocks:
-            own_block = self.database.get(block.public_key, block.sequence_number)
-            if own_block and own_block.hash != block.hash:
-                return own_block
-        
+        own_blocks = self.database.get_conflicting_blocks(
+            [(block.public_key, block.sequence_number, block.hash) for block in blocks])
+        if own_blocks:
+            return own_blocks[0]
+
         return False
 
     def verify_chain(self, chain, expected_length):
@@ -177,13 +202,14 @@ class ProtectSimpleAgent(BaseAgent):
         chain is complete. 
 
         Arguments:
-            chain {[Block]} -- Agent's complete chain
+            chain {[Block]} -- Agent's complete chain, converted to a BlockBatch once for all checks
 
         Returns:
             bool -- Outcome of the verification, True means correct, False means fraud
         """
 
         result = True
+        chain = BlockBatch.of(chain)
 
         result = result and self.verify_chain_for_double_spend(chain, expected_length)
         result = result and self.verify_chain_no_missing_blocks(chain, expected_length)
@@ -206,15 +232,12 @@ class ProtectSimpleAgent(BaseAgent):
                 if len(ex) == 0:
                     exchange_blocks.append([])
                 else:
-                    blocks = self.database.index(ex)
+                    blocks = self.database.index_with_replacements(
+                        ex, self.get_replacement_overlay(partner_key))
 
                     if len(blocks) == 0:
                         self.logger.error('Blocks not found in database')
 
-                    for block1, block2 in self.replace_rules.get(partner_key, []):
-                        if block1 in blocks:
-                            blocks = [b if b.hash != block1.hash else block2 for b in blocks]
-
                     exchange_blocks.append(blocks)
             else:
                 self.logger.error('Block is not mentioned in exchanges.')
@@ -222,12 +245,41 @@ class ProtectSimpleAgent(BaseAgent):
 
         return exchange_blocks
 
-    def known_double_spend(self, transfer_hash, blocks, public_key):
+    def add_replace_rule(self, public_key, block1, block2):
+        """Records that the agent with the given public key saw block2 instead of block1. The
+        replacement overlay of that agent is rebuilt on its next use.
+
+        Arguments:
+            public_key {string} -- Readable public key of the agent
+            block1 {Block} -- Block to be replaced
+            block2 {Block} -- Block to fill in
+        """
+        self.replace_rules.setdefault(public_key, []).append((block1, block2))
+        self.replacement_overlays.pop(public_key, None)
+
+    def get_replacement_overlay(self, public_key):
+        """Returns the overlay of the replacement rules for the agent with the given public key.
+
+        Arguments:
+            public_key {string} -- Readable public key of the agent
+        """
+        overlay = self.replacement_overlays.get(public_key)
+        if overlay is None:
+            overlay = ReplacementOverlay(self.replace_rules.get(public_key, []))
+            self.replacement_overlays[public_key] = overlay
+        return overlay
+
+    def known_double_spend(self, transfer_hash, blocks, public_key, version=msg.SORTED_HASH):
+        multiset_hash = MultisetHash.of(blocks) if version == msg.MULTISET_HASH else None
         for block1, block2 in self.double_spends:
             if block1 in blocks:
-                replaced_blocks = [b if b.hash != block1.hash else block2 for b in blocks]
-                if transfer_hash == blocks_to_hash(replaced_blocks).encode('hex'):
-                    self.replace_rules.setdefault(public_key, []).append((block1, block2))
+                if multiset_hash is not None:
+                    replaced_hash = multiset_hash.replace(block1.hash, block2.hash).digest()
+                else:
+                    replaced_hash = blocks_to_hash(
+                        [b if b.hash != block1.hash else block2 for b in blocks], version)
+                if transfer_hash == replaced_hash.encode('hex'):
+                    self.add_replace_rule(public_key, block1, block2)
                     
                     self.logger.info("Solved by known double spend")
                     self.logger.info("Added replacement rule for agent %s",public_key)
@@ -262,8 +314,9 @@ class ProtectSimpleAgent(BaseAgent):
         # compare hashes
         for block, blocks in zip(exchange_summary_blocks, exchange_blocks):
             transfer_hash = block.get_relevant_exchange()
-            if transfer_hash != blocks_to_hash(blocks).encode('hex'):
-                if self.known_double_spend(transfer_hash, blocks, partner_key):
+            version = block.get_hash_version()
+            if transfer_hash != blocks_to_hash(blocks, version).encode('hex'):
+                if self.known_double_spend(transfer_hash, blocks, partner_key, version):
                     self.logger.error("Known double spend")
                     continue
                 else:
@@ -275,22 +328,168 @@ class ProtectSimpleAgent(BaseAgent):
 
         return True
 
+    def get_exchange_hash_version(self, address):
+        """Returns the version of the transfer hashes of exchanges with the agent with the given
+        address. The multiset hash is only used if both agents selected it.
+
+        Arguments:
+            address {string} -- Address string of the agent
+
+        Returns:
+            msg.ExchangeHash -- Version of the transfer hashes
+        """
+        partner = self.get_partner_by_address(address)
+        version = self.options.get('exchange_hash', msg.SORTED_HASH)
+        if partner is None or partner.exchange_hash != version:
+            return msg.SORTED_HASH
+        return version
+
+    def transfer_hash(self, blocks, address):
+        """Hashes the blocks exchanged with the agent with the given address.
+
+        Arguments:
+            blocks {[Block]} -- Exchanged blocks
+            address {string} -- Address string of the agent
+        """
+        return blocks_to_hash(blocks, self.get_exchange_hash_version(address))
+
+    def exchange_payload(self, address, payload):
+        """Records the version of the transfer hashes in the payload of an exchange block with the
+        agent with the given address, payloads of the sorted hash are left as they are.
+
+        Arguments:
+            address {string} -- Address string of the agent
+            payload {dict} -- Payload of the exchange block
+        """
+        version = self.get_exchange_hash_version(address)
+        if version != msg.SORTED_HASH:
+            payload['hash_version'] = version
+        return payload
+
+    def request_exchange(self, sender, exchange_hash):
+        """Requests the blocks of an exchange of the agent with the given address whose hash did not
+        match. If the exchange block commits to a Merkle root and the own version of the exchange is
+        complete, a MerkleDispute is started to locate the differing blocks first, otherwise all
+        blocks of the exchange are requested. The exchange block is taken from the received chain
+        of the agent, which the responder has not stored yet, or else from the database.
+
+        Arguments:
+            sender {Address} -- Address string of the agent
+            exchange_hash {string} -- Hash of the exchange block
+        """
+
+        request = self.request_cache.get(sender)
+        request.merkle_dispute = None
+        exchange_block = next((block for block in request.chain if block.hash == exchange_hash),
+                              None)
+        if exchange_block is None:
+            exchange_block = self.database.get_by_hash(exchange_hash)
+        exchange = request.exchanges.exchanges.get(exchange_hash)
+
+        if exchange_block is not None and exchange is not None and \
+                exchange_block.get_hash_version() == msg.MERKLE_HASH:
+            partner_key = PublicKey.from_bin(request.chain[0].public_key).as_readable()
+            blocks = self.database.index_with_replacements(
+                exchange, self.get_replacement_overlay(partner_key))
+            if len(blocks) == sum(end - begin + 1 for _, begin, end in index_to_runs(exchange)):
+                request.merkle_dispute = MerkleDispute(
+                    MerkleTree.of(blocks), exchange_block.get_relevant_exchange().decode('hex'))
+
+        message = msg.ExchangeRequest(exchange_hash=exchange_hash)
+        if request.merkle_dispute is not None:
+            self.add_dispute_request(message, request.merkle_dispute)
+        self.com.send(sender, NewMessage(msg.PROTECT_EXCHANGE_REQUEST, message))
+
+    def add_dispute_request(self, message, dispute):
+        """Asks for the differing blocks once a dispute is resolved, for the hashes of the next
+        nodes otherwise.
+
+        Arguments:
+            message {msg.ExchangeRequest} -- Request to be sent
+            dispute {MerkleDispute} -- Ongoing dispute about the exchange
+        """
+        if dispute.is_resolved():
+            message.leaves.extend(dispute.differing_positions())
+        else:
+            message.nodes.extend(dispute.requested_nodes())
+
+    def use_exchange_sketch(self, address):
+        """Returns whether the exchanges of the agent with the given address should be reconciled
+        with an exchange sketch instead of receiving the complete exchange storage. This requires a
+        configured sketch size and a partner that announced support for sketches.
+
+        Arguments:
+            address {string} -- Address string of the agent
+        """
+        partner = self.get_partner_by_address(address)
+        return self.options.get('exchange_sketch_cells', 0) > 0 and partner is not None and \
+            partner.exchange_sketch
+
+    def request_missing_blocks(self, sender, exchanges):
+        """Calculates the index of the initiator of a PROTECT exchange from his chain and exchanges
+        and requests the blocks that the agent is not aware of with a msg.PROTECT_BLOCKS_REQUEST.
+
+        Arguments:
+            sender {Address} -- Address string of the initiator
+            exchanges {ExchangeStorage} -- Exchanges of the initiator
+        """
+
+        self.exchange_storage.add_exchange_storage(exchanges)
+        partner_index = self.get_index_from_exchanges_and_chain(exchanges,
+                                                                self.request_cache.get(sender).chain)
+
+        db = (partner_index - self.get_own_block_index())
+        db.remove(self.get_info().public_key)
+
+        self.com.send(sender, NewMessage(msg.PROTECT_BLOCKS_REQUEST,
+                                         db.as_message(self.get_index_encoding(sender))))
+
+        self.request_cache.get(sender).index = partner_index
+        self.request_cache.get(sender).exchanges = exchanges
+        self.request_cache.get(sender).update_state(RequestState.PROTECT_INDEX)
+
+    def get_own_chain(self):
+        """Returns the chain of this agent. The chain is kept between calls, only the blocks added
+        since the previous call are read from the database. If the kept chain does not match the
+        database anymore, e.g. because blocks were deleted, the complete chain is read again.
+
+        Returns:
+            {[Block]} -- Copy of the chain, ordered by sequence number.
+        """
+
+        metadata = self.database.get_chain_metadata(self.public_key.as_bin())
+        if self.own_chain and metadata is not None and metadata.length == len(self.own_chain) \
+                and metadata.hash == self.own_chain[-1].hash:
+            return list(self.own_chain)
+
+        if self.own_chain:
+            head = self.own_chain[-1]
+            stored_head = self.database.get(head.public_key, head.sequence_number)
+            if stored_head is None or stored_head.hash != head.hash or \
+                    self.database.count_stored(head.public_key, head.sequence_number) != \
+                    len(self.own_chain):
+                self.own_chain = []
+
+        if self.own_chain:
+            self.own_chain.extend(self.database.iter_chain(self.public_key,
+                                                           self.own_chain[-1].sequence_number + 1))
+        else:
+            self.own_chain = self.database.get_chain(self.public_key)
+
+        return list(self.own_chain)
+
     def get_own_block_index(self):
         """Returns block index of this agents database.
         """
-        return BlockIndex.from_blocks(self.database.get_all_blocks())
+        return self.database.get_block_index()
 
     def get_index_from_exchanges_and_chain(self, exchanges, chain):
         """Calculates the block index from the chain and exchanges of another agent.
         """
-        partner_index = BlockIndex()
-
         for block_hash, index in exchanges.exchanges.iteritems():
             self.exchange_storage.exchanges[block_hash] = index
-            partner_index = partner_index + index
-        partner_index += BlockIndex.from_blocks(chain)
 
-        return partner_index
+        return BlockIndex.union_all(exchanges.exchanges.values() + [BlockIndex.from_blocks(chain)])
 
     def found_double_spend(self, own_version, blocks):
         block_match = [b for b in blocks if b.public_key == own_version.public_key and
@@ -301,6 +500,104 @@ class ProtectSimpleAgent(BaseAgent):
         self.logger.info("Will ignore %s because of double spend",
                             partner.public_key.as_readable())
 
+    def protect_chain_verified(self, sender, chain, valid):
+        """Continues the handling of a PROTECT_CHAIN message once the signatures and hash links of
+        the received chain are verified.
+
+        Arguments:
+            sender {Address} -- Address string of the agent.
+            chain {[Block]} -- Chain of the initiator.
+            valid {bool} -- Outcome of the integrity verification.
+        """
+
+        if self.request_cache.get(sender) is None:
+            return
+
+        if not valid:
+            self.logger.warning("Chain of %s has invalid signatures or hash links", sender)
+        verification = valid and self.verify_chain(chain, len(chain))
+
+        if verification and self.use_exchange_sketch(sender):
+            hashes = self.exchange_storage.exchanges.keys()
+            sketch = ExchangeSketch.from_keys(hashes, self.options['exchange_sketch_cells'])
+            self.request_cache.get(sender).sketch_hashes = hashes
+            self.com.send(sender, NewMessage(msg.PROTECT_SKETCH_REQUEST, sketch.as_message()))
+        elif verification:
+            self.com.send(sender, NewMessage(msg.PROTECT_INDEX_REQUEST, msg.Empty()))
+        else:
+            self.logger.warning("Chain verification failed for sender %s", sender)
+            self.ignore_list.append(sender)
+            self.request_cache.remove(sender)
+            self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
+
+    def protect_chain_blocks_verified(self, sender, chain, blocks, exchanges, valid):
+        """Continues the handling of a PROTECT_CHAIN_BLOCKS message once the signatures of the
+        received blocks and the hash links of the received chain are verified. Blocks are only
+        stored if the verification succeeded.
+
+        Arguments:
+            sender {Address} -- Address string of the agent.
+            chain {[Block]} -- Chain of the responder.
+            blocks {[Block]} -- Blocks sent by the responder.
+            exchanges {ExchangeStorage} -- Exchanges of the responder.
+            valid {bool} -- Outcome of the integrity verification.
+        """
+
+        if self.request_cache.get(sender) is None:
+            return
+
+        if not valid:
+            self.logger.warning("Blocks of %s have invalid signatures or hash links", sender)
+            self.cancel_interaction(sender)
+            return
+
+        self.request_cache.get(sender).chain = chain
+        self.request_cache.get(sender).blocks = blocks
+        self.request_cache.get(sender).exchanges = exchanges
+
+        self.exchange_storage.add_exchange_storage(exchanges)
+
+        if len(blocks) == 0:
+            self.cancel_interaction(sender)
+            return
+
+        error_chain = self.database.add_blocks(chain)
+        error_blocks = self.database.add_blocks(blocks)
+
+        if error_chain:
+            self.found_double_spend(error_chain[0][0], chain)
+        for existing, _ in error_chain + error_blocks:
+            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(existing.public_key).as_readable())
+
+        self.request_cache.get(sender).transfer_down = self.transfer_hash(blocks, sender)
+        self.request_cache.get(sender).chain_length_received = len(chain)
+
+        verification = self.verify_chain(chain, len(chain)) and self.verify_exchange(chain, exchanges)
+        transfer_down = BlockIndex.from_blocks(blocks)
+
+        if verification is True:
+            partner = next((a for a in self.agents if a.address == sender), None)
+            payload = self.exchange_payload(sender, {
+                'transfer_up': self.request_cache.get(sender).transfer_up.encode('hex'),
+                'transfer_down': self.transfer_hash(blocks, sender).encode('hex'),
+                'chain_up': self.request_cache.get(sender).chain_length_sent,
+                'chain_down': self.request_cache.get(sender).chain_length_received})
+            new_block = self.block_factory.create_new(partner.public_key, payload=payload)
+            self.com.send(partner.address, NewMessage(msg.PROTECT_BLOCK_PROPOSAL,
+                                                      new_block.as_message()))
+            self.exchange_storage.add_exchange(new_block, transfer_down)
+            self.request_cache.get(sender).update_state(RequestState.PROTECT_BLOCK)
+        elif verification is False:
+            self.logger.warning("Verification of %s's exchanges failed", sender)
+            self.request_cache.remove(sender)
+            self.ignore_list.append(sender)
+            self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
+        elif type(verification) is str:
+            self.logger.warning("Verification of hash was not correct, finding double spend")
+            self.request_cache.get(sender).update_state(
+                RequestState.PROTECT_EXCHANGE_CLARIFICATION_INITIATOR)
+            self.request_exchange(sender, verification)
+
     def configure_message_handlers(self):
         super(ProtectSimpleAgent, self).configure_message_handlers()
         configure_protect(self)
@@ -342,15 +639,8 @@ def configure_protect(agent):
 
         self.request_cache.new(sender, RequestState.PROTECT_INIT, chain)
         self.request_cache.get(sender).chain_length_received = len(chain)
-        verification = self.verify_chain(chain, len(chain))
-
-        if verification:
-            self.com.send(sender, NewMessage(msg.PROTECT_INDEX_REQUEST, msg.Empty()))
-        else:
-            self.logger.warning("Chain verification failed for sender %s", sender)
-            self.ignore_list.append(sender)
-            self.request_cache.remove(sender)
-            self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
+        self.chain_verifier.verify(chain, [],
+                                   lambda valid: self.protect_chain_verified(sender, chain, valid))
 
     @agent.add_handler(msg.PROTECT_INDEX_REQUEST)
     def protect_index_request(self, sender, body):
@@ -369,7 +659,7 @@ def configure_protect(agent):
             self.logger.error('No open reqest found for this agent')
             return
 
-        message = self.exchange_storage.as_message()
+        message = self.exchange_storage.as_message(self.get_index_encoding(sender))
         self.request_cache.get(sender).update_state(RequestState.PROTECT_INDEX)
         self.com.send(sender, NewMessage(msg.PROTECT_INDEX_REPLY, message))
 
@@ -389,20 +679,77 @@ def configure_protect(agent):
             self.logger.error('No open reqest found for this agent')
             return
 
-        exchanges = ExchangeStorage.from_message(body)
+        self.request_missing_blocks(sender, ExchangeStorage.from_message(body))
 
-        self.exchange_storage.add_exchange_storage(exchanges)
-        partner_index = self.get_index_from_exchanges_and_chain(exchanges,
-                                                                self.request_cache.get(sender).chain)
+    @agent.add_handler(msg.PROTECT_SKETCH_REQUEST)
+    def protect_sketch_request(self, sender, body):
+        """Handles a received PROTECT_SKETCH_REQUEST. This replaces the PROTECT_INDEX_REQUEST if the
+        responder reconciles exchanges with a sketch. The agent subtracts the sketch of its own
+        exchange storage from the received sketch and decodes the difference. If decoding succeeds
+        only the exchanges unknown to the responder and the hashes of exchanges the agent does not
+        have are sent in a msg.PROTECT_SKETCH_REPLY message, otherwise all exchanges are sent. This
+        includes malformed sketches and sketches with more cells than the agent is configured for.
 
-        db = (partner_index - self.get_own_block_index())
-        db.remove(self.get_info().public_key)
+        Arguments:
+            sender {Address} -- Address string of the agent
+            body {msg.ExchangeSketch} -- Body of the incoming message.
+        """
 
-        self.com.send(sender, NewMessage(msg.PROTECT_BLOCKS_REQUEST, db.as_message()))
+        if self.request_cache.get(sender) is None:
+            self.logger.error('No open reqest found for this agent')
+            return
 
-        self.request_cache.get(sender).index = partner_index
-        self.request_cache.get(sender).exchanges = exchanges
+        decoded = False
+        if len(body.counts) <= self.options.get('exchange_sketch_cells', 0):
+            try:
+                partner_sketch = ExchangeSketch.from_message(body)
+                own_sketch = ExchangeSketch.from_keys(self.exchange_storage.exchanges.keys(),
+                                                      len(partner_sketch))
+                decoded, own_hashes, unknown_hashes = (own_sketch - partner_sketch).decode()
+            except Exception as e:
+                self.logger.warning("Malformed exchange sketch of %s: %s", sender, e)
+            decoded = decoded and all(block_hash in self.exchange_storage.exchanges
+                                      for block_hash in own_hashes)
+
+        encoding = self.get_index_encoding(sender)
+        if decoded:
+            exchange = ExchangeStorage({block_hash: self.exchange_storage.exchanges[block_hash]
+                                        for block_hash in own_hashes}).as_message(encoding)
+        else:
+            self.logger.info("Could not decode exchange sketch of %s, sending all exchanges", sender)
+            exchange = self.exchange_storage.as_message(encoding)
+            unknown_hashes = []
+
+        message = msg.ExchangeSketchReply(decoded=decoded, exchange=exchange,
+                                          unknown_hashes=unknown_hashes)
         self.request_cache.get(sender).update_state(RequestState.PROTECT_INDEX)
+        self.com.send(sender, NewMessage(msg.PROTECT_SKETCH_REPLY, message))
+
+    @agent.add_handler(msg.PROTECT_SKETCH_REPLY)
+    def protect_sketch_reply(self, sender, body):
+        """Handles a received PROTECT_SKETCH_REPLY. The exchanges of the initiator are restored from
+        the exchanges of the own storage that were in the sketch, without those the initiator does
+        not know, plus the exchanges the initiator sent. From there on the reply is handled like a
+        PROTECT_INDEX_REPLY.
+
+        Arguments:
+            sender {Address} -- Address string of the agent
+            body {msg.ExchangeSketchReply} -- Body of the incoming message.
+        """
+
+        request = self.request_cache.get(sender)
+        if request is None:
+            self.logger.error('No open reqest found for this agent')
+            return
+
+        exchanges = ExchangeStorage.from_message(body.exchange)
+        if body.decoded:
+            unknown_hashes = set(body.unknown_hashes)
+            for block_hash in request.sketch_hashes:
+                if block_hash not in unknown_hashes and block_hash not in exchanges.exchanges:
+                    exchanges.exchanges[block_hash] = self.exchange_storage.exchanges[block_hash]
+
+        self.request_missing_blocks(sender, exchanges)
 
     @agent.add_handler(msg.PROTECT_BLOCKS_REQUEST)
     def protect_blocks_request(self, sender, body):
@@ -433,7 +780,7 @@ def configure_protect(agent):
             return
         else:
             blocks = self.database.index(index)
-            self.request_cache.get(sender).transfer_up = blocks_to_hash(blocks)
+            self.request_cache.get(sender).transfer_up = self.transfer_hash(blocks, sender)
             self.request_cache.get(sender).transfer_up_index = index
 
         db = msg.Database(info=self.get_info().as_message(),
@@ -464,11 +811,10 @@ def configure_protect(agent):
 
         error_blocks = self.database.add_blocks(blocks)
 
-        if error_blocks:
-            self.database.add_blocks(blocks, False)
-            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(error_blocks.public_key).as_readable())
+        for existing, _ in error_blocks:
+            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(existing.public_key).as_readable())
         
-        self.request_cache.get(sender).transfer_up = blocks_to_hash(blocks)
+        self.request_cache.get(sender).transfer_up = self.transfer_hash(blocks, sender)
         self.request_cache.get(sender).transfer_up_index = BlockIndex.from_blocks(blocks)
 
         verification = self.verify_exchange(self.request_cache.get(sender).chain,
@@ -476,8 +822,8 @@ def configure_protect(agent):
         self.logger.error("Verification returned %s", verification)
 
         if verification is True:
-            own_chain = self.database.get_chain(self.public_key)
-            own_index = BlockIndex.from_blocks(self.database.get_all_blocks())
+            own_chain = self.get_own_chain()
+            own_index = self.get_own_block_index()
             partner_index = self.request_cache.get(sender).index
             index = (own_index - partner_index)
             index.remove(PublicKey.from_bin(self.request_cache.get(sender).chain[0].public_key))
@@ -488,13 +834,14 @@ def configure_protect(agent):
                 self.request_cache.get(sender).transfer_down_index = BlockIndex()
             else:
                 sub_database = self.database.index(index)
-                self.request_cache.get(sender).transfer_down = blocks_to_hash(sub_database).encode('hex')
+                self.request_cache.get(sender).transfer_down = self.transfer_hash(sub_database, sender).encode('hex')
                 self.request_cache.get(sender).transfer_down_index = index
             self.request_cache.get(sender).chain_length_sent = len(own_chain)
 
             db = msg.ChainAndBlocks(chain=[block.as_message() for block in own_chain],
                                     blocks=[block.as_message() for block in sub_database],
-                                    exchange=self.exchange_storage.as_message())
+                                    exchange=self.exchange_storage.as_message(
+                                        self.get_index_encoding(sender)))
             self.com.send(sender, NewMessage(msg.PROTECT_CHAIN_BLOCKS, db))
             self.request_cache.get(sender).update_state(RequestState.PROTECT_EXCHANGE)
 
@@ -509,9 +856,7 @@ def configure_protect(agent):
             self.logger.warning("Verification of hash was not correct, finding double spend")
             self.request_cache.get(sender).update_state(
                 RequestState.PROTECT_EXCHANGE_CLARIFICATION_RESPONDER)
-            self.com.send(sender,
-                          NewMessage(msg.PROTECT_EXCHANGE_REQUEST,
-                                     msg.ExchangeRequest(exchange_hash=verification)))
+            self.request_exchange(sender, verification)
 
     @agent.add_handler(msg.PROTECT_CHAIN_BLOCKS)
     def proect_chain_blocks(self, sender, body):
@@ -536,54 +881,9 @@ def configure_protect(agent):
         chain = [Block.from_message(block) for block in body.chain]
         blocks = [Block.from_message(block) for block in body.blocks]
         exchanges = ExchangeStorage.from_message(body.exchange)
-        self.request_cache.get(sender).chain = chain
-        self.request_cache.get(sender).blocks = blocks
-        self.request_cache.get(sender).exchanges = exchanges
-
-        self.exchange_storage.add_exchange_storage(exchanges)
-
-        if len(blocks) == 0:
-            self.cancel_interaction(sender)
-            return
-
-        error_chain = self.database.add_blocks(chain)
-        error_blocks = self.database.add_blocks(blocks)
-
-        if error_chain or error_blocks:
-            self.database.add_blocks(chain, False)
-            self.database.add_blocks(blocks, False)
-            self.found_double_spend(error_chain, chain)
-            self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(error_chain.public_key).as_readable())
-
-        self.request_cache.get(sender).transfer_down = blocks_to_hash(blocks)
-        self.request_cache.get(sender).chain_length_received = len(chain)
-
-        verification = self.verify_chain(chain, len(chain)) and self.verify_exchange(chain, exchanges)
-        transfer_down = BlockIndex.from_blocks(blocks)
-
-        if verification is True:
-            partner = next((a for a in self.agents if a.address == sender), None)
-            payload = {'transfer_up': self.request_cache.get(sender).transfer_up.encode('hex'),
-                       'transfer_down': blocks_to_hash(blocks).encode('hex'),
-                       'chain_up': self.request_cache.get(sender).chain_length_sent,
-                       'chain_down': self.request_cache.get(sender).chain_length_received}
-            new_block = self.block_factory.create_new(partner.public_key, payload=payload)
-            self.com.send(partner.address, NewMessage(msg.PROTECT_BLOCK_PROPOSAL,
-                                                      new_block.as_message()))
-            self.exchange_storage.add_exchange(new_block, transfer_down)
-            self.request_cache.get(sender).update_state(RequestState.PROTECT_BLOCK)
-        elif verification is False:
-            self.logger.warning("Verification of %s's exchanges failed", sender)
-            self.request_cache.remove(sender)
-            self.ignore_list.append(sender)
-            self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
-        elif type(verification) is str:
-            self.logger.warning("Verification of hash was not correct, finding double spend")
-            self.request_cache.get(sender).update_state(
-                RequestState.PROTECT_EXCHANGE_CLARIFICATION_INITIATOR)
-            self.com.send(sender,
-                          NewMessage(msg.PROTECT_EXCHANGE_REQUEST,
-                                     msg.ExchangeRequest(exchange_hash=verification)))
+        self.chain_verifier.verify(
+            chain, blocks,
+            lambda valid: self.protect_chain_blocks_verified(sender, chain, blocks, exchanges, valid))
 
     @agent.add_handler(msg.PROTECT_BLOCK_PROPOSAL)
     def protect_block_proposal(self, sender, body):
@@ -615,7 +915,8 @@ def configure_protect(agent):
             self.logger.warning("Detected double spend of agent %s", PublicKey.from_bin(error.public_key).as_readable())
 
         index = BlockIndex.from_blocks([block])
-        payload = {'transfer_down': blocks_to_hash([block]).encode('hex')}
+        payload = self.exchange_payload(
+            sender, {'transfer_down': self.transfer_hash([block], sender).encode('hex')})
         exchange_block = self.block_factory.create_new(self.get_info().public_key, payload)
         self.exchange_storage.add_exchange(exchange_block, index)
 
@@ -650,7 +951,8 @@ def configure_protect(agent):
 
         block = Block.from_message(body)
         index = BlockIndex.from_blocks([block])
-        payload = {'transfer_down': blocks_to_hash([block]).encode('hex')}
+        payload = self.exchange_payload(
+            sender, {'transfer_down': self.transfer_hash([block], sender).encode('hex')})
         exchange_block = self.block_factory.create_new(self.get_info().public_key, payload)
         self.exchange_storage.add_exchange(exchange_block, index)
 
@@ -667,7 +969,8 @@ def configure_protect(agent):
 
         block = Block.from_message(body)
         index = BlockIndex.from_blocks([block])
-        payload = {'transfer_down': blocks_to_hash([block]).encode('hex')}
+        payload = self.exchange_payload(
+            sender, {'transfer_down': self.transfer_hash([block], sender).encode('hex')})
         exchange_block = self.block_factory.create_new(self.get_info().public_key, payload)
         self.exchange_storage.add_exchange(exchange_block, index)
 
@@ -690,7 +993,8 @@ def configure_protect(agent):
 
         block = Block.from_message(body)
         index = BlockIndex.from_blocks([block])
-        payload = {'transfer_down': blocks_to_hash([block]).encode('hex')}
+        payload = self.exchange_payload(
+            sender, {'transfer_down': self.transfer_hash([block], sender).encode('hex')})
         exchange_block = self.block_factory.create_new(self.get_info().public_key, payload)
         self.exchange_storage.add_exchange(exchange_block, index)
 
@@ -710,13 +1014,61 @@ def configure_protect(agent):
             return
 
         ex_hash = body.exchange_hash
+        exchange_block = self.database.get_by_hash(ex_hash)
+        if exchange_block is None or ex_hash not in self.exchange_storage.exchanges:
+            self.logger.error('Requested exchange %s is unknown', ex_hash.encode('hex'))
+            return
+
         exchange_index = self.exchange_storage.exchanges[ex_hash]
         blocks = self.database.index(exchange_index)
 
+        if body.nodes or body.leaves:
+            tree = MerkleTree.of(blocks)
+            if any(node < 1 or node >= len(tree.nodes) for node in body.nodes) or \
+                    any(position >= len(tree.blocks) for position in body.leaves):
+                self.logger.error('Requested nodes of exchange %s are out of range',
+                                  ex_hash.encode('hex'))
+                return
+            if body.nodes:
+                self.com.send(sender, NewMessage(msg.PROTECT_EXCHANGE_PROOF, msg.ExchangeProof(
+                    exchange_hash=ex_hash, nodes=body.nodes,
+                    hashes=[tree.nodes[node] for node in body.nodes])))
+                return
+            blocks = [tree.blocks[position] for position in body.leaves]
+
         self.com.send(sender, NewMessage(msg.PROTECT_EXCHANGE_REPLY,
                                          msg.Database(info=self.get_info().as_message(),
                                                       blocks=[block.as_message() for block in blocks])))
 
+    @agent.add_handler(msg.PROTECT_EXCHANGE_PROOF)
+    def exchange_proof(self, sender, body):
+        """Handles a received PROTECT_EXCHANGE_PROOF message. The hashes of the requested nodes of
+        the Merkle tree of a disputed exchange are checked against the trusted hashes of their
+        ancestors and compared with the own tree. The next nodes, or the differing blocks once
+        they are located, are requested with another msg.PROTECT_EXCHANGE_REQUEST. Hashes that do
+        not match are treated like a failed verification.
+
+        Arguments:
+            sender {Address} -- Address string of the agent.
+            body {msg.ExchangeProof} -- Body of the incoming message.
+        """
+
+        request = self.request_cache.get(sender)
+        if request is None or request.merkle_dispute is None:
+            self.logger.error('No open dispute found for this agent')
+            return
+
+        if not request.merkle_dispute.receive(body.nodes, body.hashes):
+            self.logger.warning("Merkle proof of %s's exchange does not match", sender)
+            self.request_cache.remove(sender)
+            self.ignore_list.append(sender)
+            self.com.send(sender, NewMessage(msg.PROTECT_REJECT, msg.Empty()))
+            return
+
+        message = msg.ExchangeRequest(exchange_hash=body.exchange_hash)
+        self.add_dispute_request(message, request.merkle_dispute)
+        self.com.send(sender, NewMessage(msg.PROTECT_EXCHANGE_REQUEST, message))
+
     @agent.add_handler(msg.PROTECT_EXCHANGE_REPLY)
     def exchange_reply(self, sender, body):
         if self.request_cache.get(sender) is None:
@@ -725,6 +1077,12 @@ def configure_protect(agent):
 
         self.logger.error("Trying to detect the actual double spend")
         blocks = [Block.from_message(block) for block in body.blocks]
+
+        dispute = self.request_cache.get(sender).merkle_dispute
+        if dispute is not None:
+            # only the blocks of the located leaves are taken from a dispute
+            blocks = [block for block in blocks if dispute.is_differing_block(block)]
+            self.request_cache.get(sender).merkle_dispute = None
         
         result = self.verify_blocks_for_double_spend(blocks)
 
@@ -755,8 +1113,8 @@ def configure_protect(agent):
                     self.logger.error("Verification returned %s", verification)
 
                     if verification is True:
-                        own_chain = self.database.get_chain(self.public_key)
-                        own_index = BlockIndex.from_blocks(self.database.get_all_blocks())
+                        own_chain = self.get_own_chain()
+                        own_index = self.get_own_block_index()
                         partner_index = request.index
                         index = (own_index - partner_index)
                         index.remove(PublicKey.from_bin(request.chain[0].public_key))
@@ -767,13 +1125,14 @@ def configure_protect(agent):
                             request.transfer_down_index = BlockIndex()
                         else:
                             sub_database = self.database.index(index)
-                            request.transfer_down = blocks_to_hash(sub_database).encode('hex')
+                            request.transfer_down = self.transfer_hash(sub_database, sender).encode('hex')
                             request.transfer_down_index = index
                         request.chain_length_sent = len(own_chain)
 
                         db = msg.ChainAndBlocks(chain=[block.as_message() for block in own_chain],
                                                 blocks=[block.as_message() for block in sub_database],
-                                                exchange=self.exchange_storage.as_message())
+                                                exchange=self.exchange_storage.as_message(
+                                                    self.get_index_encoding(sender)))
                         self.com.send(sender, NewMessage(msg.PROTECT_CHAIN_BLOCKS, db))
                         request.update_state(RequestState.PROTECT_EXCHANGE)
 
@@ -789,10 +1148,11 @@ def configure_protect(agent):
 
                     if verification is True:
                         partner = next((a for a in self.agents if a.address == sender), None)
-                        payload = {'transfer_up': self.request_cache.get(sender).transfer_up.encode('hex'),
-                                'transfer_down': blocks_to_hash(request.blocks).encode('hex'),
-                                'chain_up': self.request_cache.get(sender).chain_length_sent,
-                                'chain_down': self.request_cache.get(sender).chain_length_received}
+                        payload = self.exchange_payload(sender, {
+                            'transfer_up': self.request_cache.get(sender).transfer_up.encode('hex'),
+                            'transfer_down': self.transfer_hash(request.blocks, sender).encode('hex'),
+                            'chain_up': self.request_cache.get(sender).chain_length_sent,
+                            'chain_down': self.request_cache.get(sender).chain_length_received})
                         new_block = self.block_factory.create_new(partner.public_key, payload=payload)
                         self.com.send(partner.address, NewMessage(msg.PROTECT_BLOCK_PROPOSAL,
                                                                 new_block.as_message()))
@@ -1,12 +1,47 @@
-import pickle
 import time
+from hashlib import sha256
 
 import src.communication.messages_pb2 as msg
+from src.chain.payload import encode_payload, decode_payload, parse_payload, payload_field
 
 from src.pyipv8.ipv8.attestation.trustchain.block import TrustChainBlock, GENESIS_HASH, EMPTY_SIG, \
     EMPTY_PK, GENESIS_SEQ, UNKNOWN_SEQ
 from src.pyipv8.ipv8.messaging.serialization import Serializer
 
+# Kind flags of a block, derived from the fields of the payload
+TRANSACTION = 1
+EXCHANGE = 2
+DOUBLE_EXCHANGE = 4
+SINGLE_EXCHANGE = 8
+
+# Attributes that are part of the message of a block, changing one of them invalidates the cached
+# message, packed bytes, hash and kind
+BLOCK_FIELDS = frozenset(['transaction', 'public_key', 'sequence_number', 'link_public_key',
+                          'link_sequence_number', 'previous_hash', 'signature', 'insert_time'])
+
+
+def payload_kind(get):
+    """Classifies a payload by its fields.
+
+    Arguments:
+        get {function} -- Returns the value of a field of the payload or None if it is not set
+
+    Returns:
+        int -- Combination of the kind flags, 0 for blocks without a transaction or exchange
+    """
+
+    kind = 0
+    if get('up') is not None and get('down') is not None:
+        kind |= TRANSACTION
+
+    transfer_down = get('transfer_down')
+    if transfer_down:
+        kind |= EXCHANGE
+    if transfer_down is not None:
+        kind |= DOUBLE_EXCHANGE if get('transfer_up') is not None else SINGLE_EXCHANGE
+
+    return kind
+
 
 class Block(TrustChainBlock):
     """Extension to the normal TrustChainBlock, mostly for convenience to conver blocks to
@@ -43,33 +78,106 @@ class Block(TrustChainBlock):
                 self.signature = str(self.signature)
         self.serializer = serializer
 
+    def __setattr__(self, name, value):
+        if name in BLOCK_FIELDS:
+            self.__dict__.pop('_message', None)
+            self.__dict__.pop('_pack', None)
+            self.__dict__.pop('_hash', None)
+            self.__dict__.pop('_kind', None)
+        super(Block, self).__setattr__(name, value)
+
+    def pack(self, signature=True):
+        """Packs the block for hashing and signing. The packed bytes including the signature are
+        kept until one of the fields of the block is assigned, the transaction must therefore not
+        be modified in place.
+
+        Keyword Arguments:
+            signature {bool} -- Whether to include the signature (default: {True})
+        """
+        if not signature:
+            return super(Block, self).pack(signature=False)
+
+        packed = self.__dict__.get('_pack')
+        if packed is None:
+            packed = super(Block, self).pack()
+            self.__dict__['_pack'] = packed
+        return packed
+
+    @property
+    def hash(self):
+        """The SHA-256 hash of the packed block, calculated once until a field changes.
+        """
+        block_hash = self.__dict__.get('_hash')
+        if block_hash is None:
+            block_hash = sha256(self.pack()).digest()
+            self.__dict__['_hash'] = block_hash
+        return block_hash
+
+    @property
+    def transaction(self):
+        """The payload of the block. The payload of a block received in a message is only decoded
+        when it is accessed for the first time.
+        """
+        payload = self.__dict__.pop('_payload', None)
+        if payload is not None:
+            self.__dict__.pop('_fields', None)
+            self.__dict__['_transaction'] = decode_payload(payload)
+        return self.__dict__['_transaction']
+
+    @transaction.setter
+    def transaction(self, transaction):
+        self.__dict__.pop('_payload', None)
+        self.__dict__.pop('_fields', None)
+        self.__dict__['_transaction'] = transaction
+
+    def _payload_field(self, key):
+        """Returns a field of the payload. A typed payload that was not decoded yet is read without
+        building the transaction.
+        """
+        payload = self.__dict__.get('_payload')
+        if payload is not None:
+            fields = self.__dict__.get('_fields')
+            if fields is None:
+                fields = parse_payload(payload)
+                self.__dict__['_fields'] = fields
+            if fields is not None:
+                return payload_field(fields, key)
+        return self.transaction.get(key)
+
     def as_message(self):
-        """Convert a Block to a message to send to other agents.
+        """Convert a Block to a message to send to other agents. The message is kept until one of
+        the fields of the block changes, the returned message must not be modified.
 
         Returns:
             msg.Block -- Block message describing the block instance.
         """
-        return msg.Block(
-            payload=pickle.dumps(self.transaction),
-            public_key=self.public_key,
-            sequence_number=self.sequence_number,
-            link_public_key=self.link_public_key,
-            link_sequence_number=self.link_sequence_number,
-            previous_hash=self.previous_hash,
-            signature=self.signature,
-            insert_time=str(self.insert_time)
-        )
+        message = self.__dict__.get('_message')
+        if message is None:
+            payload = self.__dict__.get('_payload')
+            message = msg.Block(
+                payload=payload if payload is not None else encode_payload(self.transaction),
+                public_key=self.public_key,
+                sequence_number=self.sequence_number,
+                link_public_key=self.link_public_key,
+                link_sequence_number=self.link_sequence_number,
+                previous_hash=self.previous_hash,
+                signature=self.signature,
+                insert_time=str(self.insert_time)
+            )
+            self.__dict__['_message'] = message
+        return message
 
     @classmethod
     def from_message(cls, message):
-        """Creats a block from a block message.
+        """Creats a block from a block message. The payload is kept encoded until the transaction
+        is accessed and the message is reused by as_message.
 
         Arguments:
             message {msg.Block} -- Block message describing the block to be created.
         """
 
-        return cls([
-            pickle.loads(message.payload),
+        block = cls([
+            None,
             message.public_key,
             message.sequence_number,
             message.link_public_key,
@@ -78,43 +186,94 @@ class Block(TrustChainBlock):
             message.signature,
             message.insert_time
         ])
+        block.__dict__['_payload'] = message.payload
+        block.__dict__['_message'] = message
+        return block
+
+    @classmethod
+    def create(cls, transaction, database, public_key, link=None, link_pk=None):
+        """Creates a new block that extends the chain of the public key. The sequence number and
+        previous hash are taken from the chain metadata of the database, such that the latest block
+        does not have to be read.
+
+        Arguments:
+            transaction {dict} -- Payload of the block, ignored if a linked block is given
+            database {Database} -- Database containing the chain of the public key
+            public_key {string} -- Binary public key of the creator
+
+        Keyword Arguments:
+            link {Block} -- Block proposal that is confirmed by the new block (default: {None})
+            link_pk {string} -- Binary public key of the partner (default: {None})
+        """
+
+        ret = cls()
+        if link:
+            ret.transaction = link.transaction
+            ret.link_public_key = link.public_key
+            ret.link_sequence_number = link.sequence_number
+        else:
+            ret.transaction = transaction
+            ret.link_public_key = link_pk
+        head = database.get_chain_metadata(public_key)
+        if head is not None:
+            ret.sequence_number = head.sequence_number + 1
+            ret.previous_hash = head.hash
+        ret.public_key = public_key
+        ret.signature = EMPTY_SIG
+        return ret
 
     @classmethod
-    def convert_to_Block(cls, obj):
+    def convert_to_Block(cls, obj, block_hash=None):
         """Converts TrustChainBlocks to Blocks.
    
         Arguments:
             obj {TrustChainBlock} -- Block that will be converted
+
+        Keyword Arguments:
+            block_hash {string} -- Known hash of the block, e.g. stored in the database, which is
+                used instead of calculating the hash (default: {None})
         """
 
+        transaction = obj.__dict__.pop('transaction')
         obj.__class__ = Block
+        obj.transaction = transaction
+        if block_hash is not None:
+            obj.__dict__['_hash'] = str(block_hash)
         return obj
 
+    @property
+    def kind(self):
+        """The kind flags of the block, classified once until the payload changes.
+        """
+        kind = self.__dict__.get('_kind')
+        if kind is None:
+            kind = payload_kind(self._payload_field)
+            self.__dict__['_kind'] = kind
+        return kind
+
     def is_transaction(self):
         """Looks at the data stored in the transaction field and determines whether the block is a
         transaction or not. For this usecase transactions contain the "up" and "down" field.
         """
-        return self.transaction.get('up') is not None and self.transaction.get('down') is not None
+        return bool(self.kind & TRANSACTION)
 
     def is_double_exchange(self):
         """Looks at the data stored in the transaction field and determines whether the block is a
-        transaction or not. For this usecase transactions contain the "up" and "down" field.
+        double exchange, which contains the "transfer_down" and "transfer_up" field.
         """
-        return self.transaction.get('transfer_down') is not None and \
-            self.transaction.get('transfer_up') is not None
+        return bool(self.kind & DOUBLE_EXCHANGE)
 
     def is_single_exchange(self):
         """Looks at the data stored in the transaction field and determines whether the block is a
-        transaction or not. For this usecase transactions contain the "up" and "down" field.
+        single exchange, which contains the "transfer_down" field only.
         """
-        return self.transaction.get('transfer_down') is not None and \
-            self.transaction.get('transfer_up') is None
+        return bool(self.kind & SINGLE_EXCHANGE)
 
     def is_exchange(self):
         """Looks at the data stored in the transaction field and determines whether the block is an
-        exchange or not. For this usecase exchanges contain the "transfer_down" field.
+        exchange or not. For this usecase exchanges contain a non-empty "transfer_down" field.
         """
-        return self.transaction.get('transfer_down')
+        return bool(self.kind & EXCHANGE)
 
     def get_relevant_exchange(self):
         """If the agent mentioned in public_key field is requester, the relevant exchange is what 
@@ -124,8 +283,14 @@ class Block(TrustChainBlock):
         if not self.is_exchange():
             raise Exception("Block is not an exchange block and therefore has no relevant exchange")
 
-        return self.transaction['transfer_down'] if self.link_sequence_number == UNKNOWN_SEQ \
-            else self.transaction['transfer_up']
+        return self._payload_field('transfer_down') if self.link_sequence_number == UNKNOWN_SEQ \
+            else self._payload_field('transfer_up')
+
+    def get_hash_version(self):
+        """Exchange blocks record the version of their transfer hashes, blocks without a version use
+        the sorted hash.
+        """
+        return self._payload_field('hash_version') or msg.SORTED_HASH
 
     def get_relevant_chain_length(self):
         """Transfer blocks also record the chain of both parties shared up to that point.
@@ -134,5 +299,5 @@ class Block(TrustChainBlock):
             raise Exception("Block is not a double exchange block and therefore has no relevant\
             chain length")
 
-        return self.transaction['chain_down'] if self.link_sequence_number == UNKNOWN_SEQ \
-            else self.transaction['chain_up']
+        return self._payload_field('chain_down') if self.link_sequence_number == UNKNOWN_SEQ \
+            else self._payload_field('chain_up')
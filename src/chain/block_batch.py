@@ -0,0 +1,101 @@
+"""Module defining the BlockBatch class.
+"""
+from array import array
+
+from src.chain.block import Block, TRANSACTION, EXCHANGE, DOUBLE_EXCHANGE
+
+
+class BlockBatch(object):
+    """The BlockBatch stores the fields that are needed to verify a list of blocks, e.g. a received
+    chain, in columns. Public keys are replaced by ids into the list of distinct keys, such that
+    blocks can be grouped and compared by integer. The blocks themselves are kept, the batch can be
+    used in place of the list of blocks.
+    """
+
+    def __init__(self, blocks):
+        """Creates the columns of a list of blocks.
+
+        Arguments:
+            blocks {[Block]} -- Blocks of the batch
+        """
+
+        self.blocks = list(blocks)
+        self.keys = []
+        self.public_key_ids = array('l')
+        self.link_key_ids = array('l')
+        self.sequence_numbers = array('l')
+        self.link_sequence_numbers = array('l')
+        self.kinds = array('B')
+
+        key_ids = {}
+        for block in self.blocks:
+            for key in (block.public_key, block.link_public_key):
+                if key not in key_ids:
+                    key_ids[key] = len(self.keys)
+                    self.keys.append(key)
+            self.public_key_ids.append(key_ids[block.public_key])
+            self.link_key_ids.append(key_ids[block.link_public_key])
+            self.sequence_numbers.append(block.sequence_number)
+            self.link_sequence_numbers.append(block.link_sequence_number)
+            self.kinds.append(block.kind)
+
+    @classmethod
+    def from_message(cls, message):
+        """Creates a batch of the blocks of a msg.Database message.
+
+        Arguments:
+            message {msg.Database} -- Message containing the blocks of the batch
+        """
+        return cls([Block.from_message(block) for block in message.blocks])
+
+    @classmethod
+    def of(cls, blocks):
+        """Returns the blocks as a batch, a batch is returned as it is.
+
+        Arguments:
+            blocks {[Block]} -- List of blocks or BlockBatch
+        """
+        return blocks if isinstance(blocks, BlockBatch) else cls(blocks)
+
+    def positions(self, kind):
+        """Returns the positions of the blocks of the given kind.
+
+        Arguments:
+            kind {int} -- One of the kind flags
+        """
+        return [i for i, flags in enumerate(self.kinds) if flags & kind]
+
+    def is_complete(self, length):
+        """Returns whether the first blocks of the batch are exactly the sequence numbers 1 up to
+        and including length, in any order.
+
+        Arguments:
+            length {int} -- Expected length of the chain
+        """
+        sequence_numbers = self.sequence_numbers[:length]
+        if len(sequence_numbers) != length:
+            return False
+        if sequence_numbers == array('l', xrange(1, length + 1)):
+            return True
+        return sorted(sequence_numbers) == range(1, length + 1)
+
+    def sequence_numbers_by_key(self):
+        """Returns the sequence numbers of the blocks grouped by public key.
+
+        Returns:
+            dict -- Maps binary public keys to lists of sequence numbers
+        """
+        grouped = {}
+        for key_id, sequence_number in zip(self.public_key_ids, self.sequence_numbers):
+            grouped.setdefault(key_id, []).append(sequence_number)
+        return {self.keys[key_id]: sequence_numbers
+                for key_id, sequence_numbers in grouped.iteritems()}
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, i):
+        return self.blocks[i]
+
+    def __iter__(self):
+        return iter(self.blocks)
@@ -0,0 +1,118 @@
+"""Module defining the BlockCache class.
+"""
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 10000
+
+
+class BlockCache(object):
+    """The BlockCache keeps the most recently used blocks of a database, such that blocks which are
+    requested again do not have to be converted from database rows again. Blocks are found by public
+    key and sequence number or by their hash. When the cache is full the least recently used block
+    is evicted.
+    """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        """Creates an empty cache.
+
+        Keyword Arguments:
+            size {int} -- Maximum number of cached blocks, 0 disables the cache
+                (default: {DEFAULT_CACHE_SIZE})
+        """
+
+        self.size = size
+        self.blocks = OrderedDict()
+        self.hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, public_key, sequence_number):
+        """Returns the cached block with the given public key and sequence number.
+
+        Arguments:
+            public_key {string} -- Binary public key of the block
+            sequence_number {int} -- Sequence number of the block
+
+        Returns:
+            Block -- The cached block or None if the block is not cached
+        """
+
+        key = (str(public_key), sequence_number)
+        entry = self.blocks.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.blocks[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def get_by_hash(self, block_hash):
+        """Returns the cached block with the given hash.
+
+        Arguments:
+            block_hash {string} -- Binary hash of the block
+
+        Returns:
+            Block -- The cached block or None if the block is not cached
+        """
+
+        key = self.hashes.get(str(block_hash))
+        if key is None:
+            self.misses += 1
+            return None
+
+        return self.get(*key)
+
+    def put(self, block, block_hash):
+        """Stores a block in the cache and evicts the least recently used block if the cache is full.
+
+        Arguments:
+            block {Block} -- Block to be cached
+            block_hash {string} -- Binary hash of the block
+        """
+
+        if self.size <= 0:
+            return
+
+        key = (str(block.public_key), block.sequence_number)
+        self._evict(key)
+        self.blocks[key] = (block, str(block_hash))
+        self.hashes[str(block_hash)] = key
+
+        while len(self.blocks) > self.size:
+            self._evict(next(iter(self.blocks)))
+
+    def discard(self, public_key, sequence_begin, sequence_end):
+        """Removes the blocks of a public key with sequence numbers from sequence_begin up to and
+        including sequence_end from the cache.
+
+        Arguments:
+            public_key {string} -- Binary public key of the blocks
+            sequence_begin {int} -- First sequence number to remove
+            sequence_end {int} -- Last sequence number to remove
+        """
+
+        public_key = str(public_key)
+        if sequence_end - sequence_begin < len(self.blocks):
+            keys = [(public_key, seq) for seq in xrange(sequence_begin, sequence_end + 1)]
+        else:
+            keys = [key for key in self.blocks
+                    if key[0] == public_key and sequence_begin <= key[1] <= sequence_end]
+
+        for key in keys:
+            self._evict(key)
+
+    def clear(self):
+        """Removes all blocks from the cache.
+        """
+        self.blocks.clear()
+        self.hashes.clear()
+
+    def _evict(self, key):
+        entry = self.blocks.pop(key, None)
+        if entry is not None and self.hashes.get(entry[1]) == key:
+            del self.hashes[entry[1]]
+
+    def __len__(self):
+        return len(self.blocks)
@@ -1,15 +1,140 @@
+import heapq
+
 import src.communication.messages_pb2 as msg
 from src.pyipv8.ipv8.attestation.trustchain.block import UNKNOWN_SEQ
 from src.public_key import PublicKey
+from src.chain.block_batch import BlockBatch
+
+
+def to_ranges(sequence_numbers):
+    """Compresses a list of sequence numbers into a sorted list of inclusive (from, to) ranges.
+    Duplicates are ignored, so [1, 2, 3, 3, 5] becomes [(1, 3), (5, 5)].
+
+    Arguments:
+        sequence_numbers {[int]} -- Sequence numbers in arbitrary order.
+    """
+
+    ranges = []
+    for seq in sorted(set(sequence_numbers)):
+        if ranges and ranges[-1][1] + 1 == seq:
+            ranges[-1] = (ranges[-1][0], seq)
+        else:
+            ranges.append((seq, seq))
+
+    return ranges
+
+
+def expand_ranges(ranges):
+    """Expands a list of inclusive ranges back into the list of sequence numbers they cover.
+
+    Arguments:
+        ranges {[(int, int)]} -- Sorted list of inclusive ranges.
+    """
+
+    return [seq for begin, end in ranges for seq in xrange(begin, end + 1)]
+
+
+def merge_ranges(range_lists):
+    """Returns the union of any number of sorted range lists as a new sorted range list. All lists
+    are merged in a single pass and runs that overlap or touch are combined.
+
+    Arguments:
+        range_lists {[[(int, int)]]} -- Sorted lists of inclusive ranges.
+    """
+
+    union = []
+    for begin, end in heapq.merge(*range_lists):
+        if union and union[-1][1] + 1 >= begin:
+            if end > union[-1][1]:
+                union[-1] = (union[-1][0], end)
+        else:
+            union.append((begin, end))
+
+    return union
+
+
+def union_ranges(own, other):
+    """Returns the union of two sorted range lists as a new sorted range list. Runs that overlap or
+    touch are merged.
+
+    Arguments:
+        own {[(int, int)]} -- Sorted list of inclusive ranges.
+        other {[(int, int)]} -- Sorted list of inclusive ranges.
+    """
+
+    return merge_ranges([own, other])
+
+
+def difference_ranges(own, other):
+    """Returns the ranges of own with all sequence numbers covered by other removed.
+
+    Arguments:
+        own {[(int, int)]} -- Sorted list of inclusive ranges.
+        other {[(int, int)]} -- Sorted list of inclusive ranges which shall be subtracted.
+    """
+
+    difference = []
+    j = 0
+    for begin, end in own:
+        while j < len(other) and other[j][1] < begin:
+            j += 1
+
+        k = j
+        while k < len(other) and other[k][0] <= end:
+            if other[k][0] > begin:
+                difference.append((begin, other[k][0] - 1))
+            begin = max(begin, other[k][1] + 1)
+            k += 1
+
+        if begin <= end:
+            difference.append((begin, end))
+
+    return difference
+
+
+def pack_ranges(ranges):
+    """Delta-encodes a sorted list of inclusive ranges for the RANGES wire encoding. Each range is
+    written as the distance to the end of the previous range and the length of the range minus one,
+    which keeps the varints small for long chains.
+
+    Arguments:
+        ranges {[(int, int)]} -- Sorted list of inclusive ranges.
+    """
+
+    values = []
+    previous_end = -1
+    for begin, end in ranges:
+        values.extend([begin - previous_end - 1, end - begin])
+        previous_end = end
+
+    return values
+
+
+def unpack_ranges(values):
+    """Decodes the delta-encoded values of the RANGES wire encoding into inclusive ranges.
+
+    Arguments:
+        values {[int]} -- Flat list of (distance, length - 1) pairs.
+    """
+
+    ranges = []
+    previous_end = -1
+    for i in xrange(0, len(values) - 1, 2):
+        begin = previous_end + 1 + values[i]
+        previous_end = begin + values[i + 1]
+        ranges.append((begin, previous_end))
+
+    return ranges
 
 
 class BlockIndex(object):
     """The BlockIndex is one of the major components that enable the calculation of the state of the
     agent given their chain. The index shows for each public key, which blocks are recorded, either
-    in an exchange or in the database itself. The entries of the index consists of tuples
-    (public_key, [indices]), where the list of indices shows which sequence numbers of that public
-    key are present. The sequence number given by "to" is also included in the range in contrast to
-    the standard indexing in Python.
+    in an exchange or in the database itself. Since chains are mostly contiguous, the index stores
+    for each public key a sorted list of inclusive ranges (from, to) of sequence numbers instead of
+    every single sequence number. The sequence number given by "to" is also included in the range
+    in contrast to the standard indexing in Python. The set operations merge the entries sorted by
+    public key in a single pass and return sorted indexes, so chained operations do not sort again.
     """
 
     def __init__(self, entries=[]):
@@ -20,7 +145,58 @@ class BlockIndex(object):
              (default: {[]})
         """
 
-        self.entries = entries
+        index_dict = {}
+        keys = []
+        for public_key, sequence_numbers in entries:
+            if public_key not in index_dict:
+                keys.append(public_key)
+            index_dict.setdefault(public_key, []).extend(sequence_numbers)
+
+        self.ranges = [(public_key, to_ranges(index_dict[public_key])) for public_key in keys]
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """Creates a BlockIndex directly from range entries without expanding them.
+
+        Arguments:
+            ranges {[(string, [(int, int)])]} -- Entries of public key and sorted list of inclusive
+                ranges.
+        """
+
+        index = cls()
+        index.ranges = ranges
+        return index
+
+    def _sorted_ranges(self):
+        """Returns the range entries sorted by public key. Indexes resulting from set operations are
+        sorted already, in that case no new list is created.
+        """
+        if all(self.ranges[i][0] < self.ranges[i + 1][0] for i in xrange(len(self.ranges) - 1)):
+            return self.ranges
+        return sorted(self.ranges)
+
+    @property
+    def entries(self):
+        """The entries of the index in the form (public_key, [indices]), with all ranges expanded.
+        """
+        return [(public_key, expand_ranges(ranges)) for public_key, ranges in self.ranges]
+
+    def _position(self, public_key):
+        """Returns the position of the public key in the entries and whether it is present. If it
+        is not present the position is the end of the entries.
+        """
+        position = next((i for i, entry in enumerate(self.ranges) if entry[0] == public_key),
+                        len(self.ranges))
+        return position, position < len(self.ranges)
+
+    def get_ranges(self, public_key):
+        """Get the ranges of sequence numbers of a specific public key in this index.
+
+        Arguments:
+            public_key {string} -- Binary public key
+        """
+        position, found = self._position(public_key)
+        return self.ranges[position][1] if found else []
 
     def get(self, public_key):
         """Get the indeces of a specific public key in this index
@@ -28,8 +204,7 @@ class BlockIndex(object):
         Arguments:
             public_key {string} -- Binary public key
         """
-        return next((index for key, index in self.entries if key == public_key), [])
-
+        return expand_ranges(self.get_ranges(public_key))
 
     @classmethod
     def from_chain(cls, chain):
@@ -51,26 +226,36 @@ class BlockIndex(object):
                 for elem in transfer:
                     index_dict.setdefault(elem[0].decode('hex'), []).extend(elem[1])
 
-        return cls([(elem[0], sorted(list(set(elem[1])))) for elem in index_dict.items()])
+        return cls(index_dict.items())
 
     @classmethod
     def from_blocks(cls, blocks):
         """Calculates the index given all blocks that should be in the index e.g. from a database.
 
         Arguments:
-            blocks {[Block]} -- All blocks that should be recorded in the index.
+            blocks {[Block]} -- All blocks that should be recorded in the index, or a BlockBatch.
         """
 
+        if isinstance(blocks, BlockBatch):
+            return cls(blocks.sequence_numbers_by_key().items())
+
         index_dict = {}
         for block in blocks:
             index_dict.setdefault(block.public_key, []).append(block.sequence_number)
 
-        return cls([(elem[0], sorted(list(set(elem[1])))) for elem in index_dict.items()])
+        return cls(index_dict.items())
 
     @classmethod
     def from_message(cls, message):
-        return cls([(entry.public_key, [num for num in entry.sequence_numbers])
-                    for entry in message.entries])
+        """Creates a BlockIndex from a BlockIndex message. Entries in the RANGES encoding are read
+        directly as ranges, entries of agents that send sequence numbers are compressed.
+
+        Arguments:
+            message {msg.BlockIndex} -- BlockIndex message in either encoding.
+        """
+        return cls.from_ranges([(entry.public_key, unpack_ranges(entry.ranges)) if entry.ranges
+                                else (entry.public_key, to_ranges(entry.sequence_numbers))
+                                for entry in message.entries])
 
     def __sub__(self, other):
         """Returns an index of the items which are in self but not in other.
@@ -79,8 +264,8 @@ class BlockIndex(object):
             other {BlockIndex} -- The index which shall be subtracted
         """
 
-        own_index = sorted(self.entries, key=lambda x: x[0])
-        other_index = sorted(other.entries, key=lambda x: x[0])
+        own_index = self._sorted_ranges()
+        other_index = other._sorted_ranges()
 
         i = 0
         j = 0
@@ -91,7 +276,7 @@ class BlockIndex(object):
 
             if own_key == other_key:
                 if own_index[i][1] != other_index[j][1]:
-                    diff = list(set(own_index[i][1]) - set(other_index[j][1]))
+                    diff = difference_ranges(own_index[i][1], other_index[j][1])
                     if len(diff) > 0:
                         exchange.append((own_key, diff))
                 i += 1
@@ -107,7 +292,7 @@ class BlockIndex(object):
             exchange.append((own_key, own_index[i][1]))
             i += 1
 
-        return BlockIndex(exchange)
+        return BlockIndex.from_ranges(exchange)
 
     def __add__(self, other):
         """Returns the union of both indexes.
@@ -116,8 +301,8 @@ class BlockIndex(object):
             other {BlockIndex} -- The index which shall be subtracted
         """
 
-        own_index = sorted(self.entries, key=lambda x: x[0])
-        other_index = sorted(other.entries, key=lambda x: x[0])
+        own_index = self._sorted_ranges()
+        other_index = other._sorted_ranges()
 
         i = 0
         j = 0
@@ -127,7 +312,7 @@ class BlockIndex(object):
             other_key = other_index[j][0]
 
             if own_key == other_key:
-                union = list(set(own_index[i][1]) | set(other_index[j][1]))
+                union = union_ranges(own_index[i][1], other_index[j][1])
                 if len(union) > 0:
                     exchange.append((own_key, union))
                 i += 1
@@ -149,13 +334,50 @@ class BlockIndex(object):
             exchange.append((other_key, other_index[j][1]))
             j += 1
 
-        return BlockIndex(exchange)
+        return BlockIndex.from_ranges(exchange)
 
-    def as_message(self):
+    @classmethod
+    def union_all(cls, indexes):
+        """Returns the union of all given indexes. In contrast to adding the indexes one by one,
+        the ranges of each public key are merged only once, in a single k-way merge.
+
+        Arguments:
+            indexes {[BlockIndex]} -- Indexes to be combined.
+        """
+
+        key_ranges = {}
+        for index in indexes:
+            for public_key, ranges in index.ranges:
+                key_ranges.setdefault(public_key, []).append(ranges)
+
+        return cls.from_ranges([(public_key, merge_ranges(key_ranges[public_key]))
+                                for public_key in sorted(key_ranges)])
+
+    def difference_all(self, indexes):
+        """Returns an index of the items which are in self but in none of the given indexes. The
+        indexes are combined with union_all first, so self is only traversed once.
+
+        Arguments:
+            indexes {[BlockIndex]} -- Indexes which shall be subtracted.
+        """
+
+        return self - BlockIndex.union_all(indexes)
+
+    def as_message(self, encoding=msg.SEQUENCE_NUMBERS):
         """Creates a BlockIndex message from the given object.
+
+        Keyword Arguments:
+            encoding {msg.IndexEncoding} -- Encoding understood by the receiving agent
+                (default: {msg.SEQUENCE_NUMBERS})
         """
-        message_entries = [msg.BlockIndexEntry(public_key=entry[0],
-                                               sequence_numbers=entry[1]) for entry in self.entries]
+        if encoding == msg.RANGES:
+            message_entries = [msg.BlockIndexEntry(public_key=entry[0],
+                                                   ranges=pack_ranges(entry[1]))
+                               for entry in self.ranges]
+        else:
+            message_entries = [msg.BlockIndexEntry(public_key=entry[0],
+                                                   sequence_numbers=entry[1])
+                               for entry in self.entries]
         return msg.BlockIndex(entries=message_entries)
 
     def to_database_args(self):
@@ -164,26 +386,69 @@ class BlockIndex(object):
         the database the public keys need to be converted to buffer objects.
         """
 
-        return [(entry[0], seq) for entry in self.entries for seq in entry[1]]
+        return [(public_key, seq) for public_key, ranges in self.ranges
+                for begin, end in ranges for seq in xrange(begin, end + 1)]
 
     def db_pack(self):
         return [(entry[0].encode('hex'), entry[1]) for entry in self.entries]
 
     def __len__(self):
-        return len(self.entries)
+        return len(self.ranges)
     
     def __str__(self):
         string = "BlockIndex {<"
-        string += ">, <".join(["%s:%s" % (PublicKey.from_bin(elem[0]).as_readable(), elem[1])
-                               for elem in self.entries])
+        string += ">, <".join(["%s:%s" % (PublicKey.from_bin(elem[0]).as_readable(),
+                                          ",".join(("%d-%d" % run if run[0] != run[1] else
+                                                    "%d" % run[0] for run in elem[1])))
+                               for elem in self.ranges])
         string += ">}"
 
         return string
 
+    def insert(self, public_key, sequence_number):
+        """Records a single block in the index. The range list of the public key is replaced instead
+        of modified in place, such that copies of the index are not affected.
+
+        Arguments:
+            public_key {string} -- Binary public key of the block
+            sequence_number {int} -- Sequence number of the block
+        """
+        position, found = self._position(public_key)
+        if found:
+            self.ranges[position] = (public_key, union_ranges(self.ranges[position][1],
+                                                              [(sequence_number, sequence_number)]))
+        else:
+            self.ranges.append((public_key, [(sequence_number, sequence_number)]))
+
+    def discard(self, public_key, sequence_begin, sequence_end):
+        """Removes the blocks of a public key with sequence numbers from sequence_begin up to and
+        including sequence_end from the index.
+
+        Arguments:
+            public_key {string} -- Binary public key of the blocks
+            sequence_begin {int} -- First sequence number to remove
+            sequence_end {int} -- Last sequence number to remove
+        """
+        position, found = self._position(public_key)
+        if not found:
+            return
+
+        ranges = difference_ranges(self.ranges[position][1], [(sequence_begin, sequence_end)])
+        if ranges:
+            self.ranges[position] = (public_key, ranges)
+        else:
+            del self.ranges[position]
+
+    def copy(self):
+        """Returns a copy of the index. Range lists are never modified in place, so only the list of
+        entries needs to be copied.
+        """
+        return BlockIndex.from_ranges(list(self.ranges))
+
     def remove(self, public_key):
         """Removes the entries for a specific agent identified by the public_key.
         
         Arguments:
             public_key {PublicKey} -- Public key of the agent to be removed from the index
         """
-        self.entries = [entry for entry in self.entries if entry[0] != public_key.as_bin()]
+        self.ranges = [entry for entry in self.ranges if entry[0] != public_key.as_bin()]
@@ -0,0 +1,160 @@
+"""Module defining the MerkleTree and MerkleDispute classes.
+
+The MERKLE_HASH of an exchange is the root of a Merkle tree over the hashes of the exchanged blocks,
+ordered by public key and sequence number. Both versions of a double spent block therefore take the
+same leaf position, such that two parties that disagree about an exchange can locate the differing
+leaves by comparing subtrees instead of resending all blocks.
+"""
+from hashlib import sha256
+
+# Number of tree levels a single proof request descends
+PROOF_LEVELS = 4
+
+LEAF_PREFIX = '\x00'
+NODE_PREFIX = '\x01'
+
+
+def parent_hash(left, right):
+    """Returns the hash of an inner node, the parent of two empty nodes is empty.
+    """
+    if left == '' and right == '':
+        return ''
+    return sha256(NODE_PREFIX + left + right).digest()
+
+
+def fold(hashes):
+    """Combines the hashes of all nodes on one level of a subtree, ordered from left to right, into
+    the hash of the root of that subtree.
+
+    Arguments:
+        hashes {[string]} -- Hashes of a power of two number of nodes
+    """
+    while len(hashes) > 1:
+        hashes = [parent_hash(hashes[i], hashes[i + 1]) for i in xrange(0, len(hashes), 2)]
+    return hashes[0]
+
+
+class MerkleTree(object):
+    """The MerkleTree stores all nodes of a binary hash tree in a list, node 1 is the root and node
+    i has the children 2i and 2i + 1. The leaves are padded with empty nodes to a power of two.
+    """
+
+    def __init__(self, blocks):
+        """Creates the tree of the given blocks, the leaves follow the order of the list.
+
+        Arguments:
+            blocks {[Block]} -- Blocks of the leaves
+        """
+
+        self.blocks = list(blocks)
+        self.width = 1
+        while self.width < len(self.blocks):
+            self.width *= 2
+
+        self.nodes = [''] * (2 * self.width)
+        for position, block in enumerate(self.blocks):
+            self.nodes[self.width + position] = sha256(LEAF_PREFIX + block.hash).digest()
+        for node in xrange(self.width - 1, 0, -1):
+            self.nodes[node] = parent_hash(self.nodes[2 * node], self.nodes[2 * node + 1])
+
+    @classmethod
+    def of(cls, blocks):
+        """Creates the tree of a set of blocks, ordered by public key and sequence number.
+
+        Arguments:
+            blocks {[Block]} -- Blocks in the set
+        """
+        return cls(sorted(blocks, key=lambda block: (str(block.public_key),
+                                                     block.sequence_number)))
+
+    def root(self):
+        return self.nodes[1]
+
+    def is_leaf(self, node):
+        return node >= self.width
+
+    def descendants(self, node, levels=PROOF_LEVELS):
+        """Returns the nodes the given number of levels below a node, or the leaves below the node
+        if those are closer, ordered from left to right.
+
+        Arguments:
+            node {int} -- Node of the tree
+
+        Keyword Arguments:
+            levels {int} -- Number of levels to descend (default: {PROOF_LEVELS})
+        """
+        first, last = node, node + 1
+        for _ in xrange(levels):
+            if self.is_leaf(first):
+                break
+            first, last = 2 * first, 2 * last
+        return range(first, last)
+
+
+class MerkleDispute(object):
+    """The MerkleDispute locates the leaves in which the tree of another party differs from the own
+    tree, knowing only the root of the other tree. Each round the hashes of the descendants of the
+    differing nodes are requested, the received hashes are trusted only if they fold into the
+    already trusted hash of their ancestor.
+    """
+
+    def __init__(self, tree, root):
+        """Starts a dispute about the given root.
+
+        Arguments:
+            tree {MerkleTree} -- Own tree
+            root {string} -- Binary root of the tree of the other party
+        """
+
+        self.tree = tree
+        self.trusted = {1: root}
+        self.differing = [1] if tree.root() != root else []
+
+    def is_resolved(self):
+        """Returns whether all differing nodes are leaves.
+        """
+        return all(self.tree.is_leaf(node) for node in self.differing)
+
+    def requested_nodes(self):
+        """Returns the nodes whose hashes are needed for the next round.
+        """
+        return [descendant for node in self.differing for descendant in self.tree.descendants(node)]
+
+    def receive(self, nodes, hashes):
+        """Takes the hashes of the requested nodes of the other tree.
+
+        Arguments:
+            nodes {[int]} -- Requested nodes
+            hashes {[string]} -- Hashes of the nodes in the other tree
+
+        Returns:
+            bool -- False if the hashes do not match the trusted hashes of their ancestors
+        """
+
+        if list(nodes) != self.requested_nodes() or len(nodes) != len(hashes):
+            return False
+
+        received = dict(zip(nodes, hashes))
+        differing = []
+        for node in self.differing:
+            descendants = self.tree.descendants(node)
+            if fold([received[descendant] for descendant in descendants]) != self.trusted[node]:
+                return False
+            for descendant in descendants:
+                self.trusted[descendant] = received[descendant]
+                if received[descendant] != self.tree.nodes[descendant]:
+                    differing.append(descendant)
+
+        self.differing = differing
+        return True
+
+    def differing_positions(self):
+        """Returns the leaf positions of the blocks that differ, once the dispute is resolved.
+        """
+        return [node - self.tree.width for node in self.differing]
+
+    def is_differing_block(self, block):
+        """Returns whether the block is the version of the other party of a differing leaf.
+        """
+        leaf_hash = sha256(LEAF_PREFIX + block.hash).digest()
+        return any(self.trusted[node] == leaf_hash for node in self.differing)
@@ -0,0 +1,110 @@
+"""Module defining the encoding of block payloads in messages.
+
+Payloads of transactions and exchanges are encoded as msg.Payload, integers as varints and the
+hex encoded transfer hashes as raw digests. The encoding is prefixed with TYPED_PAYLOAD, payloads
+that do not fit msg.Payload and payloads of old data are pickled.
+"""
+import pickle
+
+import src.communication.messages_pb2 as msg
+
+TYPED_PAYLOAD = '\x01'
+INTEGER_FIELDS = ('up', 'down', 'chain_up', 'chain_down', 'hash_version')
+DIGEST_FIELDS = ('transfer_up', 'transfer_down')
+DIGEST_SIZE = 32
+
+
+def is_digest(value):
+    """Returns whether the value is empty or a lowercase hex encoded digest, which can be restored
+    exactly from the raw digest.
+    """
+    if type(value) is not str:
+        return False
+    return value == '' or (len(value) == 2 * DIGEST_SIZE and value == value.lower() and
+                           all(c in '0123456789abcdef' for c in value))
+
+
+def fits_typed_payload(transaction):
+    """Returns whether the transaction can be encoded as msg.Payload without changing the decoded
+    transaction, and therefore the hash of the block.
+
+    Arguments:
+        transaction {dict} -- Payload of a block
+    """
+    if type(transaction) is not dict:
+        return False
+    for key, value in transaction.iteritems():
+        if key in INTEGER_FIELDS:
+            if type(value) is not int:
+                return False
+        elif key in DIGEST_FIELDS:
+            if not is_digest(value):
+                return False
+        else:
+            return False
+    return True
+
+
+def encode_payload(transaction):
+    """Encodes the payload of a block for a message.
+
+    Arguments:
+        transaction {dict} -- Payload of a block
+
+    Returns:
+        string -- Encoded payload
+    """
+    if not fits_typed_payload(transaction):
+        return pickle.dumps(transaction)
+
+    payload = msg.Payload()
+    for key, value in transaction.iteritems():
+        setattr(payload, key, value.decode('hex') if key in DIGEST_FIELDS else value)
+    return TYPED_PAYLOAD + payload.SerializeToString()
+
+
+def parse_payload(data):
+    """Parses an encoded payload without converting it to a transaction.
+
+    Arguments:
+        data {string} -- Encoded payload
+
+    Returns:
+        msg.Payload -- The typed payload or None if the payload is pickled
+    """
+    if not data.startswith(TYPED_PAYLOAD):
+        return None
+
+    payload = msg.Payload()
+    payload.ParseFromString(data[len(TYPED_PAYLOAD):])
+    return payload
+
+
+def payload_field(payload, key):
+    """Returns a field of a typed payload the way it is stored in the transaction, or None if the
+    field is not set.
+
+    Arguments:
+        payload {msg.Payload} -- Typed payload
+        key {string} -- Name of the field
+    """
+    if not payload.HasField(key):
+        return None
+    value = getattr(payload, key)
+    return value.encode('hex') if key in DIGEST_FIELDS else int(value)
+
+
+def decode_payload(data):
+    """Decodes the payload of a block, typed or pickled.
+
+    Arguments:
+        data {string} -- Encoded payload
+
+    Returns:
+        dict -- Payload of the block
+    """
+    payload = parse_payload(data)
+    if payload is None:
+        return pickle.loads(data)
+
+    return {field.name: payload_field(payload, field.name) for field, _ in payload.ListFields()}
@@ -0,0 +1,47 @@
+"""Module defining the ReplacementOverlay class.
+"""
+
+
+class ReplacementOverlay(object):
+    """The ReplacementOverlay applies the replacement rules of a partner to blocks read from the
+    database, in order to see the blocks the way that partner saw them. A rule (block1, block2)
+    replaces block1 by block2, both blocks of a double spend share the public key and sequence
+    number. The rules are grouped by public key and sequence number, such that a block is only
+    compared with the rules for its own position.
+    """
+
+    def __init__(self, rules=[]):
+        """Creates an overlay for the given rules.
+
+        Keyword Arguments:
+            rules {[(Block, Block)]} -- Replacement rules, first element the block to be replaced
+                and second element the block to fill in (default: {[]})
+        """
+
+        self.rules = {}
+        for block1, block2 in rules:
+            self.rules.setdefault((str(block1.public_key), block1.sequence_number), []).append(
+                (block1.hash, block2))
+
+    def replace(self, public_key, sequence_number, block_hash):
+        """Returns the block that replaces the block with the given position and hash. The rules
+        are applied in the order they were added, a block filled in by a rule can be replaced by a
+        later rule again.
+
+        Arguments:
+            public_key {string} -- Binary public key of the block
+            sequence_number {int} -- Sequence number of the block
+            block_hash {string} -- Binary hash of the block
+
+        Returns:
+            Block -- The replacing block or None if no rule applies
+        """
+
+        replacement = None
+        block_hash = str(block_hash)
+        for replaced_hash, block in self.rules.get((str(public_key), sequence_number), []):
+            if replaced_hash == block_hash:
+                replacement = block
+                block_hash = block.hash
+
+        return replacement
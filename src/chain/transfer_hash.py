@@ -0,0 +1,137 @@
+"""Module defining the hashes of the block sets that are transferred in an exchange.
+
+Three versions exist. The SORTED_HASH is the SHA-256 of the concatenated sorted block hashes, which
+has to be recomputed from all blocks whenever the set changes. The MULTISET_HASH is the product of
+the block hashes mapped into the multiplicative group modulo a 2048 bit prime, blocks can be added
+to and removed from the product one at a time. The MERKLE_HASH is the root of a MerkleTree, which
+allows disputes about an exchange to be resolved without resending all of its blocks.
+"""
+from hashlib import sha256
+
+import src.communication.messages_pb2 as msg
+from src.chain.merkle_tree import MerkleTree
+
+# 2048 bit MODP prime of RFC 3526, group 14
+MULTISET_MODULUS = int(
+    'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74020BBEA63B139B22514A08798E3404'
+    'DDEF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406'
+    'B7EDEE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF0598DA48361C55D39A69163FA8FD'
+    '24CF5F83655D23DCA3AD961C62F356208552BB9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E46'
+    '2E36CE3BE39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF6955817183995497CEA956AE515D226'
+    '1898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF', 16)
+MULTISET_DIGESTS = 8
+
+
+def multiset_element(block_hash):
+    """Maps a block hash to an element of the multiplicative group modulo MULTISET_MODULUS.
+
+    Arguments:
+        block_hash {string} -- Binary hash of a block
+    """
+    data = ''.join(sha256(chr(i) + block_hash).digest() for i in xrange(MULTISET_DIGESTS))
+    return int(data.encode('hex'), 16) % MULTISET_MODULUS or 1
+
+
+class MultisetHash(object):
+    """The MultisetHash is an incremental hash of a multiset of block hashes. Adding or removing a
+    block costs a single multiplication, independent of the size of the set. Removed blocks are
+    collected in a separate product, which is only inverted when the digest is taken. Removing a
+    block that was never added does not raise, it yields the digest of a different set.
+    """
+
+    def __init__(self, block_hashes=[]):
+        """Creates the hash of the given block hashes.
+
+        Keyword Arguments:
+            block_hashes {[string]} -- Binary hashes of the blocks in the set (default: {[]})
+        """
+
+        self.added = 1
+        self.removed = 1
+        self.size = 0
+        for block_hash in block_hashes:
+            self.add(block_hash)
+
+    @classmethod
+    def of(cls, blocks):
+        """Creates the hash of a list of blocks.
+
+        Arguments:
+            blocks {[Block]} -- Blocks in the set
+        """
+        return cls([block.hash for block in blocks])
+
+    def add(self, block_hash):
+        """Adds a block to the set.
+
+        Arguments:
+            block_hash {string} -- Binary hash of the block
+        """
+        self.added = self.added * multiset_element(block_hash) % MULTISET_MODULUS
+        self.size += 1
+
+    def remove(self, block_hash):
+        """Removes a block from the set.
+
+        Arguments:
+            block_hash {string} -- Binary hash of the block
+        """
+        self.removed = self.removed * multiset_element(block_hash) % MULTISET_MODULUS
+        self.size -= 1
+
+    def replace(self, old_hash, new_hash):
+        """Returns the hash of the set in which one block is swapped for another, the set itself is
+        not changed.
+
+        Arguments:
+            old_hash {string} -- Binary hash of the block to be removed
+            new_hash {string} -- Binary hash of the block to fill in
+        """
+        replaced = self.copy()
+        replaced.remove(old_hash)
+        replaced.add(new_hash)
+        return replaced
+
+    def copy(self):
+        result = MultisetHash()
+        result.added, result.removed, result.size = self.added, self.removed, self.size
+        return result
+
+    def digest(self):
+        """Returns the binary digest of the set, the empty string for an empty set.
+        """
+
+        if self.size == 0:
+            return ''
+        if self.removed != 1:
+            self.added = self.added * pow(self.removed, MULTISET_MODULUS - 2, MULTISET_MODULUS) % \
+                MULTISET_MODULUS
+            self.removed = 1
+        return sha256(('%0512x' % self.added).decode('hex')).digest()
+
+
+def blocks_to_hash(blocks, version=msg.SORTED_HASH):
+    """Takes a list of blocks and creates a hash that includes the hashes of all blocks contained.
+
+    Arguments:
+        blocks {[Block]} -- List of blocks.
+
+    Keyword Arguments:
+        version {msg.ExchangeHash} -- Version of the hash (default: {msg.SORTED_HASH})
+
+    Returns:
+        string -- Binary digest, the empty string if there are no blocks
+    """
+
+    if version == msg.MULTISET_HASH:
+        return MultisetHash.of(blocks).digest()
+    if version == msg.MERKLE_HASH:
+        return MerkleTree.of(blocks).root()
+    if version != msg.SORTED_HASH:
+        raise Exception("Unknown exchange hash version %s" % version)
+
+    list_of_hashes = sorted([block.hash for block in blocks])
+    hash_string = ''.join(list_of_hashes)
+    if hash_string == '':
+        return ''
+    return sha256(hash_string).digest()
@@ -0,0 +1,138 @@
+"""Module defining the ChainVerifier class.
+"""
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from tornado import ioloop
+
+from src.pyipv8.ipv8.keyvault.crypto import ECCrypto
+from src.pyipv8.ipv8.attestation.trustchain.block import GENESIS_HASH, GENESIS_SEQ
+from src.chain.block_cache import DEFAULT_CACHE_SIZE
+
+# Number of signatures a worker verifies at once
+VERIFICATION_BATCH_SIZE = 200
+
+
+def verify_signatures(entries):
+    """Verifies the signatures of a batch of blocks.
+
+    Arguments:
+        entries {[(string, string, string)]} -- Binary public key, packed block without signature
+            and signature of each block
+
+    Returns:
+        [bool] -- Whether each signature is valid
+    """
+
+    crypto = ECCrypto()
+    keys = {}
+    results = []
+    for public_key, data, signature in entries:
+        try:
+            key = keys.get(public_key)
+            if key is None:
+                key = keys[public_key] = crypto.key_from_public_bin(public_key)
+            results.append(crypto.is_valid_signature(key, data, signature))
+        except Exception:
+            results.append(False)
+    return results
+
+
+def links_are_valid(chain):
+    """Checks that each block of a chain references the hash of its predecessor, for blocks whose
+    predecessor is part of the chain, and that the first block references the genesis hash.
+
+    Arguments:
+        chain {[Block]} -- Blocks of a single public key
+    """
+
+    blocks = {block.sequence_number: block for block in chain}
+    for block in chain:
+        if block.sequence_number == GENESIS_SEQ:
+            if block.previous_hash != GENESIS_HASH:
+                return False
+            continue
+        previous = blocks.get(block.sequence_number - 1)
+        if previous is not None and block.previous_hash != previous.hash:
+            return False
+    return True
+
+
+class ChainVerifier(object):
+    """The ChainVerifier checks the integrity of received blocks, that is the signatures of all
+    blocks and the hash links of a chain. Signatures are verified in batches by a pool of worker
+    threads, such that the IOLoop is not blocked, and the outcome of the most recently verified
+    blocks is cached by block hash. When the cache is full the least recently used outcome is
+    evicted. Without workers the blocks are verified directly.
+    """
+
+    def __init__(self, workers=0, cache_size=DEFAULT_CACHE_SIZE):
+        """Creates a verifier.
+
+        Keyword Arguments:
+            workers {int} -- Number of worker threads, 0 verifies in the calling thread
+                (default: {0})
+            cache_size {int} -- Maximum number of cached outcomes, 0 disables the cache
+                (default: {DEFAULT_CACHE_SIZE})
+        """
+
+        self.workers = workers
+        self.pool = ThreadPool(workers) if workers > 0 else None
+        self.cache_size = cache_size
+        self.verified = OrderedDict()
+
+    def verify(self, chain, blocks, callback):
+        """Verifies the signatures of the chain and the blocks and the hash links of the chain. The
+        result is passed to the callback, on the IOLoop if the verification is done by the workers.
+
+        Arguments:
+            chain {[Block]} -- Chain of a single public key
+            blocks {[Block]} -- Further blocks of arbitrary public keys
+            callback {function} -- Called with True if all checks pass, False otherwise
+        """
+
+        if not links_are_valid(chain):
+            callback(False)
+            return
+
+        known = True
+        unverified = OrderedDict()
+        for block in list(chain) + list(blocks):
+            block_hash = block.hash
+            valid = self.verified.pop(block_hash, None)
+            if valid is None:
+                unverified[block_hash] = (block.public_key, block.pack(signature=False),
+                                          block.signature)
+            else:
+                self.verified[block_hash] = valid
+                known = known and valid
+
+        hashes = unverified.keys()
+        if not hashes:
+            callback(known)
+            return
+
+        batches = [[unverified[block_hash] for block_hash in hashes[i:i + VERIFICATION_BATCH_SIZE]]
+                   for i in xrange(0, len(hashes), VERIFICATION_BATCH_SIZE)]
+
+        def done(results):
+            results = [valid for batch in results for valid in batch]
+            for block_hash, valid in zip(hashes, results):
+                self._remember(block_hash, valid)
+            callback(known and all(results))
+
+        if self.pool is None:
+            done(map(verify_signatures, batches))
+        else:
+            loop = ioloop.IOLoop.current()
+            self.pool.map_async(verify_signatures, batches,
+                                callback=lambda results: loop.add_callback(done, results))
+
+    def _remember(self, block_hash, valid):
+        if self.cache_size <= 0:
+            return
+
+        self.verified.pop(block_hash, None)
+        self.verified[block_hash] = valid
+        while len(self.verified) > self.cache_size:
+            self.verified.popitem(last=False)
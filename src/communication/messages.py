@@ -74,7 +74,10 @@ type_to_attribute = {
     msg.PROTECT_INDEX_REQUEST: "empty",
     msg.PROTECT_INDEX_REPLY: "ex_index",
     msg.PROTECT_EXCHANGE_REQUEST: "ex_hash",
-    msg.PROTECT_EXCHANGE_REPLY: "db"
+    msg.PROTECT_EXCHANGE_REPLY: "db",
+    msg.PROTECT_SKETCH_REQUEST: "ex_sketch",
+    msg.PROTECT_SKETCH_REPLY: "ex_sketch_reply",
+    msg.PROTECT_EXCHANGE_PROOF: "ex_proof"
 }
 
 
@@ -19,7 +19,7 @@ _sym_db = _symbol_database.Default()
 DESCRIPTOR = _descriptor.FileDescriptor(
   name='src/communication/messages.proto',
   package='',
-  serialized_pb=_b('\n src/communication/messages.proto\"\x07\n\x05\x45mpty\">\n\tAgentInfo\x12\x12\n\npublic_key\x18\x01 \x02(\t\x12\x0f\n\x07\x61\x64\x64ress\x18\x02 \x02(\t\x12\x0c\n\x04type\x18\x03 \x02(\t\"%\n\x08Register\x12\x19\n\x05\x61gent\x18\x01 \x02(\x0b\x32\n.AgentInfo\"\'\n\nUnregister\x12\x19\n\x05\x61gent\x18\x01 \x02(\x0b\x32\n.AgentInfo\"(\n\nAgentReply\x12\x1a\n\x06\x61gents\x18\x01 \x03(\x0b\x32\n.AgentInfo\"\xfd\x02\n\x0eWrapperMessage\x12\x13\n\x04type\x18\x01 \x02(\x0e\x32\x05.Type\x12\x0f\n\x07\x61\x64\x64ress\x18\x02 \x02(\t\x12\x17\n\x05\x65mpty\x18\n \x01(\x0b\x32\x06.EmptyH\x00\x12\x1d\n\x08register\x18\x0b \x01(\x0b\x32\t.RegisterH\x00\x12\"\n\x0b\x61gent_reply\x18\x0c \x01(\x0b\x32\x0b.AgentReplyH\x00\x12!\n\nunregister\x18\r \x01(\x0b\x32\x0b.UnregisterH\x00\x12\x17\n\x05\x62lock\x18\x0e \x01(\x0b\x32\x06.BlockH\x00\x12\x17\n\x02\x64\x62\x18\x0f \x01(\x0b\x32\t.DatabaseH\x00\x12\x1c\n\x05index\x18\x10 \x01(\x0b\x32\x0b.BlockIndexH\x00\x12&\n\x0b\x63hain_index\x18\x11 \x01(\x0b\x32\x0f.ChainAndBlocksH\x00\x12\"\n\x08\x65x_index\x18\x12 \x01(\x0b\x32\x0e.ExchangeIndexH\x00\x12#\n\x07\x65x_hash\x18\x13 \x01(\x0b\x32\x10.ExchangeRequestH\x00\x42\x05\n\x03msg\"\xc9\x01\n\x05\x42lock\x12\x0f\n\x07payload\x18\x01 \x02(\x0c\x12\x12\n\npublic_key\x18\x02 \x02(\x0c\x12\x17\n\x0fsequence_number\x18\x03 \x02(\x05\x12\x17\n\x0flink_public_key\x18\x04 \x02(\x0c\x12\x1c\n\x14link_sequence_number\x18\x05 \x02(\x05\x12\x15\n\rprevious_hash\x18\x06 \x02(\x0c\x12\x11\n\tsignature\x18\x07 \x02(\x0c\x12\x0c\n\x04hash\x18\x08 \x01(\x0c\x12\x13\n\x0binsert_time\x18\t \x01(\x0c\"<\n\x08\x44\x61tabase\x12\x18\n\x04info\x18\x01 \x02(\x0b\x32\n.AgentInfo\x12\x16\n\x06\x62locks\x18\x02 \x03(\x0b\x32\x06.Block\"D\n\x12\x45xchangeIndexEntry\x12\x12\n\nblock_hash\x18\x01 \x02(\x0c\x12\x1a\n\x05index\x18\x02 \x02(\x0b\x32\x0b.BlockIndex\"5\n\rExchangeIndex\x12$\n\x07\x65ntries\x18\x01 \x03(\x0b\x32\x13.ExchangeIndexEntry\"?\n\x0f\x42lockIndexEntry\x12\x12\n\npublic_key\x18\x01 \x02(\x0c\x12\x18\n\x10sequence_numbers\x18\x02 \x03(\x05\"/\n\nBlockIndex\x12!\n\x07\x65ntries\x18\x01 \x03(\x0b\x32\x10.BlockIndexEntry\"a\n\x0e\x43hainAndBlocks\x12\x15\n\x05\x63hain\x18\x01 \x03(\x0b\x32\x06.Block\x12\x16\n\x06\x62locks\x18\x02 \x03(\x0b\x32\x06.Block\x12 \n\x08\x65xchange\x18\x03 \x02(\x0b\x32\x0e.ExchangeIndex\"(\n\x0f\x45xchangeRequest\x12\x15\n\rexchange_hash\x18\x01 \x02(\x0c*\x8f\x03\n\x04Type\x12\x0c\n\x08REGISTER\x10\x01\x12\x0f\n\x0b\x41GENT_REPLY\x10\x02\x12\x11\n\rAGENT_REQUEST\x10\x03\x12\x0e\n\nUNREGISTER\x10\x04\x12\x12\n\x0e\x42LOCK_PROPOSAL\x10\x05\x12\x13\n\x0f\x42LOCK_AGREEMENT\x10\x06\x12\x11\n\rPROTECT_CHAIN\x10\x07\x12\x1a\n\x16PROTECT_BLOCKS_REQUEST\x10\x08\x12\x18\n\x14PROTECT_BLOCKS_REPLY\x10\t\x12\x18\n\x14PROTECT_CHAIN_BLOCKS\x10\n\x12\x1a\n\x16PROTECT_BLOCK_PROPOSAL\x10\x0b\x12\x1b\n\x17PROTECT_BLOCK_AGREEMENT\x10\x0c\x12\x12\n\x0ePROTECT_REJECT\x10\r\x12\x19\n\x15PROTECT_INDEX_REQUEST\x10\x0e\x12\x17\n\x13PROTECT_INDEX_REPLY\x10\x0f\x12\x1c\n\x18PROTECT_EXCHANGE_REQUEST\x10\x10\x12\x1a\n\x16PROTECT_EXCHANGE_REPLY\x10\x11')
+  serialized_pb=_b('\n src/communication/messages.proto\"\x07\n\x05\x45mpty\"\xcb\x01\n\tAgentInfo\x12\x12\n\npublic_key\x18\x01 \x02(\t\x12\x0f\n\x07\x61\x64\x64ress\x18\x02 \x02(\t\x12\x0c\n\x04type\x18\x03 \x02(\t\x12\x38\n\x0eindex_encoding\x18\x04 \x01(\x0e\x32\x0e.IndexEncoding:\x10SEQUENCE_NUMBERS\x12\x1e\n\x0f\x65xchange_sketch\x18\x05 \x01(\x08:\x05\x66\x61lse\x12\x31\n\rexchange_hash\x18\x06 \x01(\x0e\x32\r.ExchangeHash:\x0bSORTED_HASH\"%\n\x08Register\x12\x19\n\x05\x61gent\x18\x01 \x02(\x0b\x32\n.AgentInfo\"\'\n\nUnregister\x12\x19\n\x05\x61gent\x18\x01 \x02(\x0b\x32\n.AgentInfo\"(\n\nAgentReply\x12\x1a\n\x06\x61gents\x18\x01 \x03(\x0b\x32\n.AgentInfo\"\xf8\x03\n\x0eWrapperMessage\x12\x13\n\x04type\x18\x01 \x02(\x0e\x32\x05.Type\x12\x0f\n\x07\x61\x64\x64ress\x18\x02 \x02(\t\x12\x17\n\x05\x65mpty\x18\n \x01(\x0b\x32\x06.EmptyH\x00\x12\x1d\n\x08register\x18\x0b \x01(\x0b\x32\t.RegisterH\x00\x12\"\n\x0b\x61gent_reply\x18\x0c \x01(\x0b\x32\x0b.AgentReplyH\x00\x12!\n\nunregister\x18\r \x01(\x0b\x32\x0b.UnregisterH\x00\x12\x17\n\x05\x62lock\x18\x0e \x01(\x0b\x32\x06.BlockH\x00\x12\x17\n\x02\x64\x62\x18\x0f \x01(\x0b\x32\t.DatabaseH\x00\x12\x1c\n\x05index\x18\x10 \x01(\x0b\x32\x0b.BlockIndexH\x00\x12&\n\x0b\x63hain_index\x18\x11 \x01(\x0b\x32\x0f.ChainAndBlocksH\x00\x12\"\n\x08\x65x_index\x18\x12 \x01(\x0b\x32\x0e.ExchangeIndexH\x00\x12#\n\x07\x65x_hash\x18\x13 \x01(\x0b\x32\x10.ExchangeRequestH\x00\x12$\n\tex_sketch\x18\x14 \x01(\x0b\x32\x0f.ExchangeSketchH\x00\x12/\n\x0f\x65x_sketch_reply\x18\x15 \x01(\x0b\x32\x14.ExchangeSketchReplyH\x00\x12\"\n\x08\x65x_proof\x18\x16 \x01(\x0b\x32\x0e.ExchangeProofH\x00\x42\x05\n\x03msg\"\xc9\x01\n\x05\x42lock\x12\x0f\n\x07payload\x18\x01 \x02(\x0c\x12\x12\n\npublic_key\x18\x02 \x02(\x0c\x12\x17\n\x0fsequence_number\x18\x03 \x02(\x05\x12\x17\n\x0flink_public_key\x18\x04 \x02(\x0c\x12\x1c\n\x14link_sequence_number\x18\x05 \x02(\x05\x12\x15\n\rprevious_hash\x18\x06 \x02(\x0c\x12\x11\n\tsignature\x18\x07 \x02(\x0c\x12\x0c\n\x04hash\x18\x08 \x01(\x0c\x12\x13\n\x0binsert_time\x18\t \x01(\x0c\"\x8b\x01\n\x07Payload\x12\n\n\x02up\x18\x01 \x01(\x12\x12\x0c\n\x04\x64own\x18\x02 \x01(\x12\x12\x13\n\x0btransfer_up\x18\x03 \x01(\x0c\x12\x15\n\rtransfer_down\x18\x04 \x01(\x0c\x12\x10\n\x08\x63hain_up\x18\x05 \x01(\x12\x12\x12\n\nchain_down\x18\x06 \x01(\x12\x12\x14\n\x0chash_version\x18\x07 \x01(\x12\"<\n\x08\x44\x61tabase\x12\x18\n\x04info\x18\x01 \x02(\x0b\x32\n.AgentInfo\x12\x16\n\x06\x62locks\x18\x02 \x03(\x0b\x32\x06.Block\"D\n\x12\x45xchangeIndexEntry\x12\x12\n\nblock_hash\x18\x01 \x02(\x0c\x12\x1a\n\x05index\x18\x02 \x02(\x0b\x32\x0b.BlockIndex\"5\n\rExchangeIndex\x12$\n\x07\x65ntries\x18\x01 \x03(\x0b\x32\x13.ExchangeIndexEntry\"S\n\x0f\x42lockIndexEntry\x12\x12\n\npublic_key\x18\x01 \x02(\x0c\x12\x18\n\x10sequence_numbers\x18\x02 \x03(\x05\x12\x12\n\x06ranges\x18\x03 \x03(\rB\x02\x10\x01\"/\n\nBlockIndex\x12!\n\x07\x65ntries\x18\x01 \x03(\x0b\x32\x10.BlockIndexEntry\"a\n\x0e\x43hainAndBlocks\x12\x15\n\x05\x63hain\x18\x01 \x03(\x0b\x32\x06.Block\x12\x16\n\x06\x62locks\x18\x02 \x03(\x0b\x32\x06.Block\x12 \n\x08\x65xchange\x18\x03 \x02(\x0b\x32\x0e.ExchangeIndex\"O\n\x0f\x45xchangeRequest\x12\x15\n\rexchange_hash\x18\x01 \x02(\x0c\x12\x11\n\x05nodes\x18\x02 \x03(\rB\x02\x10\x01\x12\x12\n\x06leaves\x18\x03 \x03(\rB\x02\x10\x01\"I\n\rExchangeProof\x12\x15\n\rexchange_hash\x18\x01 \x02(\x0c\x12\x11\n\x05nodes\x18\x02 \x03(\rB\x02\x10\x01\x12\x0e\n\x06hashes\x18\x03 \x03(\x0c\"M\n\x0e\x45xchangeSketch\x12\x12\n\x06\x63ounts\x18\x01 \x03(\x11\x42\x02\x10\x01\x12\x10\n\x08key_sums\x18\x02 \x03(\x0c\x12\x15\n\thash_sums\x18\x03 \x03(\rB\x02\x10\x01\"`\n\x13\x45xchangeSketchReply\x12\x0f\n\x07\x64\x65\x63oded\x18\x01 \x02(\x08\x12 \n\x08\x65xchange\x18\x02 \x02(\x0b\x32\x0e.ExchangeIndex\x12\x16\n\x0eunknown_hashes\x18\x03 \x03(\x0c*\xe1\x03\n\x04Type\x12\x0c\n\x08REGISTER\x10\x01\x12\x0f\n\x0b\x41GENT_REPLY\x10\x02\x12\x11\n\rAGENT_REQUEST\x10\x03\x12\x0e\n\nUNREGISTER\x10\x04\x12\x12\n\x0e\x42LOCK_PROPOSAL\x10\x05\x12\x13\n\x0f\x42LOCK_AGREEMENT\x10\x06\x12\x11\n\rPROTECT_CHAIN\x10\x07\x12\x1a\n\x16PROTECT_BLOCKS_REQUEST\x10\x08\x12\x18\n\x14PROTECT_BLOCKS_REPLY\x10\t\x12\x18\n\x14PROTECT_CHAIN_BLOCKS\x10\n\x12\x1a\n\x16PROTECT_BLOCK_PROPOSAL\x10\x0b\x12\x1b\n\x17PROTECT_BLOCK_AGREEMENT\x10\x0c\x12\x12\n\x0ePROTECT_REJECT\x10\r\x12\x19\n\x15PROTECT_INDEX_REQUEST\x10\x0e\x12\x17\n\x13PROTECT_INDEX_REPLY\x10\x0f\x12\x1c\n\x18PROTECT_EXCHANGE_REQUEST\x10\x10\x12\x1a\n\x16PROTECT_EXCHANGE_REPLY\x10\x11\x12\x1a\n\x16PROTECT_SKETCH_REQUEST\x10\x12\x12\x18\n\x14PROTECT_SKETCH_REPLY\x10\x13\x12\x1a\n\x16PROTECT_EXCHANGE_PROOF\x10\x14*1\n\rIndexEncoding\x12\x14\n\x10SEQUENCE_NUMBERS\x10\x01\x12\n\n\x06RANGES\x10\x02*C\n\x0c\x45xchangeHash\x12\x0f\n\x0bSORTED_HASH\x10\x01\x12\x11\n\rMULTISET_HASH\x10\x02\x12\x0f\n\x0bMERKLE_HASH\x10\x03')
 )
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
 
@@ -97,15 +97,77 @@ _TYPE = _descriptor.EnumDescriptor(
       name='PROTECT_EXCHANGE_REPLY', index=16, number=17,
       options=None,
       type=None),
+    _descriptor.EnumValueDescriptor(
+      name='PROTECT_SKETCH_REQUEST', index=17, number=18,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='PROTECT_SKETCH_REPLY', index=18, number=19,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='PROTECT_EXCHANGE_PROOF', index=19, number=20,
+      options=None,
+      type=None),
   ],
   containing_type=None,
   options=None,
-  serialized_start=1262,
-  serialized_end=1661,
+  serialized_start=1980,
+  serialized_end=2461,
 )
 _sym_db.RegisterEnumDescriptor(_TYPE)
 
 Type = enum_type_wrapper.EnumTypeWrapper(_TYPE)
+_INDEXENCODING = _descriptor.EnumDescriptor(
+  name='IndexEncoding',
+  full_name='IndexEncoding',
+  filename=None,
+  file=DESCRIPTOR,
+  values=[
+    _descriptor.EnumValueDescriptor(
+      name='SEQUENCE_NUMBERS', index=0, number=1,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='RANGES', index=1, number=2,
+      options=None,
+      type=None),
+  ],
+  containing_type=None,
+  options=None,
+  serialized_start=2463,
+  serialized_end=2512,
+)
+_sym_db.RegisterEnumDescriptor(_INDEXENCODING)
+
+IndexEncoding = enum_type_wrapper.EnumTypeWrapper(_INDEXENCODING)
+_EXCHANGEHASH = _descriptor.EnumDescriptor(
+  name='ExchangeHash',
+  full_name='ExchangeHash',
+  filename=None,
+  file=DESCRIPTOR,
+  values=[
+    _descriptor.EnumValueDescriptor(
+      name='SORTED_HASH', index=0, number=1,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='MULTISET_HASH', index=1, number=2,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='MERKLE_HASH', index=2, number=3,
+      options=None,
+      type=None),
+  ],
+  containing_type=None,
+  options=None,
+  serialized_start=2514,
+  serialized_end=2581,
+)
+_sym_db.RegisterEnumDescriptor(_EXCHANGEHASH)
+
+ExchangeHash = enum_type_wrapper.EnumTypeWrapper(_EXCHANGEHASH)
 REGISTER = 1
 AGENT_REPLY = 2
 AGENT_REQUEST = 3
@@ -123,6 +185,14 @@ PROTECT_INDEX_REQUEST = 14
 PROTECT_INDEX_REPLY = 15
 PROTECT_EXCHANGE_REQUEST = 16
 PROTECT_EXCHANGE_REPLY = 17
+PROTECT_SKETCH_REQUEST = 18
+PROTECT_SKETCH_REPLY = 19
+PROTECT_EXCHANGE_PROOF = 20
+SEQUENCE_NUMBERS = 1
+RANGES = 2
+SORTED_HASH = 1
+MULTISET_HASH = 2
+MERKLE_HASH = 3
 
 
 
@@ -177,6 +247,27 @@ _AGENTINFO = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='index_encoding', full_name='AgentInfo.index_encoding', index=3,
+      number=4, type=14, cpp_type=8, label=1,
+      has_default_value=True, default_value=1,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='exchange_sketch', full_name='AgentInfo.exchange_sketch', index=4,
+      number=5, type=8, cpp_type=7, label=1,
+      has_default_value=True, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='exchange_hash', full_name='AgentInfo.exchange_hash', index=5,
+      number=6, type=14, cpp_type=8, label=1,
+      has_default_value=True, default_value=1,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -188,8 +279,8 @@ _AGENTINFO = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=45,
-  serialized_end=107,
+  serialized_start=46,
+  serialized_end=249,
 )
 
 
@@ -218,8 +309,8 @@ _REGISTER = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=109,
-  serialized_end=146,
+  serialized_start=251,
+  serialized_end=288,
 )
 
 
@@ -248,8 +339,8 @@ _UNREGISTER = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=148,
-  serialized_end=187,
+  serialized_start=290,
+  serialized_end=329,
 )
 
 
@@ -278,8 +369,8 @@ _AGENTREPLY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=189,
-  serialized_end=229,
+  serialized_start=331,
+  serialized_end=371,
 )
 
 
@@ -374,6 +465,27 @@ _WRAPPERMESSAGE = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='ex_sketch', full_name='WrapperMessage.ex_sketch', index=12,
+      number=20, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='ex_sketch_reply', full_name='WrapperMessage.ex_sketch_reply', index=13,
+      number=21, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='ex_proof', full_name='WrapperMessage.ex_proof', index=14,
+      number=22, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -388,8 +500,8 @@ _WRAPPERMESSAGE = _descriptor.Descriptor(
       name='msg', full_name='WrapperMessage.msg',
       index=0, containing_type=None, fields=[]),
   ],
-  serialized_start=232,
-  serialized_end=613,
+  serialized_start=374,
+  serialized_end=878,
 )
 
 
@@ -474,8 +586,80 @@ _BLOCK = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=616,
-  serialized_end=817,
+  serialized_start=881,
+  serialized_end=1082,
+)
+
+
+_PAYLOAD = _descriptor.Descriptor(
+  name='Payload',
+  full_name='Payload',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='up', full_name='Payload.up', index=0,
+      number=1, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='down', full_name='Payload.down', index=1,
+      number=2, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='transfer_up', full_name='Payload.transfer_up', index=2,
+      number=3, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='transfer_down', full_name='Payload.transfer_down', index=3,
+      number=4, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='chain_up', full_name='Payload.chain_up', index=4,
+      number=5, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='chain_down', full_name='Payload.chain_down', index=5,
+      number=6, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='hash_version', full_name='Payload.hash_version', index=6,
+      number=7, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1085,
+  serialized_end=1224,
 )
 
 
@@ -511,8 +695,8 @@ _DATABASE = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=819,
-  serialized_end=879,
+  serialized_start=1226,
+  serialized_end=1286,
 )
 
 
@@ -548,8 +732,8 @@ _EXCHANGEINDEXENTRY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=881,
-  serialized_end=949,
+  serialized_start=1288,
+  serialized_end=1356,
 )
 
 
@@ -578,8 +762,8 @@ _EXCHANGEINDEX = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=951,
-  serialized_end=1004,
+  serialized_start=1358,
+  serialized_end=1411,
 )
 
 
@@ -604,6 +788,13 @@ _BLOCKINDEXENTRY = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='ranges', full_name='BlockIndexEntry.ranges', index=2,
+      number=3, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))),
   ],
   extensions=[
   ],
@@ -615,8 +806,8 @@ _BLOCKINDEXENTRY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1006,
-  serialized_end=1069,
+  serialized_start=1413,
+  serialized_end=1496,
 )
 
 
@@ -645,8 +836,8 @@ _BLOCKINDEX = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1071,
-  serialized_end=1118,
+  serialized_start=1498,
+  serialized_end=1545,
 )
 
 
@@ -689,8 +880,8 @@ _CHAINANDBLOCKS = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1120,
-  serialized_end=1217,
+  serialized_start=1547,
+  serialized_end=1644,
 )
 
 
@@ -708,6 +899,64 @@ _EXCHANGEREQUEST = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='nodes', full_name='ExchangeRequest.nodes', index=1,
+      number=2, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))),
+    _descriptor.FieldDescriptor(
+      name='leaves', full_name='ExchangeRequest.leaves', index=2,
+      number=3, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1646,
+  serialized_end=1725,
+)
+
+
+_EXCHANGEPROOF = _descriptor.Descriptor(
+  name='ExchangeProof',
+  full_name='ExchangeProof',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='exchange_hash', full_name='ExchangeProof.exchange_hash', index=0,
+      number=1, type=12, cpp_type=9, label=2,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='nodes', full_name='ExchangeProof.nodes', index=1,
+      number=2, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))),
+    _descriptor.FieldDescriptor(
+      name='hashes', full_name='ExchangeProof.hashes', index=2,
+      number=3, type=12, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -719,10 +968,100 @@ _EXCHANGEREQUEST = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1219,
-  serialized_end=1259,
+  serialized_start=1727,
+  serialized_end=1800,
 )
 
+
+_EXCHANGESKETCH = _descriptor.Descriptor(
+  name='ExchangeSketch',
+  full_name='ExchangeSketch',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='counts', full_name='ExchangeSketch.counts', index=0,
+      number=1, type=17, cpp_type=1, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))),
+    _descriptor.FieldDescriptor(
+      name='key_sums', full_name='ExchangeSketch.key_sums', index=1,
+      number=2, type=12, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='hash_sums', full_name='ExchangeSketch.hash_sums', index=2,
+      number=3, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1802,
+  serialized_end=1879,
+)
+
+
+_EXCHANGESKETCHREPLY = _descriptor.Descriptor(
+  name='ExchangeSketchReply',
+  full_name='ExchangeSketchReply',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='decoded', full_name='ExchangeSketchReply.decoded', index=0,
+      number=1, type=8, cpp_type=7, label=2,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='exchange', full_name='ExchangeSketchReply.exchange', index=1,
+      number=2, type=11, cpp_type=10, label=2,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='unknown_hashes', full_name='ExchangeSketchReply.unknown_hashes', index=2,
+      number=3, type=12, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1881,
+  serialized_end=1977,
+)
+
+_AGENTINFO.fields_by_name['index_encoding'].enum_type = _INDEXENCODING
+_AGENTINFO.fields_by_name['exchange_hash'].enum_type = _EXCHANGEHASH
 _REGISTER.fields_by_name['agent'].message_type = _AGENTINFO
 _UNREGISTER.fields_by_name['agent'].message_type = _AGENTINFO
 _AGENTREPLY.fields_by_name['agents'].message_type = _AGENTINFO
@@ -737,6 +1076,9 @@ _WRAPPERMESSAGE.fields_by_name['index'].message_type = _BLOCKINDEX
 _WRAPPERMESSAGE.fields_by_name['chain_index'].message_type = _CHAINANDBLOCKS
 _WRAPPERMESSAGE.fields_by_name['ex_index'].message_type = _EXCHANGEINDEX
 _WRAPPERMESSAGE.fields_by_name['ex_hash'].message_type = _EXCHANGEREQUEST
+_WRAPPERMESSAGE.fields_by_name['ex_sketch'].message_type = _EXCHANGESKETCH
+_WRAPPERMESSAGE.fields_by_name['ex_sketch_reply'].message_type = _EXCHANGESKETCHREPLY
+_WRAPPERMESSAGE.fields_by_name['ex_proof'].message_type = _EXCHANGEPROOF
 _WRAPPERMESSAGE.oneofs_by_name['msg'].fields.append(
   _WRAPPERMESSAGE.fields_by_name['empty'])
 _WRAPPERMESSAGE.fields_by_name['empty'].containing_oneof = _WRAPPERMESSAGE.oneofs_by_name['msg']
@@ -767,6 +1109,15 @@ _WRAPPERMESSAGE.fields_by_name['ex_index'].containing_oneof = _WRAPPERMESSAGE.on
 _WRAPPERMESSAGE.oneofs_by_name['msg'].fields.append(
   _WRAPPERMESSAGE.fields_by_name['ex_hash'])
 _WRAPPERMESSAGE.fields_by_name['ex_hash'].containing_oneof = _WRAPPERMESSAGE.oneofs_by_name['msg']
+_WRAPPERMESSAGE.oneofs_by_name['msg'].fields.append(
+  _WRAPPERMESSAGE.fields_by_name['ex_sketch'])
+_WRAPPERMESSAGE.fields_by_name['ex_sketch'].containing_oneof = _WRAPPERMESSAGE.oneofs_by_name['msg']
+_WRAPPERMESSAGE.oneofs_by_name['msg'].fields.append(
+  _WRAPPERMESSAGE.fields_by_name['ex_sketch_reply'])
+_WRAPPERMESSAGE.fields_by_name['ex_sketch_reply'].containing_oneof = _WRAPPERMESSAGE.oneofs_by_name['msg']
+_WRAPPERMESSAGE.oneofs_by_name['msg'].fields.append(
+  _WRAPPERMESSAGE.fields_by_name['ex_proof'])
+_WRAPPERMESSAGE.fields_by_name['ex_proof'].containing_oneof = _WRAPPERMESSAGE.oneofs_by_name['msg']
 _DATABASE.fields_by_name['info'].message_type = _AGENTINFO
 _DATABASE.fields_by_name['blocks'].message_type = _BLOCK
 _EXCHANGEINDEXENTRY.fields_by_name['index'].message_type = _BLOCKINDEX
@@ -775,6 +1126,7 @@ _BLOCKINDEX.fields_by_name['entries'].message_type = _BLOCKINDEXENTRY
 _CHAINANDBLOCKS.fields_by_name['chain'].message_type = _BLOCK
 _CHAINANDBLOCKS.fields_by_name['blocks'].message_type = _BLOCK
 _CHAINANDBLOCKS.fields_by_name['exchange'].message_type = _EXCHANGEINDEX
+_EXCHANGESKETCHREPLY.fields_by_name['exchange'].message_type = _EXCHANGEINDEX
 DESCRIPTOR.message_types_by_name['Empty'] = _EMPTY
 DESCRIPTOR.message_types_by_name['AgentInfo'] = _AGENTINFO
 DESCRIPTOR.message_types_by_name['Register'] = _REGISTER
@@ -782,6 +1134,7 @@ DESCRIPTOR.message_types_by_name['Unregister'] = _UNREGISTER
 DESCRIPTOR.message_types_by_name['AgentReply'] = _AGENTREPLY
 DESCRIPTOR.message_types_by_name['WrapperMessage'] = _WRAPPERMESSAGE
 DESCRIPTOR.message_types_by_name['Block'] = _BLOCK
+DESCRIPTOR.message_types_by_name['Payload'] = _PAYLOAD
 DESCRIPTOR.message_types_by_name['Database'] = _DATABASE
 DESCRIPTOR.message_types_by_name['ExchangeIndexEntry'] = _EXCHANGEINDEXENTRY
 DESCRIPTOR.message_types_by_name['ExchangeIndex'] = _EXCHANGEINDEX
@@ -789,7 +1142,12 @@ DESCRIPTOR.message_types_by_name['BlockIndexEntry'] = _BLOCKINDEXENTRY
 DESCRIPTOR.message_types_by_name['BlockIndex'] = _BLOCKINDEX
 DESCRIPTOR.message_types_by_name['ChainAndBlocks'] = _CHAINANDBLOCKS
 DESCRIPTOR.message_types_by_name['ExchangeRequest'] = _EXCHANGEREQUEST
+DESCRIPTOR.message_types_by_name['ExchangeProof'] = _EXCHANGEPROOF
+DESCRIPTOR.message_types_by_name['ExchangeSketch'] = _EXCHANGESKETCH
+DESCRIPTOR.message_types_by_name['ExchangeSketchReply'] = _EXCHANGESKETCHREPLY
 DESCRIPTOR.enum_types_by_name['Type'] = _TYPE
+DESCRIPTOR.enum_types_by_name['IndexEncoding'] = _INDEXENCODING
+DESCRIPTOR.enum_types_by_name['ExchangeHash'] = _EXCHANGEHASH
 
 Empty = _reflection.GeneratedProtocolMessageType('Empty', (_message.Message,), dict(
   DESCRIPTOR = _EMPTY,
@@ -840,6 +1198,13 @@ Block = _reflection.GeneratedProtocolMessageType('Block', (_message.Message,), d
   ))
 _sym_db.RegisterMessage(Block)
 
+Payload = _reflection.GeneratedProtocolMessageType('Payload', (_message.Message,), dict(
+  DESCRIPTOR = _PAYLOAD,
+  __module__ = 'src.communication.messages_pb2'
+  # @@protoc_insertion_point(class_scope:Payload)
+  ))
+_sym_db.RegisterMessage(Payload)
+
 Database = _reflection.GeneratedProtocolMessageType('Database', (_message.Message,), dict(
   DESCRIPTOR = _DATABASE,
   __module__ = 'src.communication.messages_pb2'
@@ -889,5 +1254,38 @@ ExchangeRequest = _reflection.GeneratedProtocolMessageType('ExchangeRequest', (_
   ))
 _sym_db.RegisterMessage(ExchangeRequest)
 
+ExchangeProof = _reflection.GeneratedProtocolMessageType('ExchangeProof', (_message.Message,), dict(
+  DESCRIPTOR = _EXCHANGEPROOF,
+  __module__ = 'src.communication.messages_pb2'
+  # @@protoc_insertion_point(class_scope:ExchangeProof)
+  ))
+_sym_db.RegisterMessage(ExchangeProof)
+
+ExchangeSketch = _reflection.GeneratedProtocolMessageType('ExchangeSketch', (_message.Message,), dict(
+  DESCRIPTOR = _EXCHANGESKETCH,
+  __module__ = 'src.communication.messages_pb2'
+  # @@protoc_insertion_point(class_scope:ExchangeSketch)
+  ))
+_sym_db.RegisterMessage(ExchangeSketch)
+
+ExchangeSketchReply = _reflection.GeneratedProtocolMessageType('ExchangeSketchReply', (_message.Message,), dict(
+  DESCRIPTOR = _EXCHANGESKETCHREPLY,
+  __module__ = 'src.communication.messages_pb2'
+  # @@protoc_insertion_point(class_scope:ExchangeSketchReply)
+  ))
+_sym_db.RegisterMessage(ExchangeSketchReply)
+
 
+_BLOCKINDEXENTRY.fields_by_name['ranges'].has_options = True
+_BLOCKINDEXENTRY.fields_by_name['ranges']._options = _descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))
+_EXCHANGEREQUEST.fields_by_name['nodes'].has_options = True
+_EXCHANGEREQUEST.fields_by_name['nodes']._options = _descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))
+_EXCHANGEREQUEST.fields_by_name['leaves'].has_options = True
+_EXCHANGEREQUEST.fields_by_name['leaves']._options = _descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))
+_EXCHANGEPROOF.fields_by_name['nodes'].has_options = True
+_EXCHANGEPROOF.fields_by_name['nodes']._options = _descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))
+_EXCHANGESKETCH.fields_by_name['counts'].has_options = True
+_EXCHANGESKETCH.fields_by_name['counts']._options = _descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))
+_EXCHANGESKETCH.fields_by_name['hash_sums'].has_options = True
+_EXCHANGESKETCH.fields_by_name['hash_sums']._options = _descriptor._ParseOptions(descriptor_pb2.FieldOptions(), _b('\020\001'))
 # @@protoc_insertion_point(module_scope)
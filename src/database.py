@@ -1,68 +1,449 @@
 """
 Module defining the database class.
 """
+import os
 import logging
+from collections import namedtuple
 
 from src.pyipv8.ipv8.database import sqlite3
-from src.pyipv8.ipv8.attestation.trustchain.database import TrustChainDB
+from src.pyipv8.ipv8.attestation.trustchain.database import TrustChainDB, DATABASE_DIRECTORY
+from src.pyipv8.ipv8.attestation.trustchain.block import TrustChainBlock
 from src.chain.block import Block
+from src.chain.block_cache import BlockCache, DEFAULT_CACHE_SIZE
+from src.chain.index import BlockIndex
+from src.chain.replacement_overlay import ReplacementOverlay
 
+# SQLite's default limit on the number of host parameters in a single statement
+MAX_VARIABLES = 999
+# Number of rows fetched from a cursor at once when streaming blocks
+STREAM_BATCH_SIZE = 500
 
-class Database(TrustChainDB):
-    """An extension of the general TrustChainDB database interface. This class provides additional
-    security checks, deletion for creating double-spending attacks and some convenience methods.
+# Head sequence number, head hash, number of stored blocks and number of missing runs below the head
+# of the chain of a public key
+ChainMetadata = namedtuple('ChainMetadata', ['sequence_number', 'hash', 'length', 'gaps'])
+
+
+def chain_metadata(ranges, head_hash):
+    """Derives the metadata of a chain from the ranges of its stored sequence numbers.
+
+    Arguments:
+        ranges {[(int, int)]} -- Sorted, non-empty list of inclusive ranges of the chain
+        head_hash {string} -- Binary hash of the block with the highest sequence number
     """
+    return ChainMetadata(ranges[-1][1], head_hash, sum(end - begin + 1 for begin, end in ranges),
+                         len(ranges) - 1 + (1 if ranges[0][0] > 1 else 0))
+
+
+def index_to_runs(index):
+    """Converts an index to a list of (public_key, first sequence number, last sequence number)
+    runs, ordered by public key and sequence number.
+
+    Arguments:
+        index {BlockIndex} -- Index to be converted
+    """
+    return [(public_key, begin, end) for public_key, ranges in sorted(index.ranges)
+            for begin, end in ranges]
+
+
+def row_kind(row):
+    """Classifies the block of a row that was stored without its kind.
+
+    Arguments:
+        row {tuple} -- Row in the format of the TrustChainDB, including the block hash
+    """
+    return Block.convert_to_Block(TrustChainBlock(row), row[8]).kind
+
+
+class BaseDatabase(object):
+    """The storage independent part of the database interface. The BaseDatabase keeps the index of
+    all stored blocks and a cache of recently used blocks, and implements the block level methods
+    used by the agents on top of a storage backend. A backend stores rows in the format of the
+    TrustChainDB, (tx, public_key, sequence_number, link_public_key, link_sequence_number,
+    previous_hash, signature, insert_time, block_hash), by implementing _stored_keys, _insert_rows,
+    _iter_runs, _rows_with_hashes, _all_rows and _delete_rows. The kind of every block is stored
+    alongside its row, such that the rows of a chain can be filtered by kind. Backends that persist the chain
+    metadata implement _stored_metadata and _store_metadata as well.
+    """
+
+    def __init__(self, block_cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Initializes the index of all stored blocks, which is kept up to date by add_blocks and
+        delete afterwards. Blocks read from the storage are kept in a cache of the given size.
+        """
+        self.block_cache = BlockCache(block_cache_size)
+        self.block_index = BlockIndex([(str(public_key), [sequence_number]) for
+                                       public_key, sequence_number in self._stored_keys()])
+        self.chain_metadata = {}
+        self._load_metadata()
+
+    def _stored_keys(self):
+        """Returns (public_key, sequence_number) tuples of all stored blocks, ordered by public key.
+        """
+        raise NotImplementedError()
+
+    def _insert_rows(self, rows):
+        """Stores rows in the format of TrustChainBlock.pack_db_insert, followed by the kind of the
+        block, at once. Rows with the public key and sequence number of a stored row are ignored.
+        """
+        raise NotImplementedError()
+
+    def _iter_runs(self, runs, kind=None):
+        """Generates the stored rows of the given (public_key, begin, end) runs, ordered by public
+        key and sequence number. With a kind only the rows of blocks that have one of its flags are
+        generated.
+        """
+        raise NotImplementedError()
+
+    def _rows_with_hashes(self, block_hashes):
+        """Generates the stored rows with one of the given block hashes, hashes that are not stored
+        are skipped.
+        """
+        raise NotImplementedError()
+
+    def _all_rows(self):
+        """Generates all stored rows.
+        """
+        raise NotImplementedError()
+
+    def _delete_rows(self, public_key, sequence_begin, sequence_end):
+        """Removes the rows of a public key from sequence_begin up to and including sequence_end.
+        """
+        raise NotImplementedError()
+
+    def _stored_metadata(self):
+        """Generates the persisted (public_key, sequence_number, hash, length, gaps) chain metadata.
+        """
+        return []
+
+    def _store_metadata(self, public_keys):
+        """Persists the chain metadata of the given public keys, keys without chain are removed.
+        """
+        pass
+
+    def _stored_hash(self, public_key, sequence_number):
+        row = next(self._iter_runs([(public_key, sequence_number, sequence_number)]))
+        return str(row[8])
+
+    def _load_metadata(self):
+        """Takes the persisted chain metadata of every chain that matches the block index, the
+        metadata of other chains is derived from the index and their stored head.
+        """
+
+        stored = {str(public_key): ChainMetadata(sequence_number, str(block_hash), length, gaps)
+                  for public_key, sequence_number, block_hash, length, gaps
+                  in self._stored_metadata()}
+        changed = [public_key for public_key in stored
+                   if not self.block_index.get_ranges(public_key)]
+
+        for public_key, ranges in self.block_index.ranges:
+            metadata = stored.get(public_key)
+            if metadata is None or metadata != chain_metadata(ranges, metadata.hash):
+                metadata = chain_metadata(ranges, self._stored_hash(public_key, ranges[-1][1]))
+                changed.append(public_key)
+            self.chain_metadata[public_key] = metadata
+
+        if changed:
+            self._store_metadata(changed)
+
+    def _update_metadata(self, public_keys, head_hashes={}):
+        """Recalculates the chain metadata of the given public keys after blocks were added or
+        removed.
+
+        Arguments:
+            public_keys {[string]} -- Binary public keys of the changed chains
+
+        Keyword Arguments:
+            head_hashes {dict} -- Hashes of newly added blocks by public key and sequence number
+                (default: {{}})
+        """
+
+        for public_key in public_keys:
+            ranges = self.block_index.get_ranges(public_key)
+            if not ranges:
+                self.chain_metadata.pop(public_key, None)
+                continue
+
+            head = ranges[-1][1]
+            previous = self.chain_metadata.get(public_key)
+            if previous is not None and previous.sequence_number == head:
+                head_hash = previous.hash
+            else:
+                head_hash = head_hashes.get((public_key, head)) or \
+                    self._stored_hash(public_key, head)
+            self.chain_metadata[public_key] = chain_metadata(ranges, head_hash)
+
+        self._store_metadata(public_keys)
+
+    def get_chain_metadata(self, public_key):
+        """Returns the metadata of the chain of a public key without accessing the storage.
+
+        Arguments:
+            public_key {string} -- Binary public key
+
+        Returns:
+            ChainMetadata -- Head sequence number, head hash, number of stored blocks and number of
+                gaps of the chain, or None if no block of the public key is stored
+        """
+
+        return self.chain_metadata.get(str(public_key))
 
-    def __init__(self, *args):
+    def get_chain_length(self, public_key):
+        """Returns the number of stored blocks of a public key.
+
+        Arguments:
+            public_key {string} -- Binary public key
         """
-        Initializes new database.
+
+        metadata = self.chain_metadata.get(str(public_key))
+        return metadata.length if metadata is not None else 0
+
+    def count_stored(self, public_key, up_to):
+        """Returns the number of stored blocks of a public key with a sequence number up to and
+        including up_to, without accessing the storage.
+
+        Arguments:
+            public_key {string} -- Binary public key
+            up_to {int} -- Highest sequence number to count
         """
-        super(Database, self).__init__(*args)
 
-    def _getall(self, *args, **kwargs):
-        trust_chain_blocks = super(Database, self)._getall(*args, **kwargs)
-        return [Block.convert_to_Block(block) for block in trust_chain_blocks]
+        return sum(min(end, up_to) - begin + 1 for begin, end in
+                   self.block_index.get_ranges(str(public_key)) if begin <= up_to)
+
+    def _new_block(self, row):
+        block = Block.convert_to_Block(TrustChainBlock(row), row[8])
+        self.block_cache.put(block, row[8])
+        return block
+
+    def _block_from_row(self, row, cache=True):
+        block = self.block_cache.get(row[1], row[2])
+        if block is not None:
+            return block
+        if not cache:
+            return Block.convert_to_Block(TrustChainBlock(row), row[8])
+        return self._new_block(row)
+
+    def get(self, public_key, sequence_number):
+        """
+        Returns the block with the given public key and sequence number, from the block cache if
+        possible.
+        """
+        block = self.block_cache.get(public_key, sequence_number)
+        if block is not None:
+            return block
+
+        row = next(self._iter_runs([(str(public_key), sequence_number, sequence_number)]), None)
+        return self._new_block(row) if row is not None else None
+
+    def get_latest(self, public_key):
+        """
+        Returns the block with the highest sequence number of the given public key.
+        """
+        metadata = self.chain_metadata.get(str(public_key))
+        return self.get(public_key, metadata.sequence_number) if metadata is not None else None
+
+    def get_by_hash(self, block_hash):
+        """Returns the block with the given hash, from the block cache if possible.
+
+        Arguments:
+            block_hash {string} -- Binary hash of the block
+
+        Returns:
+            Block -- The stored block or None if no block with the hash is stored
+        """
+
+        return self.get_many_by_hash([block_hash]).get(str(block_hash))
+
+    def get_block_with_hash(self, block_hash):
+        """
+        Returns the block with the given hash, same as get_by_hash.
+        """
+        return self.get_by_hash(block_hash)
+
+    def get_many_by_hash(self, block_hashes):
+        """Resolves a number of block hashes at once. Cached blocks are taken from the block cache,
+        the remaining hashes are looked up in the storage together.
+
+        Arguments:
+            block_hashes {[string]} -- Binary hashes of the requested blocks
+
+        Returns:
+            dict -- Maps the hash of every stored block that was requested to the block
+        """
+
+        blocks = {}
+        missing = []
+        for block_hash in set(str(block_hash) for block_hash in block_hashes):
+            block = self.block_cache.get_by_hash(block_hash)
+            if block is not None:
+                blocks[block_hash] = block
+            else:
+                missing.append(block_hash)
+
+        if missing:
+            for row in self._rows_with_hashes(missing):
+                blocks[str(row[8])] = self._block_from_row(row)
+
+        return blocks
+
+    def add_block(self, block):
+        """
+        Persists a block and records it in the block index. A block with the public key and
+        sequence number of a stored block is ignored.
+        """
+        self.add_blocks([block], False)
 
     def add(self, block, check_double_spend=True):
         """
         Adds a block to the database.
+
+        Returns:
+            {Block} -- The stored block if it conflicts with the added block, otherwise False.
         """
-        try:
-            self.add_block(block)
-        except sqlite3.IntegrityError:
-            if check_double_spend:
-                existing = self.get(block.public_key, block.sequence_number)
-                if existing.hash != block.hash:
-                    logging.warning('DOUBLE SPENDING DETECTED at block %s', existing)
-                    return existing
-        return False
+        conflicts = self.add_blocks([block], check_double_spend)
+        return conflicts[0][0] if conflicts else False
 
     def add_blocks(self, blocks, check_double_spend=True):
-        """Addes multiple blocks to the database.
-        
+        """Adds multiple blocks to the database in a single transaction. Blocks that are already
+        stored are ignored. A block with the public key and sequence number of a different stored
+        block is not stored and reported as conflict instead.
+
         Arguments:
             blocks {[Blocks]} -- Blocks to be added to the database.
+
+        Keyword Arguments:
+            check_double_spend {bool} -- Whether to look up conflicting blocks (default: {True})
+
+        Returns:
+            {[(Block, Block)]} -- Pairs of the stored and the incoming version of every conflicting
+                block, empty if no conflicts were found or check_double_spend is False.
         """
 
-        for block in blocks:
-            result = self.add(block, check_double_spend)
+        rows = [block.pack_db_insert() + (block.kind,) for block in blocks]
+
+        conflicts = []
+        if check_double_spend:
+            # Only stored blocks with a different hash are read, every other block is compared with
+            # the first block of the batch at its position
+            incoming = {}
+            for row in rows:
+                incoming.setdefault((str(row[1]), row[2]), str(row[7]))
+            stored = {(str(block.public_key), block.sequence_number): block
+                      for block in self.get_conflicting_blocks(
+                          [(public_key, sequence_number, block_hash)
+                           for (public_key, sequence_number), block_hash in incoming.iteritems()])}
+            first = {}
+            for block, row in zip(blocks, rows):
+                key = (str(row[1]), row[2])
+                existing = stored.get(key)
+                if existing is None:
+                    existing = first.setdefault(key, block)
+                if existing is not block and str(existing.hash) != str(row[7]):
+                    logging.warning('DOUBLE SPENDING DETECTED at block %s', existing)
+                    conflicts.append((existing, block))
+
+        self._insert_rows(rows)
+
+        head_hashes = {}
+        for row in rows:
+            head_hashes.setdefault((str(row[1]), row[2]), str(row[7]))
+            self.block_index.insert(str(row[1]), row[2])
+        self._update_metadata(set(public_key for public_key, _ in head_hashes), head_hashes)
+
+        return conflicts
+
+    def get_conflicting_blocks(self, triples):
+        """Looks up which of the given blocks conflict with a stored block, that is a stored block
+        with the same public key and sequence number has a different hash. The stored hashes are
+        compared without converting the rows of matching blocks.
+
+        Arguments:
+            triples {[(string, int, string)]} -- Public key, sequence number and hash of each block
+
+        Returns:
+            {[Block]} -- Stored versions of the conflicting blocks, ordered by public key and
+                sequence number.
+        """
 
-            if result != False:
-                return result
+        hashes = {(str(public_key), sequence_number): str(block_hash)
+                  for public_key, sequence_number, block_hash in triples}
+        index = BlockIndex([(public_key, [sequence_number])
+                            for public_key, sequence_number in hashes])
 
-        return False
+        return [self._block_from_row(row) for row in self._iter_runs(index_to_runs(index))
+                if str(row[8]) != hashes[(str(row[1]), row[2])]]
 
-    def get_chain(self, key):
+    def get_chain(self, key, kind=None):
         """Retrives the chain (all blocks authored) of the agent with the given
         public key.
 
         Arguments:
             key {PublicKey} -- Public key of the agent for which the chain is retrieved.
 
+        Keyword Arguments:
+            kind {int} -- Kind flags of the blocks to retrieve, e.g. EXCHANGE for the exchange
+                blocks only, None for all blocks (default: {None})
+
         Returns:
             {[TrustChainBlock]} -- List of blocks, ordered by sequence number.
         """
-        return self._getall('WHERE public_key = ?', (key.as_buffer(),))
+        return list(self.iter_chain(key, kind=kind))
+
+    def get_chain_since(self, key, sequence_number):
+        """Retrieves the blocks of the chain of the agent with the given public key that follow the
+        given sequence number.
+
+        Arguments:
+            key {PublicKey} -- Public key of the agent for which the chain is retrieved.
+            sequence_number {int} -- Last sequence number that is not retrieved
+
+        Returns:
+            {[Block]} -- List of blocks, ordered by sequence number.
+        """
+        return list(self.iter_chain(key, sequence_number + 1))
+
+    def get_chain_range(self, key, sequence_begin, sequence_end):
+        """Retrieves the blocks of the chain of the agent with the given public key from
+        sequence_begin up to and including sequence_end.
+
+        Arguments:
+            key {PublicKey} -- Public key of the agent for which the chain is retrieved.
+            sequence_begin {int} -- First sequence number to retrieve
+            sequence_end {int} -- Last sequence number to retrieve
+
+        Returns:
+            {[Block]} -- List of blocks, ordered by sequence number.
+        """
+        return list(self.iter_chain(key, sequence_begin, sequence_end))
+
+    def iter_chain(self, key, sequence_begin=1, sequence_end=None, kind=None):
+        """Generates the blocks of the chain of the agent with the given public key from
+        sequence_begin up to and including sequence_end. Only the stored blocks in that range are
+        read.
+
+        Arguments:
+            key {PublicKey} -- Public key of the agent for which the chain is retrieved.
+
+        Keyword Arguments:
+            sequence_begin {int} -- First sequence number to retrieve (default: {1})
+            sequence_end {int} -- Last sequence number to retrieve, None for the end of the chain
+                (default: {None})
+            kind {int} -- Kind flags of the blocks to retrieve, None for all blocks
+                (default: {None})
+
+        Returns:
+            {generator} -- Blocks, ordered by sequence number.
+        """
+
+        public_key = str(key.as_buffer())
+        runs = []
+        for begin, end in self.block_index.get_ranges(public_key):
+            begin = max(begin, sequence_begin)
+            end = end if sequence_end is None else min(end, sequence_end)
+            if begin <= end:
+                runs.append((public_key, begin, end))
+
+        for row in self._iter_runs(runs, kind):
+            yield self._block_from_row(row)
 
     def delete(self, key, sequence_begin, sequence_length=1):
         """Deletes a sequence of blocks from the database. This can be used as a simple way to
@@ -77,44 +458,327 @@ class Database(TrustChainDB):
             sequence_length {int} -- Number of blocks to remove (default: {-1})
         """
 
-        self.execute(
-                    'DELETE FROM blocks WHERE public_key = ? AND sequence_number >= ? ' +
-                    'AND sequence_number < ?',
-                    (key.as_buffer(),
-                        sequence_begin,
-                        sequence_begin + sequence_length))
+        sequence_end = sequence_begin + sequence_length - 1
+        self._delete_rows(key.as_bin(), sequence_begin, sequence_end)
+        self.block_index.discard(key.as_bin(), sequence_begin, sequence_end)
+        self.block_cache.discard(key.as_bin(), sequence_begin, sequence_end)
+        self._update_metadata([key.as_bin()])
 
     def get_all_blocks(self):
-        return self._getall('', ())
+        return list(self.iter_all_blocks())
+
+    def iter_all_blocks(self):
+        """Generates all blocks of the database. The rows are streamed from the storage and the
+        blocks are not added to the block cache, such that memory usage does not grow with the size
+        of the database.
+
+        Returns:
+            {generator} -- All blocks of the database
+        """
+        for row in self._all_rows():
+            yield self._block_from_row(row, cache=False)
+
+    def snapshot(self):
+        """Writes the content of an in-memory database to the location the database would use on
+        disk. Databases on disk are already persisted, for those nothing happens.
+        """
+        pass
+
+    def get_block_index(self):
+        """Returns a snapshot of the index of all blocks in the database. The snapshot is not
+        affected by blocks added or deleted afterwards.
+
+        Returns:
+            BlockIndex -- Index of all blocks in the database.
+        """
+        return self.block_index.copy()
 
     def index(self, index):
         """Returns a subset of the database indexed by the passed index.
 
         Arguments:
             index {BlockIndex} -- Index, defining which subset of blocks to return.
+
+        Returns:
+            {[Block]} -- List of blocks, ordered by public key and sequence number.
         """
+        return list(self.iter_index(index))
+
+    def iter_index(self, index):
+        """Generates the blocks of the database indexed by the passed index.
+
+        Arguments:
+            index {BlockIndex} -- Index, defining which subset of blocks to return.
 
-        args = index.to_database_args()
-        db_args = []
-        for arg in args:
-            db_args.extend([buffer(arg[0]), arg[1]])
-        query = 'WHERE (public_key, sequence_number) IN (VALUES {})'.format(
-            ','.join(['(?,?)']*len(args)))
-        return self._getall(query, tuple(db_args))
+        Returns:
+            {generator} -- Blocks, ordered by public key and sequence number.
+        """
+        for row in self._iter_runs(index_to_runs(index)):
+            yield self._block_from_row(row)
 
     def index_with_replacements(self, index, replacements):
         """Get blocks from the database with specific replacements in order to simulate another
-        agent.
-        
+        agent. The replacements are applied while the rows are read, a replaced row is not
+        converted to a block.
+
         Arguments:
             index {BlockIndex} -- Index, defining which subset of blocks to return
-            replacements {[(Block, Block)]} -- List of tuples with first element the block to be
-                replaced and the second element the block to fill in 
+            replacements {ReplacementOverlay} -- Overlay of the replacement rules, or a list of
+                tuples with first element the block to be replaced and the second element the block
+                to fill in
+        """
+
+        if not isinstance(replacements, ReplacementOverlay):
+            replacements = ReplacementOverlay(replacements)
+
+        blocks = []
+        for row in self._iter_runs(index_to_runs(index)):
+            replacement = replacements.replace(row[1], row[2], row[8])
+            blocks.append(replacement if replacement is not None else self._block_from_row(row))
+
+        return blocks
+
+
+class Database(BaseDatabase, TrustChainDB):
+    """An extension of the general TrustChainDB database interface. This class provides additional
+    security checks, deletion for creating double-spending attacks and some convenience methods.
+    The blocks are stored in SQLite.
+    """
+
+    def __init__(self, working_directory, db_name, block_cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Initializes new database, stored in memory if the working directory is ':memory:'.
         """
-        blocks = self.index(index)
+        TrustChainDB.__init__(self, working_directory, db_name)
+        self.execute(u'CREATE INDEX IF NOT EXISTS block_hash_index ON blocks(block_hash)')
+        self.execute(u'CREATE TABLE IF NOT EXISTS chain_metadata('
+                     u'public_key BLOB PRIMARY KEY, sequence_number INTEGER NOT NULL, '
+                     u'block_hash BLOB NOT NULL, length INTEGER NOT NULL, gaps INTEGER NOT NULL)')
+        self._add_kind_column()
+        self.snapshot_path = os.path.join(DATABASE_DIRECTORY, u"%s.db" % db_name)
+        BaseDatabase.__init__(self, block_cache_size)
+
+    def _add_kind_column(self):
+        """Adds the kind column to a blocks table created without it, the kind of the stored blocks
+        is filled in from their transaction.
+        """
+
+        columns = [column[1] for column in self.execute(u'PRAGMA table_info(blocks)')]
+        if u'kind' in columns:
+            return
+
+        self.execute(u'ALTER TABLE blocks ADD COLUMN kind INTEGER NOT NULL DEFAULT 0')
+        rows = self.execute(self.get_sql_header(), fetch_all=True)
+        self.executemany(u'UPDATE blocks SET kind = ? WHERE public_key = ? AND sequence_number = ?',
+                         [(row_kind(row), row[1], row[2]) for row in rows])
+        self.commit()
+
+    def get_sql_header(self):
+        """
+        Selects the stored block hash in addition to the columns of the TrustChainDB, such that
+        blocks can be cached by hash without recalculating it.
+        """
+        return u"""
+        SELECT tx, public_key, sequence_number, link_public_key, link_sequence_number,
+               previous_hash, signature, insert_time, block_hash
+        FROM blocks
+        """
+
+    def _rows(self, query, params):
+        return self.execute(self.get_sql_header() + query, params, fetch_all=True)
+
+    def _stream_rows(self, query, params):
+        """Generates the rows of a query, fetching STREAM_BATCH_SIZE rows at a time from a separate
+        cursor, such that other statements can be executed while iterating.
+        """
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(self.get_sql_header() + query, params)
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            while rows:
+                for row in rows:
+                    yield row
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+        finally:
+            cursor.close()
+
+    def _get(self, query, params):
+        blocks = self._getall(query, params)
+        return blocks[0] if blocks else None
+
+    def _getall(self, query, params):
+        return [self._block_from_row(row) for row in self._rows(query, params)]
+
+    def _stored_keys(self):
+        return self.execute(u'SELECT public_key, sequence_number FROM blocks ORDER BY public_key')
+
+    def _stored_metadata(self):
+        return self.execute(u'SELECT public_key, sequence_number, block_hash, length, gaps '
+                            u'FROM chain_metadata')
+
+    def _store_metadata(self, public_keys):
+        removed = [(buffer(public_key),) for public_key in public_keys
+                   if public_key not in self.chain_metadata]
+        stored = [(buffer(public_key), metadata.sequence_number, buffer(metadata.hash),
+                   metadata.length, metadata.gaps)
+                  for public_key, metadata in self.chain_metadata.iteritems()
+                  if public_key in public_keys]
+        self.executemany(u'DELETE FROM chain_metadata WHERE public_key = ?', removed)
+        self.executemany(u'INSERT OR REPLACE INTO chain_metadata VALUES(?,?,?,?,?)', stored)
+        self.commit()
+
+    def _insert_rows(self, rows):
+        self.executemany(u'INSERT OR IGNORE INTO blocks (tx, public_key, sequence_number, '
+                         u'link_public_key, link_sequence_number, previous_hash, signature, '
+                         u'block_hash, kind) VALUES(?,?,?,?,?,?,?,?,?)', rows)
+        self.commit()
+
+    def add_blocks(self, blocks, check_double_spend=True):
+        """
+        Adds multiple blocks to the database, the blocks and the chain metadata are committed in a
+        single transaction.
+        """
+        with self:
+            return BaseDatabase.add_blocks(self, blocks, check_double_spend)
+
+    def delete(self, key, sequence_begin, sequence_length=1):
+        """
+        Deletes a sequence of blocks from the database, the blocks and the chain metadata are
+        committed in a single transaction.
+        """
+        with self:
+            BaseDatabase.delete(self, key, sequence_begin, sequence_length)
+
+    def _iter_runs(self, runs, kind=None):
+        """Each run of sequence numbers of a public key becomes a single BETWEEN predicate, the
+        predicates are queried in chunks that respect the SQLite host parameter limit. Runs
+        consisting mostly of single scattered blocks that do not fit a single query are joined
+        through a temporary table instead. A kind is filtered on the kind column.
+        """
+
+        blocks = sum(end - begin + 1 for _, begin, end in runs)
+        chunk_size = (MAX_VARIABLES - 1) // 3
+
+        if len(runs) > chunk_size and blocks < 2 * len(runs):
+            for row in self._rows_from_table(runs, kind):
+                yield row
+            return
+
+        kind_filter = '' if kind is None else ' AND (kind & ?) != 0'
+        for chunk in xrange(0, len(runs), chunk_size):
+            chunk_runs = runs[chunk:chunk + chunk_size]
+            db_args = []
+            for public_key, begin, end in chunk_runs:
+                db_args.extend([buffer(public_key), begin, end])
+            if kind is not None:
+                db_args.append(kind)
+            query = 'WHERE ({}){} ORDER BY public_key, sequence_number'.format(
+                ' OR '.join(['(public_key = ? AND sequence_number BETWEEN ? AND ?)'] *
+                            len(chunk_runs)), kind_filter)
+            for row in self._stream_rows(query, tuple(db_args)):
+                yield row
+
+    def _rows_from_table(self, runs, kind=None):
+        """Generates the rows of the given runs by joining the blocks with a temporary table of
+        the requested (public_key, sequence_number) pairs. The rows are streamed, the table is
+        cleared once the iteration ends.
+
+        Arguments:
+            runs {[(string, int, int)]} -- Public key, first and last sequence number of each run
+
+        Keyword Arguments:
+            kind {int} -- Kind flags of the rows to retrieve, None for all rows (default: {None})
+        """
+
+        self.execute(u'CREATE TEMP TABLE IF NOT EXISTS index_query('
+                     u'public_key BLOB NOT NULL, sequence_number INTEGER NOT NULL, '
+                     u'PRIMARY KEY (public_key, sequence_number))')
+        self.execute(u'DELETE FROM temp.index_query')
+        self.executemany(u'INSERT OR IGNORE INTO temp.index_query VALUES (?, ?)',
+                         [(buffer(public_key), seq) for public_key, begin, end in runs
+                          for seq in xrange(begin, end + 1)])
+        rows = self._stream_rows(u'WHERE (public_key, sequence_number) IN '
+                                 u'(SELECT public_key, sequence_number FROM temp.index_query) '
+                                 u'{}ORDER BY public_key, sequence_number'.format(
+                                     u'' if kind is None else u'AND (kind & ?) != 0 '),
+                                 () if kind is None else (kind,))
+        try:
+            for row in rows:
+                yield row
+        finally:
+            rows.close()
+            self.execute(u'DELETE FROM temp.index_query')
+
+    def _rows_with_hashes(self, block_hashes):
+        """The hashes are looked up through the block_hash index in chunks that respect the SQLite
+        host parameter limit.
+        """
+
+        for chunk in xrange(0, len(block_hashes), MAX_VARIABLES):
+            chunk_hashes = block_hashes[chunk:chunk + MAX_VARIABLES]
+            query = u'WHERE block_hash IN ({})'.format(', '.join(['?'] * len(chunk_hashes)))
+            for row in self._stream_rows(query, tuple(buffer(h) for h in chunk_hashes)):
+                yield row
+
+    def _all_rows(self):
+        return self._stream_rows('', ())
+
+    def _delete_rows(self, public_key, sequence_begin, sequence_end):
+        self.execute(u'DELETE FROM blocks WHERE public_key = ? AND sequence_number >= ? '
+                     u'AND sequence_number <= ?',
+                     (buffer(public_key), sequence_begin, sequence_end))
+
+    def get_conflicting_blocks(self, triples):
+        """Looks up which of the given blocks conflict with a stored block, that is a stored block
+        with the same public key and sequence number has a different hash. All blocks are checked
+        with a single query against the stored block hashes.
+
+        Arguments:
+            triples {[(string, int, string)]} -- Public key, sequence number and hash of each block
+
+        Returns:
+            {[Block]} -- Stored versions of the conflicting blocks, ordered by public key and
+                sequence number.
+        """
+
+        if not triples:
+            return []
+
+        self.execute(u'CREATE TEMP TABLE IF NOT EXISTS hash_query('
+                     u'public_key BLOB NOT NULL, sequence_number INTEGER NOT NULL, '
+                     u'block_hash BLOB NOT NULL, PRIMARY KEY (public_key, sequence_number))')
+        self.execute(u'DELETE FROM temp.hash_query')
+        self.executemany(u'INSERT OR IGNORE INTO temp.hash_query VALUES (?, ?, ?)',
+                         [(buffer(public_key), sequence_number, buffer(block_hash))
+                          for public_key, sequence_number, block_hash in triples])
+        blocks = self._getall(u'WHERE (public_key, sequence_number) IN '
+                              u'(SELECT public_key, sequence_number FROM temp.hash_query) '
+                              u'AND block_hash != (SELECT block_hash FROM temp.hash_query AS query '
+                              u'WHERE query.public_key = blocks.public_key '
+                              u'AND query.sequence_number = blocks.sequence_number) '
+                              u'ORDER BY public_key, sequence_number', ())
+        self.execute(u'DELETE FROM temp.hash_query')
+
+        return blocks
+
+    def snapshot(self):
+        """Writes the content of an in-memory database to the file the database would use on disk,
+        statement by statement in a single transaction. Databases on disk are already persisted, for
+        those nothing happens.
+        """
+
+        if self.file_path != u':memory:':
+            return
+
+        if not os.path.exists(os.path.dirname(self.snapshot_path)):
+            os.makedirs(os.path.dirname(self.snapshot_path))
+        if os.path.isfile(self.snapshot_path):
+            os.unlink(self.snapshot_path)
 
-        for block1, block2 in replacements:
-            if block1 in blocks:
-                blocks = [b if b.hash != block1.hash else block2 for b in blocks]
-        
-        return blocks
\ No newline at end of file
+        self.commit()
+        snapshot = sqlite3.connect(self.snapshot_path)
+        # The dump starts and ends the transaction itself, statements are written one at a time
+        snapshot.isolation_level = None
+        for statement in self._connection.iterdump():
+            snapshot.execute(statement)
+        snapshot.close()
@@ -2,6 +2,7 @@
 Module defining the experiment runner class.
 """
 import os
+import shutil
 import logging
 import json
 from multiprocessing import Process
@@ -84,6 +85,8 @@ class ExperimentRunner(object):
             try:
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
+                elif os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
             except Exception as e:
                 print(e)
 
@@ -112,7 +115,9 @@ class ExperimentRunner(object):
             for _ in range(group['count']):
                 agent = AGENT_CLASS_TYPES[group['type']]()
                 next_port = self.options['node_port_range_begin'] + len(self.agent_processes)
-                agent.setup(self.options, next_port)
+                options = dict(self.options)
+                options.update(group.get('options', {}))
+                agent.setup(options, next_port)
                 agent_process = Process(target=agent.run)
                 agent_process.start()
                 self.agent_processes.append(agent_process)
@@ -0,0 +1,210 @@
+"""
+Module defining the log-structured database class.
+"""
+import os
+import time
+import struct
+from collections import OrderedDict
+from io import BytesIO
+
+from src.pyipv8.ipv8.attestation.trustchain.database import DATABASE_DIRECTORY
+from src.chain.block_cache import DEFAULT_CACHE_SIZE
+from src.database import BaseDatabase
+
+BLOCK_RECORD = 'B'
+DELETE_RECORD = 'D'
+RECORD_HEADER = struct.Struct('>cI')
+SEQUENCE_NUMBERS = struct.Struct('>qq')
+FIELD_LENGTH = struct.Struct('>I')
+SEGMENT_EXTENSION = '.log'
+# Number of segment files that are kept open at once
+OPEN_SEGMENTS = 128
+
+
+def pack_fields(fields):
+    return ''.join(FIELD_LENGTH.pack(len(field)) + field for field in fields)
+
+
+def unpack_fields(data, offset):
+    fields = []
+    while offset < len(data):
+        length, = FIELD_LENGTH.unpack_from(data, offset)
+        offset += FIELD_LENGTH.size
+        fields.append(data[offset:offset + length])
+        offset += length
+    return fields
+
+
+class LogDatabase(BaseDatabase):
+    """Append-only, log-structured block storage. The blocks of every public key are appended to a
+    segment file of that key, an in-memory index maps the sequence numbers of a key to the position
+    of their records in the segment. Deletions are appended as records as well, when the database
+    is opened the segments are replayed to rebuild the index. Only the most recently used segment
+    files are kept open, the others are reopened when they are accessed again.
+    """
+
+    def __init__(self, working_directory, db_name, block_cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Opens the segments of the database, which are kept in memory if the working directory is
+        ':memory:'.
+        """
+        self.in_memory = working_directory == u':memory:'
+        self.directory = os.path.join(working_directory, DATABASE_DIRECTORY, db_name)
+        self.snapshot_path = os.path.join(DATABASE_DIRECTORY, db_name)
+        self.segments = OrderedDict()
+        self.offsets = {}
+        self.hashes = {}
+
+        if not self.in_memory:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            for file_name in sorted(os.listdir(self.directory)):
+                if file_name.endswith(SEGMENT_EXTENSION):
+                    self._replay(file_name[:-len(SEGMENT_EXTENSION)].decode('hex'))
+
+        super(LogDatabase, self).__init__(block_cache_size)
+
+    def _segment(self, public_key):
+        segment = self.segments.pop(public_key, None)
+        if segment is None:
+            if self.in_memory:
+                segment = BytesIO()
+            else:
+                while len(self.segments) >= OPEN_SEGMENTS:
+                    self.segments.popitem(last=False)[1].close()
+                segment = open(os.path.join(self.directory, public_key.encode('hex') +
+                                            SEGMENT_EXTENSION), 'a+b')
+            self.offsets.setdefault(public_key, {})
+        self.segments[public_key] = segment
+        return segment
+
+    def _replay(self, public_key):
+        segment = self._segment(public_key)
+        segment.seek(0)
+        data = segment.read()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            kind, length = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > len(data):
+                break
+            if kind == BLOCK_RECORD:
+                sequence_number, _ = SEQUENCE_NUMBERS.unpack_from(data, offset)
+                fields = unpack_fields(data[offset:offset + length], SEQUENCE_NUMBERS.size)
+                self._register(public_key, sequence_number, offset, length, fields[5],
+                               ord(fields[6]))
+            elif kind == DELETE_RECORD:
+                self._unregister(public_key, *SEQUENCE_NUMBERS.unpack_from(data, offset))
+            offset += length
+
+    def _register(self, public_key, sequence_number, offset, length, block_hash, kind):
+        self.offsets[public_key][sequence_number] = (offset, length, block_hash, kind)
+        self.hashes[block_hash] = (public_key, sequence_number)
+
+    def _unregister(self, public_key, sequence_begin, sequence_end):
+        offsets = self.offsets.get(public_key, {})
+        for sequence_number in self._stored_sequence_numbers(public_key, sequence_begin,
+                                                             sequence_end):
+            block_hash = offsets.pop(sequence_number)[2]
+            if self.hashes.get(block_hash) == (public_key, sequence_number):
+                del self.hashes[block_hash]
+
+    def _stored_sequence_numbers(self, public_key, sequence_begin, sequence_end):
+        offsets = self.offsets.get(public_key, {})
+        if sequence_end - sequence_begin < len(offsets):
+            return [seq for seq in xrange(sequence_begin, sequence_end + 1) if seq in offsets]
+        return sorted(seq for seq in offsets if sequence_begin <= seq <= sequence_end)
+
+    def _append(self, public_key, records):
+        segment = self._segment(public_key)
+        segment.seek(0, os.SEEK_END)
+        position = segment.tell()
+        segment.write(''.join(RECORD_HEADER.pack(kind, len(record)) + record
+                              for kind, record in records))
+        segment.flush()
+        return position
+
+    def _read(self, public_key, sequence_number):
+        offset, length, _, _ = self.offsets[public_key][sequence_number]
+        segment = self._segment(public_key)
+        segment.seek(offset)
+        data = segment.read(length)
+        _, link_sequence_number = SEQUENCE_NUMBERS.unpack_from(data, 0)
+        tx, link_public_key, previous_hash, signature, insert_time, block_hash = \
+            unpack_fields(data, SEQUENCE_NUMBERS.size)[:6]
+        return (buffer(tx), public_key, sequence_number, link_public_key, link_sequence_number,
+                previous_hash, signature, insert_time, block_hash)
+
+    def _stored_keys(self):
+        return [(public_key, sequence_number) for public_key in sorted(self.offsets)
+                for sequence_number in sorted(self.offsets[public_key])]
+
+    def _insert_rows(self, rows):
+        insert_time = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        records = {}
+        for tx, public_key, sequence_number, link_public_key, link_sequence_number, \
+                previous_hash, signature, block_hash, kind in rows:
+            public_key = str(public_key)
+            self._segment(public_key)
+            if sequence_number in self.offsets[public_key] or \
+                    sequence_number in records.get(public_key, {}):
+                continue
+            record = SEQUENCE_NUMBERS.pack(sequence_number, link_sequence_number) + \
+                pack_fields([str(tx), str(link_public_key), str(previous_hash), str(signature),
+                             insert_time, str(block_hash), chr(kind)])
+            records.setdefault(public_key, {})[sequence_number] = (record, str(block_hash), kind)
+
+        for public_key, key_records in records.iteritems():
+            items = sorted(key_records.items())
+            offset = self._append(public_key, [(BLOCK_RECORD, record)
+                                               for _, (record, _, _) in items])
+            for sequence_number, (record, block_hash, kind) in items:
+                offset += RECORD_HEADER.size
+                self._register(public_key, sequence_number, offset, len(record), block_hash, kind)
+                offset += len(record)
+
+    def _iter_runs(self, runs, kind=None):
+        for public_key, begin, end in runs:
+            public_key = str(public_key)
+            offsets = self.offsets.get(public_key, {})
+            for sequence_number in self._stored_sequence_numbers(public_key, begin, end):
+                if kind is None or offsets[sequence_number][3] & kind:
+                    yield self._read(public_key, sequence_number)
+
+    def _rows_with_hashes(self, block_hashes):
+        for block_hash in block_hashes:
+            key = self.hashes.get(str(block_hash))
+            if key is not None:
+                yield self._read(*key)
+
+    def _all_rows(self):
+        for public_key, sequence_number in self._stored_keys():
+            yield self._read(public_key, sequence_number)
+
+    def _delete_rows(self, public_key, sequence_begin, sequence_end):
+        public_key = str(public_key)
+        self._append(public_key, [(DELETE_RECORD,
+                                   SEQUENCE_NUMBERS.pack(sequence_begin, sequence_end))])
+        self._unregister(public_key, sequence_begin, sequence_end)
+
+    def snapshot(self):
+        """Writes the segments of an in-memory database to the directory the database would use on
+        disk. Databases on disk are already persisted, for those nothing happens.
+        """
+
+        if not self.in_memory:
+            return
+
+        if not os.path.exists(self.snapshot_path):
+            os.makedirs(self.snapshot_path)
+        for public_key, segment in self.segments.iteritems():
+            with open(os.path.join(self.snapshot_path, public_key.encode('hex') +
+                                   SEGMENT_EXTENSION), 'wb') as f:
+                f.write(segment.getvalue())
+
+    def close(self):
+        """Closes all segments.
+        """
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = OrderedDict()
@@ -0,0 +1,33 @@
+import unittest
+import logging
+import mock
+
+import src.communication.messages_pb2 as msg
+from src.agent.advanced_protect import ProtectAdvancedAgent
+from src.agent.request_cache import RequestState
+from src.database import Database
+from tests.helpers import generate_block, generate_key
+
+
+class TestProtectAdvancedAgent(unittest.TestCase):
+
+    def test1(self):
+        "rejects received chains and blocks with invalid signatures before storing them"
+        agent = ProtectAdvancedAgent()
+        agent.logger = logging.getLogger('test')
+        agent.database = Database(u':memory:', 'test')
+        agent.com = mock.Mock()
+        agent.configure_message_handlers()
+        public_key = generate_key()
+        chain = [generate_block(public_key, 1, {'up': 10})]
+        blocks = [generate_block(generate_key(), 1, {'up': 10})]
+
+        agent.request_cache.new('partner', RequestState.PROTECT_INDEX)
+        agent._message_handlers[msg.PROTECT_CHAIN_BLOCKS](agent, 'partner', msg.ChainAndBlocks(
+            chain=[block.as_message() for block in chain],
+            blocks=[block.as_message() for block in blocks],
+            exchange=msg.ExchangeIndex()))
+
+        self.assertIsNone(agent.request_cache.get('partner'))
+        self.assertEqual(agent.com.send.call_args[0][1].message.type, msg.PROTECT_REJECT)
+        self.assertIsNone(agent.database.get(public_key, 1))
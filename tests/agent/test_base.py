@@ -1,11 +1,17 @@
+import os
+import shutil
+import tempfile
 import unittest
 import mock
 
+import src.communication.messages_pb2 as msg
+
 from src.agent.base import BaseAgent
 from src.agent.info import AgentInfo
 from src.chain.block import Block
 from src.communication.messages_pb2 import BLOCK_PROPOSAL
 from src.communication.messages import NewMessage
+from src.database import Database
 from tests.helpers import generate_key
 
 
@@ -37,3 +43,26 @@ class TestBaseAgent(unittest.TestCase):
         A.block_proposal("foo", block.as_message())
 
         A.com.send.assert_called()
+
+    def test3(self):
+        "can write its data block by block"
+        A = BaseAgent()
+        A.com = mock.Mock()
+        A.com.address = "foo"
+        A.logger = mock.Mock()
+        A.options['data'] = tempfile.mkdtemp()
+        A.database = Database(u':memory:', 'test')
+        for sequence_number in range(1, 4):
+            block = Block()
+            block.public_key = A.public_key.as_bin()
+            block.sequence_number = sequence_number
+            A.database.add_block(block)
+
+        A.write_data()
+
+        database = msg.Database()
+        with open(os.path.join(A.options['data'], A.public_key.as_readable() + '.dat'), 'rb') as f:
+            database.ParseFromString(f.read())
+        shutil.rmtree(A.options['data'])
+        self.assertEqual(AgentInfo.from_message(database.info).public_key, A.public_key)
+        self.assertEqual([block.sequence_number for block in database.blocks], [1, 2, 3])
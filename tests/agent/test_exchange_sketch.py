@@ -0,0 +1,50 @@
+import unittest
+from hashlib import sha256
+
+from src.agent.exchange_sketch import ExchangeSketch
+
+
+def generate_keys(start, end):
+    return [sha256(str(i)).digest() for i in range(start, end)]
+
+
+class TestExchangeSketch(unittest.TestCase):
+
+    def test1(self):
+        "can decode a small difference between two large sets"
+        shared = generate_keys(0, 500)
+        own = generate_keys(500, 503)
+        other = generate_keys(503, 507)
+
+        own_sketch = ExchangeSketch.from_keys(shared + own, 60)
+        other_sketch = ExchangeSketch.from_message(
+            ExchangeSketch.from_keys(other + shared, 60).as_message())
+
+        decoded, own_keys, other_keys = (own_sketch - other_sketch).decode()
+
+        self.assertTrue(decoded)
+        self.assertEqual(sorted(own_keys), sorted(own))
+        self.assertEqual(sorted(other_keys), sorted(other))
+
+    def test2(self):
+        "reports failure if the difference is too large for the sketch"
+        own_sketch = ExchangeSketch.from_keys(generate_keys(0, 50), 12)
+        other_sketch = ExchangeSketch.from_keys(generate_keys(50, 100), 12)
+
+        decoded, _, _ = (own_sketch - other_sketch).decode()
+
+        self.assertFalse(decoded)
+
+    def test3(self):
+        "rejects key sums longer than the keys and skips them when decoding"
+        message = ExchangeSketch.from_keys(generate_keys(0, 5), 12).as_message()
+        message.key_sums[0] = '\x01' + '\xff' * 32
+        self.assertRaises(Exception, ExchangeSketch.from_message, message)
+
+        sketch = ExchangeSketch(12)
+        sketch.counts[0] = 1
+        sketch.key_sums[0] = long('01' + 'ff' * 32, 16)
+        decoded, own_keys, other_keys = sketch.decode()
+
+        self.assertFalse(decoded)
+        self.assertEqual((own_keys, other_keys), ([], []))
@@ -0,0 +1,158 @@
+import unittest
+import logging
+import mock
+
+import src.communication.messages_pb2 as msg
+from src.agent.info import AgentInfo
+from src.agent.simple_protect import ProtectSimpleAgent
+from src.agent.exchange_sketch import ExchangeSketch
+from src.agent.request_cache import RequestState
+from src.agent.exchange_storage import ExchangeStorage
+from src.chain.index import BlockIndex
+from src.chain.merkle_tree import MerkleTree
+from src.database import Database
+from src.chain.transfer_hash import blocks_to_hash
+from tests.helpers import MockObject, generate_block, generate_key
+
+
+class TestProtectSimpleAgent(unittest.TestCase):
+
+    def test1(self):
+        "reads only new blocks of the own chain unless the chain changed"
+        agent = ProtectSimpleAgent()
+        agent.database = Database(u':memory:', 'test')
+
+        def add_block(sequence_number, up):
+            block = generate_block(agent.public_key.as_bin(), sequence_number, {'up': up})
+            agent.database.add_block(block)
+            return block
+
+        blocks = [add_block(seq, 10) for seq in range(1, 4)]
+        chain = agent.get_own_chain()
+        self.assertEqual([block.hash for block in chain], [block.hash for block in blocks])
+
+        blocks.append(add_block(4, 10))
+        chain = agent.get_own_chain()
+        self.assertEqual([block.hash for block in chain], [block.hash for block in blocks])
+
+        agent.database.delete(agent.public_key, 4)
+        blocks[3] = add_block(4, 20)
+        chain = agent.get_own_chain()
+        self.assertEqual([block.hash for block in chain], [block.hash for block in blocks])
+
+        agent.database.delete(agent.public_key, 2)
+        chain = agent.get_own_chain()
+        self.assertEqual([block.sequence_number for block in chain], [1, 3, 4])
+
+    def test2(self):
+        "requires an earlier exchange with the same partner for every transaction"
+        agent = ProtectSimpleAgent()
+        agent.logger = logging.getLogger('test')
+        partner_key = generate_key()
+        exchange = {'transfer_up': '', 'transfer_down': '00' * 32, 'chain_up': 1, 'chain_down': 1}
+        transaction = {'up': 10, 'down': 10}
+
+        def generate_chain(transactions):
+            chain = []
+            for sequence_number, payload in enumerate(transactions, 1):
+                block = generate_block(agent.public_key.as_bin(), sequence_number, payload)
+                block.link_public_key = partner_key
+                chain.append(block)
+            return chain
+
+        self.assertTrue(agent.verify_chain_tx_ex_pairs(
+            generate_chain([exchange, transaction, exchange, transaction])))
+        self.assertFalse(agent.verify_chain_tx_ex_pairs(
+            generate_chain([exchange, transaction, transaction, exchange])))
+
+    def test3(self):
+        "solves multiset transfer hashes with a known double spend"
+        agent = ProtectSimpleAgent()
+        agent.logger = logging.getLogger('test')
+        public_key = generate_key()
+        blocks = [generate_block(public_key, sequence_number, {'up': 10})
+                  for sequence_number in range(1, 4)]
+        double_spend = generate_block(public_key, 2, {'up': 20})
+        agent.double_spends.append((blocks[1], double_spend))
+        transfer_hash = blocks_to_hash([blocks[0], double_spend, blocks[2]],
+                                       msg.MULTISET_HASH).encode('hex')
+
+        self.assertFalse(agent.known_double_spend(transfer_hash, blocks, 'partner'))
+        self.assertTrue(agent.known_double_spend(transfer_hash, blocks, 'partner',
+                                                 msg.MULTISET_HASH))
+        self.assertEqual(agent.replace_rules['partner'], [(blocks[1], double_spend)])
+
+    def test4(self):
+        "finds the first transaction without an earlier exchange"
+        agent = ProtectSimpleAgent()
+        partner_key = generate_key()
+        other_key = generate_key()
+        exchange = {'transfer_up': '', 'transfer_down': '00' * 32, 'chain_up': 1, 'chain_down': 1}
+        transaction = {'up': 10, 'down': 10}
+        chain = []
+        for sequence_number, (link_key, payload) in enumerate(
+                [(partner_key, exchange), (other_key, transaction), (partner_key, transaction),
+                 (other_key, exchange), (other_key, transaction)], 1):
+            block = generate_block(agent.public_key.as_bin(), sequence_number, payload)
+            block.link_public_key = link_key
+            chain.append(block)
+
+        self.assertIs(agent.find_unpaired_transaction(chain), chain[1])
+        self.assertIs(agent.find_unpaired_transaction(list(reversed(chain))), chain[1])
+        self.assertIsNone(agent.find_unpaired_transaction(chain[2:] + chain[:1]))
+
+    def test5(self):
+        "announces exchange sketch support only if it handles sketch requests"
+        agent = ProtectSimpleAgent()
+        agent.com = MockObject()
+        agent.com.address = 'tcp://127.0.0.1:5000'
+        self.assertFalse(AgentInfo.from_agent(agent).exchange_sketch)
+
+        agent.configure_message_handlers()
+        self.assertTrue(AgentInfo.from_agent(agent).exchange_sketch)
+
+    def test6(self):
+        "sends all exchanges for malformed and oversized exchange sketches"
+        agent = ProtectSimpleAgent()
+        agent.logger = logging.getLogger('test')
+        agent.options['exchange_sketch_cells'] = 12
+        agent.com = mock.Mock()
+        agent.configure_message_handlers()
+        handler = agent._message_handlers[msg.PROTECT_SKETCH_REQUEST]
+
+        malformed = ExchangeSketch.from_keys([], 12).as_message()
+        malformed.key_sums[0] = '\x01' + '\xff' * 32
+        for sketch in [malformed, ExchangeSketch.from_keys([], 24).as_message()]:
+            agent.request_cache.new('partner', RequestState.PROTECT_INIT, [])
+            handler(agent, 'partner', sketch)
+
+            message = agent.com.send.call_args[0][1].message
+            self.assertEqual(message.type, msg.PROTECT_SKETCH_REPLY)
+            self.assertFalse(message.ex_sketch_reply.decoded)
+            self.assertEqual(agent.request_cache.get('partner').state, RequestState.PROTECT_INDEX)
+            agent.request_cache.remove('partner')
+
+    def test7(self):
+        "starts a Merkle dispute for an exchange block of the received chain"
+        agent = ProtectSimpleAgent()
+        agent.database = Database(u':memory:', 'test')
+        agent.com = mock.Mock()
+        public_key = generate_key()
+        blocks = [generate_block(public_key, sequence_number, {'up': 10})
+                  for sequence_number in range(1, 5)]
+        agent.database.add_blocks(blocks)
+        other_blocks = blocks[:2] + [generate_block(public_key, 3, {'up': 20})] + blocks[3:]
+        exchange_block = generate_block(generate_key(), 1, {
+            'transfer_up': '', 'transfer_down': MerkleTree.of(other_blocks).root().encode('hex'),
+            'chain_up': 1, 'chain_down': 1, 'hash_version': msg.MERKLE_HASH})
+
+        agent.request_cache.new('partner', RequestState.PROTECT_INIT, [exchange_block])
+        request = agent.request_cache.get('partner')
+        request.exchanges = ExchangeStorage(
+            {exchange_block.hash: BlockIndex([(public_key, [1, 2, 3, 4])])})
+        agent.request_exchange('partner', exchange_block.hash)
+
+        self.assertIsNotNone(request.merkle_dispute)
+        message = agent.com.send.call_args[0][1].message
+        self.assertEqual(message.type, msg.PROTECT_EXCHANGE_REQUEST)
+        self.assertEqual(list(message.ex_hash.nodes), [4, 5, 6, 7])
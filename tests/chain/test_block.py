@@ -1,7 +1,8 @@
 import unittest
+from hashlib import sha256
 
-from src.chain.block import Block
-from tests.helpers import generate_key
+from src.chain.block import Block, TRANSACTION, EXCHANGE, SINGLE_EXCHANGE
+from tests.helpers import generate_key, MockObject
 
 
 class TestBlock(unittest.TestCase):
@@ -21,3 +22,72 @@ class TestBlock(unittest.TestCase):
         block2 = Block.from_message(block_msg)
 
         self.assertEqual(block, block2)
+
+    def test3(self):
+        "extends the chain known to the database"
+        head = MockObject()
+        head.sequence_number = 4
+        head.hash = 'head'
+        database = MockObject()
+        database.get_chain_metadata = lambda public_key: head
+        block = Block.create({'up': 10}, database, generate_key())
+
+        self.assertEqual(block.sequence_number, 5)
+        self.assertEqual(block.previous_hash, 'head')
+
+    def test4(self):
+        "reuses its message until a field changes"
+        block = Block()
+        block.transaction = {'up': 10}
+        block_msg = block.as_message()
+        self.assertIs(block.as_message(), block_msg)
+
+        received = Block.from_message(block_msg)
+        self.assertIn('_payload', received.__dict__)
+        self.assertIs(received.as_message(), block_msg)
+        self.assertEqual(received.transaction, {'up': 10})
+
+        received.sequence_number = 2
+        self.assertIsNot(received.as_message(), block_msg)
+        self.assertEqual(received.as_message().sequence_number, 2)
+
+    def test5(self):
+        "reads the kind of a received block without decoding the payload"
+        block = Block()
+        block.transaction = {'transfer_down': '11' * 32, 'transfer_up': '00' * 32,
+                             'chain_up': 3, 'chain_down': 4}
+        block.link_sequence_number = 1
+
+        received = Block.from_message(block.as_message())
+
+        self.assertTrue(received.is_double_exchange())
+        self.assertEqual(received.get_relevant_exchange(), '00' * 32)
+        self.assertEqual(received.get_relevant_chain_length(), 3)
+        self.assertIn('_payload', received.__dict__)
+        self.assertEqual(received, block)
+
+    def test6(self):
+        "keeps its hash until a field changes"
+        block = Block()
+        block_hash = block.hash
+        self.assertIs(block.hash, block_hash)
+
+        block.sequence_number = 2
+        self.assertNotEqual(block.hash, block_hash)
+        self.assertEqual(block.hash, sha256(block.pack()).digest())
+
+        block_hash = block.hash
+        block.signature = '1' * 64
+        self.assertNotEqual(block.hash, block_hash)
+
+    def test7(self):
+        "classifies its kind once until the payload changes"
+        block = Block()
+        block.transaction = {'up': 1, 'down': 2}
+        self.assertEqual(block.kind, TRANSACTION)
+        self.assertEqual(block.__dict__['_kind'], TRANSACTION)
+
+        block.transaction = {'transfer_down': 'ab'}
+        self.assertEqual(block.kind, EXCHANGE | SINGLE_EXCHANGE)
+        self.assertTrue(block.is_single_exchange())
+        self.assertFalse(block.is_transaction())
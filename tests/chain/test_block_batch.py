@@ -0,0 +1,51 @@
+import unittest
+
+from src.chain.block import Block
+from src.chain.block_batch import BlockBatch, TRANSACTION, EXCHANGE, DOUBLE_EXCHANGE
+from src.chain.index import BlockIndex
+from tests.helpers import generate_key
+
+
+def generate_chain(public_key, link_public_key, transactions):
+    chain = []
+    for sequence_number, transaction in enumerate(transactions, 1):
+        block = Block()
+        block.public_key = public_key
+        block.link_public_key = link_public_key
+        block.sequence_number = sequence_number
+        block.transaction = transaction
+        chain.append(block)
+    return chain
+
+
+class TestBlockBatch(unittest.TestCase):
+
+    def test1(self):
+        "stores the fields of the blocks in columns"
+        public_key, link_public_key = generate_key(), generate_key()
+        chain = generate_chain(public_key, link_public_key, [
+            {'transfer_up': '', 'transfer_down': '00' * 32, 'chain_up': 1, 'chain_down': 1},
+            {'up': 10, 'down': 10},
+            {}])
+
+        batch = BlockBatch(chain)
+
+        self.assertEqual(list(batch.sequence_numbers), [1, 2, 3])
+        self.assertEqual(batch.keys, [public_key, link_public_key])
+        self.assertEqual(list(batch.link_key_ids), [1, 1, 1])
+        self.assertEqual(list(batch.kinds), [EXCHANGE | DOUBLE_EXCHANGE, TRANSACTION, 0])
+        self.assertEqual(batch.positions(TRANSACTION), [1])
+        self.assertIs(batch[0], chain[0])
+        self.assertIs(BlockBatch.of(batch), batch)
+
+    def test2(self):
+        "checks the sequence and builds the index of the blocks"
+        public_key = generate_key()
+        chain = generate_chain(public_key, generate_key(), [{}] * 4)
+        batch = BlockBatch([chain[1], chain[0], chain[2]])
+
+        self.assertTrue(batch.is_complete(3))
+        self.assertTrue(batch.is_complete(2))
+        self.assertFalse(batch.is_complete(4))
+        self.assertFalse(BlockBatch(chain[:2] + chain[3:]).is_complete(3))
+        self.assertEqual(BlockIndex.from_blocks(batch).get(public_key), [1, 2, 3])
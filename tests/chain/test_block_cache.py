@@ -0,0 +1,38 @@
+import unittest
+
+from src.chain.block_cache import BlockCache
+from tests.helpers import MockBlockGenerator
+
+
+class TestBlockCache(unittest.TestCase):
+
+    def test1(self):
+        "evicts the least recently used block"
+        generator = MockBlockGenerator()
+        blocks = [generator.generate_simple() for _ in range(3)]
+        cache = BlockCache(2)
+
+        cache.put(blocks[0], 'hash1')
+        cache.put(blocks[1], 'hash2')
+        self.assertIs(cache.get(generator.public_key, 1), blocks[0])
+        cache.put(blocks[2], 'hash3')
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(generator.public_key, 2))
+        self.assertIsNone(cache.get_by_hash('hash2'))
+        self.assertIs(cache.get_by_hash('hash1'), blocks[0])
+        self.assertIs(cache.get(generator.public_key, 3), blocks[2])
+        self.assertEqual((cache.hits, cache.misses), (3, 2))
+
+    def test2(self):
+        "can discard a range of blocks"
+        generator = MockBlockGenerator()
+        cache = BlockCache()
+        for i in range(5):
+            cache.put(generator.generate_simple(), 'hash%d' % i)
+
+        cache.discard(generator.public_key, 2, 3)
+        cache.discard(generator.public_key, 5, 100000)
+
+        self.assertEqual(sorted(seq for _, seq in cache.blocks), [1, 4])
+        self.assertEqual(sorted(cache.hashes), ['hash0', 'hash3'])
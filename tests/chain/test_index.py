@@ -157,4 +157,72 @@ class TestBlockIndex(unittest.TestCase):
         self.assertEqual(index_a, range(1, 3))
         index_c = dict(add1.entries).get(key_c)
         self.assertNotEqual(index_c, None)
-        self.assertEqual(index_c, range(12, 13))
\ No newline at end of file
+        self.assertEqual(index_c, range(12, 13))
+    def test9(self):
+        "stores contiguous sequence numbers as ranges"
+        key_a = generate_key()
+        key_b = generate_key()
+
+        index = BlockIndex([(key_a, [4, 1, 2, 3, 7, 9, 8]), (key_b, [12, 12])])
+
+        self.assertEqual(index.get_ranges(key_a), [(1, 4), (7, 9)])
+        self.assertEqual(index.get_ranges(key_b), [(12, 12)])
+        self.assertEqual(index.get(key_a), [1, 2, 3, 4, 7, 8, 9])
+        self.assertEqual(index.get(generate_key()), [])
+
+    def test10(self):
+        "can subtract indices with gaps in the ranges"
+        key_a = generate_key()
+
+        index = BlockIndex([(key_a, range(1, 21))])
+        partner_index = BlockIndex([(key_a, [1, 2, 5, 6, 7, 20, 25])])
+
+        sub1 = index - partner_index
+        self.assertEqual(sub1.get_ranges(key_a), [(3, 4), (8, 19)])
+        self.assertEqual(len(partner_index - index), 1)
+        self.assertEqual((partner_index - index).get(key_a), [25])
+        self.assertEqual(len(index - index), 0)
+
+    def test11(self):
+        "merges touching and overlapping ranges on addition"
+        key_a = generate_key()
+
+        index = BlockIndex([(key_a, [1, 2, 3, 10, 11])])
+        partner_index = BlockIndex([(key_a, [4, 5, 9, 15])])
+
+        add1 = index + partner_index
+        self.assertEqual(add1.get_ranges(key_a), [(1, 5), (9, 11), (15, 15)])
+        self.assertEqual(add1.to_database_args(), [(key_a, seq) for seq in [1, 2, 3, 4, 5, 9, 10,
+                                                                            11, 15]])
+
+    def test12(self):
+        "can create and read a range encoded index message"
+        key_a = generate_key()
+        key_b = generate_key()
+        index = BlockIndex([(key_a, range(1, 10001)), (key_b, [3, 4, 5, 9])])
+
+        message = index.as_message(msg.RANGES)
+        plain_message = index.as_message()
+
+        self.assertEqual(list(message.entries[0].ranges), [1, 9999])
+        self.assertEqual(list(message.entries[1].ranges), [3, 2, 3, 0])
+        self.assertLess(message.ByteSize(), plain_message.ByteSize() / 100)
+        self.assertEqual(BlockIndex.from_message(message).ranges, index.ranges)
+        self.assertEqual(BlockIndex.from_message(plain_message).ranges, index.ranges)
+
+    def test13(self):
+        "can combine and subtract many indices at once"
+        key_a = generate_key()
+        key_b = generate_key()
+
+        indexes = [BlockIndex([(key_a, [1, 2])]), BlockIndex([(key_a, [5, 6]), (key_b, [1])]),
+                   BlockIndex([(key_a, [3, 4, 9])]), BlockIndex()]
+
+        union = BlockIndex.union_all(indexes)
+        self.assertEqual(union.get_ranges(key_a), [(1, 6), (9, 9)])
+        self.assertEqual(union.get_ranges(key_b), [(1, 1)])
+
+        index = BlockIndex([(key_a, range(1, 11)), (key_b, [1, 2])])
+        difference = index.difference_all(indexes)
+        self.assertEqual(difference.get_ranges(key_a), [(7, 8), (10, 10)])
+        self.assertEqual(difference.get_ranges(key_b), [(2, 2)])
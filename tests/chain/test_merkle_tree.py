@@ -0,0 +1,58 @@
+import unittest
+
+from src.chain.merkle_tree import MerkleTree, MerkleDispute
+from tests.helpers import generate_block, generate_key
+
+
+def resolve(dispute, other):
+    rounds = 0
+    while not dispute.is_resolved():
+        nodes = dispute.requested_nodes()
+        if not dispute.receive(nodes, [other.nodes[node] for node in nodes]):
+            return None
+        rounds += 1
+    return rounds
+
+
+class TestMerkleTree(unittest.TestCase):
+
+    def test1(self):
+        "orders the leaves by public key and sequence number"
+        public_key = generate_key()
+        blocks = [generate_block(public_key, seq, {'up': 10}) for seq in range(1, 6)]
+
+        tree = MerkleTree.of(list(reversed(blocks)))
+
+        self.assertEqual(tree.blocks, blocks)
+        self.assertEqual(tree.width, 8)
+        self.assertEqual(tree.root(), MerkleTree.of(blocks).root())
+        self.assertEqual(MerkleTree.of([]).root(), '')
+
+    def test2(self):
+        "locates the differing leaves of two trees"
+        public_key = generate_key()
+        blocks = [generate_block(public_key, seq, {'up': 10}) for seq in range(1, 41)]
+        other_blocks = list(blocks)
+        other_blocks[7] = generate_block(public_key, 8, {'up': 20})
+        other_blocks[30] = generate_block(public_key, 31, {'up': 20})
+        other = MerkleTree.of(other_blocks)
+
+        dispute = MerkleDispute(MerkleTree.of(blocks), other.root())
+
+        self.assertEqual(resolve(dispute, other), 2)
+        self.assertEqual(dispute.differing_positions(), [7, 30])
+        self.assertTrue(dispute.is_differing_block(other_blocks[7]))
+        self.assertFalse(dispute.is_differing_block(blocks[7]))
+
+    def test3(self):
+        "rejects hashes that do not fold into the trusted root"
+        public_key = generate_key()
+        blocks = [generate_block(public_key, seq, {'up': 10}) for seq in range(1, 41)]
+        other_blocks = list(blocks)
+        other_blocks[7] = generate_block(public_key, 8, {'up': 20})
+        forged_blocks = list(blocks)
+        forged_blocks[12] = generate_block(public_key, 13, {'up': 20})
+
+        dispute = MerkleDispute(MerkleTree.of(blocks), MerkleTree.of(other_blocks).root())
+
+        self.assertIsNone(resolve(dispute, MerkleTree.of(forged_blocks)))
@@ -0,0 +1,35 @@
+import unittest
+import pickle
+from hashlib import sha256
+
+from src.chain.payload import encode_payload, decode_payload, TYPED_PAYLOAD
+
+
+class TestPayload(unittest.TestCase):
+
+    def test1(self):
+        "encodes exchange payloads compactly and restores them exactly"
+        transaction = {'transfer_up': sha256('up').hexdigest(),
+                       'transfer_down': '',
+                       'chain_up': 5,
+                       'chain_down': 7}
+
+        data = encode_payload(transaction)
+
+        self.assertTrue(data.startswith(TYPED_PAYLOAD))
+        self.assertLess(len(data), len(pickle.dumps(transaction)) // 2)
+        self.assertEqual(data, encode_payload(dict(reversed(list(transaction.items())))))
+        decoded = decode_payload(data)
+        self.assertEqual(decoded, transaction)
+        self.assertEqual([type(decoded[key]) for key in sorted(decoded)],
+                         [int, int, str, str])
+
+    def test2(self):
+        "falls back to pickle for other payloads and reads old payloads"
+        for transaction in [{'up': 10L}, {'transfer_down': 'ABC'}, {'other': 1}]:
+            data = encode_payload(transaction)
+            self.assertFalse(data.startswith(TYPED_PAYLOAD))
+            self.assertEqual(decode_payload(data), transaction)
+
+        self.assertEqual(decode_payload(pickle.dumps({'up': 10, 'down': 10})),
+                         {'up': 10, 'down': 10})
@@ -0,0 +1,26 @@
+import unittest
+
+from src.chain.replacement_overlay import ReplacementOverlay
+from tests.helpers import generate_block, generate_key
+
+
+class TestReplacementOverlay(unittest.TestCase):
+
+    def test1(self):
+        "replaces only the block with the matching hash"
+        public_key = generate_key()
+        original = generate_block(public_key, 2, {'up': 10})
+        double_spend = generate_block(public_key, 2, {'up': 20})
+        overlay = ReplacementOverlay([(original, double_spend)])
+
+        self.assertIs(overlay.replace(public_key, 2, original.hash), double_spend)
+        self.assertIsNone(overlay.replace(public_key, 2, double_spend.hash))
+        self.assertIsNone(overlay.replace(public_key, 3, original.hash))
+
+    def test2(self):
+        "applies the rules in order"
+        public_key = generate_key()
+        blocks = [generate_block(public_key, 1, {'up': up}) for up in range(3)]
+        overlay = ReplacementOverlay([(blocks[0], blocks[1]), (blocks[1], blocks[2])])
+
+        self.assertIs(overlay.replace(public_key, 1, blocks[0].hash), blocks[2])
@@ -0,0 +1,48 @@
+import unittest
+
+import src.communication.messages_pb2 as msg
+from src.chain.transfer_hash import MultisetHash, blocks_to_hash
+from tests.helpers import generate_block, generate_key
+
+
+class TestTransferHash(unittest.TestCase):
+
+    def test1(self):
+        "hashes sets independent of their order"
+        public_key = generate_key()
+        blocks = [generate_block(public_key, seq, {'up': 10}) for seq in range(1, 5)]
+
+        for version in (msg.SORTED_HASH, msg.MULTISET_HASH, msg.MERKLE_HASH):
+            self.assertEqual(blocks_to_hash(blocks, version),
+                             blocks_to_hash(list(reversed(blocks)), version))
+            self.assertEqual(len(blocks_to_hash(blocks, version)), 32)
+            self.assertEqual(blocks_to_hash([], version), '')
+        self.assertNotEqual(blocks_to_hash(blocks, msg.SORTED_HASH),
+                            blocks_to_hash(blocks, msg.MULTISET_HASH))
+
+    def test2(self):
+        "adds and removes single blocks"
+        public_key = generate_key()
+        blocks = [generate_block(public_key, seq, {'up': 10}) for seq in range(1, 5)]
+        multiset_hash = MultisetHash.of(blocks[:3])
+
+        multiset_hash.add(blocks[3].hash)
+        self.assertEqual(multiset_hash.digest(), blocks_to_hash(blocks, msg.MULTISET_HASH))
+        multiset_hash.remove(blocks[0].hash)
+        self.assertEqual(multiset_hash.digest(), blocks_to_hash(blocks[1:], msg.MULTISET_HASH))
+        multiset_hash.remove(blocks[1].hash)
+        multiset_hash.add(blocks[1].hash)
+        self.assertEqual(multiset_hash.digest(), blocks_to_hash(blocks[1:], msg.MULTISET_HASH))
+
+    def test3(self):
+        "swaps a block without changing the original set"
+        public_key = generate_key()
+        blocks = [generate_block(public_key, seq, {'up': 10}) for seq in range(1, 4)]
+        double_spend = generate_block(public_key, 2, {'up': 20})
+        multiset_hash = MultisetHash.of(blocks)
+
+        replaced = multiset_hash.replace(blocks[1].hash, double_spend.hash)
+
+        self.assertEqual(replaced.digest(), blocks_to_hash([blocks[0], double_spend, blocks[2]],
+                                                           msg.MULTISET_HASH))
+        self.assertEqual(multiset_hash.digest(), blocks_to_hash(blocks, msg.MULTISET_HASH))
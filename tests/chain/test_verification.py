@@ -0,0 +1,91 @@
+import unittest
+
+from tornado import ioloop
+
+from src.pyipv8.ipv8.keyvault.crypto import ECCrypto
+from src.chain.block import Block
+from src.chain.verification import ChainVerifier, links_are_valid
+
+
+def generate_chain(length):
+    crypto = ECCrypto()
+    key = crypto.generate_key('curve25519')
+    chain = []
+    for sequence_number in range(1, length + 1):
+        block = Block()
+        block.public_key = key.pub().key_to_bin()
+        block.sequence_number = sequence_number
+        block.transaction = {'up': sequence_number}
+        if chain:
+            block.previous_hash = chain[-1].hash
+        block.signature = crypto.create_signature(key, block.pack(signature=False))
+        chain.append(block)
+    return chain
+
+
+class TestChainVerifier(unittest.TestCase):
+
+    def verify(self, verifier, chain, blocks=[]):
+        results = []
+        verifier.verify(chain, blocks, results.append)
+        self.assertEqual(len(results), 1)
+        return results[0]
+
+    def test1(self):
+        "accepts signed and linked chains and caches the verified blocks"
+        verifier = ChainVerifier()
+        chain = generate_chain(3)
+        blocks = generate_chain(2)
+
+        self.assertTrue(self.verify(verifier, chain, blocks))
+        self.assertEqual(len(verifier.verified), 5)
+        self.assertTrue(self.verify(verifier, chain[1:]))
+        self.assertEqual(len(verifier.verified), 5)
+
+    def test2(self):
+        "rejects invalid signatures and broken hash links"
+        verifier = ChainVerifier()
+        chain = generate_chain(3)
+        self.assertTrue(self.verify(verifier, [chain[0], chain[2]]))
+
+        chain[1].signature = chain[0].signature
+        self.assertFalse(self.verify(verifier, [], [chain[1]]))
+        self.assertFalse(self.verify(verifier, chain))
+
+        other = generate_chain(2)
+        chain = generate_chain(2)
+        self.assertFalse(links_are_valid([chain[0], other[1]]))
+        self.assertFalse(self.verify(verifier, [chain[0], other[1]]))
+
+    def test3(self):
+        "reports the result of the workers on the IOLoop"
+        loop = ioloop.IOLoop()
+        loop.make_current()
+        verifier = ChainVerifier(2)
+        results = []
+
+        def done(valid):
+            results.append(valid)
+            loop.stop()
+
+        verifier.verify(generate_chain(3), generate_chain(400), done)
+        loop.start()
+        loop.clear_current()
+        loop.close()
+
+        self.assertEqual(results, [True])
+
+    def test4(self):
+        "keeps only the most recently used outcomes"
+        verifier = ChainVerifier(cache_size=3)
+        chain = generate_chain(4)
+
+        self.assertTrue(self.verify(verifier, chain))
+        self.assertEqual(verifier.verified.keys(), [block.hash for block in chain[1:]])
+        self.assertTrue(self.verify(verifier, chain[1:2]))
+        self.assertTrue(self.verify(verifier, chain[:1]))
+        self.assertEqual(verifier.verified.keys(), [chain[i].hash for i in [3, 1, 0]])
+
+        verifier = ChainVerifier(cache_size=0)
+        self.assertTrue(self.verify(verifier, chain))
+        self.assertEqual(len(verifier.verified), 0)
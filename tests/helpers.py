@@ -16,6 +16,14 @@ def generate_key():
     return sk.pub().key_to_bin()
 
 
+def generate_block(public_key, sequence_number, transaction):
+    block = Block()
+    block.public_key = public_key
+    block.sequence_number = sequence_number
+    block.transaction = transaction
+    return block
+
+
 class MockObject(object):
     pass
 
@@ -54,7 +62,10 @@ class MockBlockGenerator(object):
             buffer(GENESIS_HASH)
         )
         block = MockObject()
+        block.public_key = self.public_key
+        block.sequence_number = len(self.generated)+1
         block.pack_db_insert = lambda: data
+        block.kind = 0
 
         self.generated.append(block)
         return block
@@ -1,14 +1,22 @@
 import unittest
 import os
+import shutil
+import sqlite3
 
 from src.database import Database
-from tests.helpers import MockBlockGenerator, MockObject
+from src.chain.index import BlockIndex
+from src.chain.block_cache import BlockCache, DEFAULT_CACHE_SIZE
+from src.chain.block import TRANSACTION, EXCHANGE, SINGLE_EXCHANGE
+from src.public_key import PublicKey
+from tests.helpers import MockBlockGenerator, MockObject, generate_block, generate_key
 
 
 class TestDatabase(unittest.TestCase):
 
+    database_cls = Database
+
     def setUp(self):
-        self.database = Database('tests', 'test')
+        self.database = self.database_cls('tests', 'test')
 
     def tearDown(self):
         self.database.close()
@@ -19,6 +27,8 @@ class TestDatabase(unittest.TestCase):
             try:
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
+                elif os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
             except Exception as e:
                 print(e)
 
@@ -26,7 +36,7 @@ class TestDatabase(unittest.TestCase):
         "can obtain the chain only"
         generator = MockBlockGenerator()
         generator_b = MockBlockGenerator()
-        self.database = Database('', 'test')
+        self.database = self.database_cls('', 'test')
         self.database.add_block(generator.generate_db())
         self.database.add_block(generator.generate_db())
         self.database.add_block(generator_b.generate_db())
@@ -42,7 +52,7 @@ class TestDatabase(unittest.TestCase):
         "can obtain block by index"
         generator = MockBlockGenerator()
         generator_b = MockBlockGenerator()
-        self.database = Database('', 'test')
+        self.database = self.database_cls('', 'test')
         block_a = generator.generate_db()
         self.database.add_block(block_a)
         self.database.add_block(generator.generate_db())
@@ -50,12 +60,267 @@ class TestDatabase(unittest.TestCase):
         block_b = generator_b.generate_db()
         self.database.add_block(block_b)
 
-        index = MockObject()
-        index.to_database_args = lambda: [(generator.public_key, 1), (generator_b.public_key, 2)]
+        index = BlockIndex([(generator.public_key, [1]), (generator_b.public_key, [2])])
         blocks = self.database.index(index)
 
         self.assertEqual(len(blocks), 2)
-        self.assertTrue(blocks[0].public_key == generator.public_key)
-        self.assertEqual(blocks[0].sequence_number, 1)
-        self.assertTrue(blocks[1].public_key == generator_b.public_key)
-        self.assertEqual(blocks[1].sequence_number, 2)
+        self.assertEqual([(str(block.public_key), block.sequence_number) for block in blocks],
+                         sorted([(generator.public_key, 1), (generator_b.public_key, 2)]))
+
+    def test3(self):
+        "keeps the block index up to date"
+        generator = MockBlockGenerator()
+        generator_b = MockBlockGenerator()
+        self.database = self.database_cls('', 'test')
+        self.database.add_block(generator.generate_db())
+        self.database.add_block(generator.generate_db())
+        self.database.add_block(generator.generate_db())
+        self.database.add_block(generator_b.generate_db())
+
+        snapshot = self.database.get_block_index()
+        self.assertEqual(snapshot.get(generator.public_key), [1, 2, 3])
+        self.assertEqual(snapshot.get(generator_b.public_key), [1])
+
+        pk = MockObject()
+        pk.as_buffer = lambda: buffer(generator.public_key)
+        pk.as_bin = lambda: generator.public_key
+        self.database.delete(pk, 2, 2)
+        self.database.add_block(generator_b.generate_db())
+
+        index = self.database.get_block_index()
+        self.assertEqual(index.get(generator.public_key), [1])
+        self.assertEqual(index.get(generator_b.public_key), [1, 2])
+        self.assertEqual(snapshot.get(generator.public_key), [1, 2, 3])
+        self.assertEqual(snapshot.get(generator_b.public_key), [1])
+
+    def test4(self):
+        "can obtain blocks by index beyond the SQLite parameter limit"
+        generators = [MockBlockGenerator() for _ in range(3)]
+        self.database = self.database_cls('', 'test')
+        for generator in generators:
+            for _ in range(800):
+                self.database.add_block(generator.generate_db())
+
+        ranges = BlockIndex([(generators[0].public_key, range(1, 801)),
+                             (generators[1].public_key, range(2, 800, 2))])
+        blocks = self.database.index(ranges)
+        self.assertEqual(len(blocks), 800 + 399)
+
+        scattered = BlockIndex([(generator.public_key, range(1, 800, 3)) for generator in generators])
+        blocks = self.database.index(scattered)
+        self.assertEqual(len(blocks), 3 * 267)
+
+        for blocks in [self.database.index(ranges), self.database.index(scattered)]:
+            keys = [(str(block.public_key), block.sequence_number) for block in blocks]
+            self.assertEqual(keys, sorted(keys))
+
+    def test5(self):
+        "can add blocks in bulk and report all conflicts"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+
+        def make_block(sequence_number, up):
+            return generate_block(generator.public_key, sequence_number, {'up': up})
+
+        self.assertEqual(self.database.add_blocks([make_block(1, 10), make_block(2, 10)]), [])
+
+        incoming = [make_block(1, 10), make_block(2, 20), make_block(3, 10), make_block(4, 10),
+                    make_block(4, 30)]
+        conflicts = self.database.add_blocks(incoming)
+
+        self.assertEqual([(existing.sequence_number, existing.transaction['up'], block)
+                          for existing, block in conflicts],
+                         [(2, 10, incoming[1]), (4, 10, incoming[4])])
+        self.assertEqual(self.database.get_block_index().get(generator.public_key), [1, 2, 3, 4])
+        self.assertEqual(self.database.get(generator.public_key, 2).transaction, {'up': 10})
+
+    def test6(self):
+        "can find conflicting blocks with a single lookup"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        blocks = [generate_block(generator.public_key, sequence_number, {'up': 10})
+                  for sequence_number in range(1, 4)]
+        self.database.add_blocks(blocks)
+
+        triples = [(block.public_key, block.sequence_number, block.hash) for block in blocks]
+        self.assertEqual(self.database.get_conflicting_blocks(triples), [])
+
+        triples[1] = (generator.public_key, 2, '0' * 32)
+        triples.append((generator.public_key, 4, '0' * 32))
+        conflicts = self.database.get_conflicting_blocks(triples)
+        self.assertEqual([block.sequence_number for block in conflicts], [2])
+        self.assertEqual(conflicts[0].hash, blocks[1].hash)
+
+    def test7(self):
+        "reuses cached blocks until they are deleted"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        block = generate_block(generator.public_key, 1, {'up': 10})
+        self.database.add_block(block)
+
+        cached = self.database.get(generator.public_key, 1)
+        self.assertIs(self.database.get_chain(PublicKey.from_bin(generator.public_key))[0], cached)
+        self.assertIs(self.database.get_block_with_hash(block.hash), cached)
+        self.assertEqual(self.database.block_cache.hits, 2)
+
+        self.database.delete(PublicKey.from_bin(generator.public_key), 1)
+        self.assertIsNone(self.database.get(generator.public_key, 1))
+        self.assertEqual(len(self.database.block_cache), 0)
+
+    def test8(self):
+        "can write an in-memory database to disk"
+        self.database = self.database_cls(u':memory:', 'test')
+        generator = MockBlockGenerator()
+        self.database.add_block(generator.generate_db())
+        self.database.add_block(generator.generate_db())
+        self.assertFalse(os.path.isfile(self.database.snapshot_path))
+
+        self.database.snapshot()
+
+        snapshot = sqlite3.connect(self.database.snapshot_path)
+        self.assertEqual(snapshot.execute('SELECT COUNT(*) FROM blocks').fetchone()[0], 2)
+        snapshot.close()
+
+    def test9(self):
+        "can obtain a part of the chain"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        for _ in range(6):
+            self.database.add_block(generator.generate_db())
+        key = PublicKey.from_bin(generator.public_key)
+        self.database.delete(key, 3)
+
+        self.assertEqual([block.sequence_number for block in
+                          self.database.get_chain_since(key, 1)], [2, 4, 5, 6])
+        self.assertEqual([block.sequence_number for block in
+                          self.database.get_chain_range(key, 2, 4)], [2, 4])
+        self.assertEqual(next(self.database.iter_chain(key, 5)).sequence_number, 5)
+        self.assertEqual(self.database.get_chain_since(key, 6), [])
+
+    def test10(self):
+        "can resolve blocks by their hash"
+        self.database = self.database_cls('', 'test', block_cache_size=0)
+        generator = MockBlockGenerator()
+        blocks = [generate_block(generator.public_key, sequence_number, {'up': sequence_number})
+                  for sequence_number in range(1, 4)]
+        self.database.add_blocks(blocks[:2])
+
+        self.assertEqual(self.database.get_by_hash(blocks[1].hash).sequence_number, 2)
+        self.assertIsNone(self.database.get_by_hash(blocks[2].hash))
+        found = self.database.get_many_by_hash([block.hash for block in blocks])
+        self.assertEqual(sorted(found.keys()), sorted([blocks[0].hash, blocks[1].hash]))
+        self.assertEqual(found[blocks[0].hash].sequence_number, 1)
+
+    def test12(self):
+        "keeps the metadata of every chain up to date"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        blocks = [generate_block(generator.public_key, sequence_number, {'up': sequence_number})
+                  for sequence_number in range(1, 6)]
+        self.database.add_blocks(blocks[:2] + blocks[3:])
+
+        metadata = self.database.get_chain_metadata(generator.public_key)
+        self.assertEqual(metadata, (5, blocks[4].hash, 4, 1))
+
+        self.database.delete(PublicKey.from_bin(generator.public_key), 5)
+        self.assertEqual(self.database.get_chain_metadata(generator.public_key),
+                         (4, blocks[3].hash, 3, 1))
+        self.assertEqual(self.database.get_latest(generator.public_key).sequence_number, 4)
+
+        self.database.add_block(blocks[2])
+        self.database.close()
+        self.database = self.database_cls('', 'test')
+        self.assertEqual(self.database.get_chain_metadata(generator.public_key),
+                         (4, blocks[3].hash, 4, 0))
+        self.assertEqual(self.database.get_chain_length(generator.public_key), 4)
+        self.assertIsNone(self.database.get_chain_metadata(generate_key()))
+
+    def test13(self):
+        "applies replacements while reading an index"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        blocks = [generate_block(generator.public_key, sequence_number, {'up': sequence_number})
+                  for sequence_number in range(1, 4)]
+        self.database.add_blocks(blocks)
+        double_spend = generate_block(generator.public_key, 2, {'up': 20})
+
+        replaced = self.database.index_with_replacements(
+            BlockIndex([(generator.public_key, [1, 2, 3])]), [(blocks[1], double_spend)])
+
+        self.assertEqual([block.hash for block in replaced],
+                         [blocks[0].hash, double_spend.hash, blocks[2].hash])
+
+    def test14(self):
+        "can filter the chain by the kind of the blocks"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        transactions = [{'up': 1, 'down': 2}, {'transfer_up': '', 'transfer_down': 'ab'},
+                        {'up': 3, 'down': 4}]
+        blocks = [generate_block(generator.public_key, sequence_number, transaction)
+                  for sequence_number, transaction in enumerate(transactions, 1)]
+        self.database.add_blocks(blocks)
+        self.database.close()
+
+        self.database = self.database_cls('', 'test')
+        key = PublicKey.from_bin(generator.public_key)
+        self.assertEqual([block.sequence_number for block in
+                          self.database.get_chain(key, kind=TRANSACTION)], [1, 3])
+        self.assertEqual([block.sequence_number for block in
+                          self.database.get_chain(key, kind=EXCHANGE | SINGLE_EXCHANGE)], [2])
+        self.assertEqual(len(self.database.get_chain(key)), 3)
+
+    def test15(self):
+        "writes all chains of an in-memory database to disk"
+        self.database = self.database_cls(u':memory:', 'test')
+        generators = [MockBlockGenerator() for _ in range(3)]
+        for generator in generators:
+            for _ in range(4):
+                self.database.add_block(generator.generate_db())
+
+        self.database.snapshot()
+
+        snapshot = sqlite3.connect(self.database.snapshot_path)
+        self.assertEqual(snapshot.execute('SELECT COUNT(*) FROM blocks').fetchone()[0], 12)
+        self.assertEqual(snapshot.execute('SELECT COUNT(*) FROM chain_metadata').fetchone()[0], 3)
+        snapshot.close()
+
+    def test16(self):
+        "does not read stored blocks that match the added blocks"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        blocks = [generate_block(generator.public_key, sequence_number, {'up': sequence_number})
+                  for sequence_number in range(1, 4)]
+        self.database.add_blocks(blocks)
+        self.database.block_cache = BlockCache(DEFAULT_CACHE_SIZE)
+
+        self.assertEqual(self.database.add_blocks(blocks), [])
+        self.assertEqual(len(self.database.block_cache), 0)
+
+    def test17(self):
+        "counts the stored blocks of a chain up to a sequence number"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        blocks = [generate_block(generator.public_key, sequence_number, {'up': sequence_number})
+                  for sequence_number in range(1, 8)]
+        self.database.add_blocks(blocks[:2] + blocks[3:5] + blocks[6:])
+
+        self.assertEqual([self.database.count_stored(generator.public_key, up_to)
+                          for up_to in range(0, 9)], [0, 1, 2, 2, 3, 4, 4, 5, 5])
+        self.assertEqual(self.database.count_stored(generate_key(), 7), 0)
+
+    def test19(self):
+        "streams the rows of scattered runs"
+        self.database = self.database_cls('', 'test')
+        generator = MockBlockGenerator()
+        self.database.add_blocks([generate_block(generator.public_key, sequence_number, {'up': 10})
+                                  for sequence_number in range(1, 1201)])
+        runs = [(generator.public_key, seq, seq) for seq in range(1, 1201, 3)]
+
+        rows = self.database._iter_runs(runs)
+        self.assertEqual(next(rows)[2], 1)
+        rows.close()
+        if isinstance(self.database, Database):
+            self.assertEqual(
+                list(self.database.execute(u'SELECT COUNT(*) FROM temp.index_query'))[0][0], 0)
+
+        self.assertEqual([row[2] for row in self.database._iter_runs(runs)], range(1, 1201, 3))
@@ -0,0 +1,86 @@
+import os
+import mock
+
+from src.log_database import LogDatabase
+from src.chain.block import Block
+from src.public_key import PublicKey
+from tests import test_database
+from tests.helpers import MockBlockGenerator, generate_block
+
+
+class TestLogDatabase(test_database.TestDatabase):
+
+    database_cls = LogDatabase
+
+    def test8(self):
+        "can write an in-memory database to disk"
+        self.database = LogDatabase(u':memory:', 'test')
+        generator = MockBlockGenerator()
+        self.database.add_block(generator.generate_db())
+        self.database.add_block(generator.generate_db())
+        self.assertFalse(os.path.exists(self.database.snapshot_path))
+
+        self.database.snapshot()
+
+        snapshot = LogDatabase('', 'test')
+        self.assertEqual(snapshot.get_block_index().get(generator.public_key), [1, 2])
+        snapshot.close()
+
+    def test11(self):
+        "replays the segments when reopened"
+        self.database = LogDatabase('', 'test')
+        generator = MockBlockGenerator()
+        blocks = []
+        for sequence_number in range(1, 4):
+            block = Block()
+            block.public_key = generator.public_key
+            block.sequence_number = sequence_number
+            block.transaction = {'up': sequence_number}
+            blocks.append(block)
+        self.database.add_blocks(blocks)
+        self.database.delete(PublicKey.from_bin(generator.public_key), 2)
+        self.database.add_block(blocks[1])
+        self.database.delete(PublicKey.from_bin(generator.public_key), 3)
+        self.database.close()
+
+        self.database = LogDatabase('', 'test')
+        chain = self.database.get_chain(PublicKey.from_bin(generator.public_key))
+        self.assertEqual([block.transaction for block in chain], [{'up': 1}, {'up': 2}])
+        self.assertEqual(self.database.get_block_with_hash(blocks[1].hash).sequence_number, 2)
+        self.assertIsNone(self.database.get_block_with_hash(blocks[2].hash))
+
+    def test15(self):
+        "writes all chains of an in-memory database to disk"
+        self.database = LogDatabase(u':memory:', 'test')
+        generators = [MockBlockGenerator() for _ in range(3)]
+        for generator in generators:
+            for _ in range(4):
+                self.database.add_block(generator.generate_db())
+
+        self.database.snapshot()
+
+        snapshot = LogDatabase('', 'test')
+        for generator in generators:
+            self.assertEqual(snapshot.get_block_index().get(generator.public_key), [1, 2, 3, 4])
+        snapshot.close()
+
+    def test18(self):
+        "keeps only a limited number of segment files open"
+        self.database = LogDatabase('', 'test')
+        generators = [MockBlockGenerator() for _ in range(4)]
+        with mock.patch('src.log_database.OPEN_SEGMENTS', 2):
+            for generator in generators:
+                self.database.add_blocks([generate_block(generator.public_key, 1, {'up': 10}),
+                                          generate_block(generator.public_key, 2, {'up': 20})])
+                self.assertLessEqual(len(self.database.segments), 2)
+
+            for generator in generators:
+                chain = self.database.get_chain(PublicKey.from_bin(generator.public_key))
+                self.assertEqual([block.transaction for block in chain], [{'up': 10}, {'up': 20}])
+            self.assertLessEqual(len(self.database.segments), 2)
+
+            self.database.delete(PublicKey.from_bin(generators[0].public_key), 2)
+            self.database.close()
+            self.database = LogDatabase('', 'test')
+            self.assertEqual(self.database.get_block_index().get(generators[0].public_key), [1])
+            self.assertEqual(self.database.get_block_index().get(generators[3].public_key), [1, 2])